@@ -0,0 +1,55 @@
+""" Build time and memory of a large graph
+
+Builds a graph of `N` nodes (chains of additions reading the outputs of
+previous nodes), then reports the time to build, compile and calculate it,
+and the memory retained by the graph (traced by `tracemalloc`, in a second
+build as tracing slows it down).
+
+    python benchmarks/large_graph.py [N]
+"""
+import os
+import sys
+import time
+import tracemalloc
+import logging
+
+PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PATH)
+
+from pyungo.core import Graph
+
+logging.disable(logging.INFO)
+
+
+def add(a, b):
+    return a + b
+
+
+def build(n):
+    graph = Graph(do_deepcopy=False)
+    for i in range(n):
+        a = "x_{}".format(i - 1) if i else "a"
+        b = "x_{}".format(i // 2 - 1) if i > 1 else "b"
+        graph.add_node(add, inputs=[a, b], outputs=["x_{}".format(i)])
+    return graph
+
+
+def timed(label, fct, *args):
+    start = time.perf_counter()
+    res = fct(*args)
+    print("{:<10} {:>8.2f} s".format(label, time.perf_counter() - start))
+    return res
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    print("{} nodes".format(n))
+    graph = timed("build", build, n)
+    timed("compile", graph._compile)
+    timed("calculate", graph.calculate, {"a": 1, "b": 1})
+    del graph
+    tracemalloc.start()
+    graph = build(n)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print("memory     {:>8.1f} MB ({:.0f} B per node)".format(size / 2 ** 20, size / n))
@@ -0,0 +1,6 @@
+""" run the `pyungo` command with `python -m pyungo` """
+import sys
+
+from .cli import main
+
+sys.exit(main())
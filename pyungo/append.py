@@ -0,0 +1,75 @@
+""" Append mode: process new rows of time series only
+
+Row-wise nodes (and windowed nodes, with a lookback) are run on the rows
+appended since the previous run, plus the last rows they look back at. Their
+outputs are the concatenation of the outputs kept from the previous run and
+of the new rows. Other nodes are run on the whole history.
+"""
+
+from .data import Data
+
+
+def rows(value):
+    """ return the number of rows of a value """
+    return len(value)
+
+
+def take(value, start):
+    """ return the rows of a value from the `start` position """
+    iloc = getattr(value, "iloc", None)
+    if iloc is not None:
+        # pandas, positional
+        return iloc[start:]
+    return value[start:]
+
+
+def concat(head, tail):
+    """ return the rows of two values of the same type, one after the other """
+    module = type(head).__module__.split(".")[0]
+    if module == "pandas":
+        import pandas as pd
+
+        return pd.concat([head, tail])
+    if module == "numpy":
+        import numpy as np
+
+        return np.concatenate([head, tail])
+    return head + type(head)(tail)
+
+
+class AppendedData(Data):
+    """ data of a run processing appended rows
+
+    The inputs (and outputs of the row-wise nodes) hold the whole history:
+    the values kept from the previous run followed by the new rows.
+
+    Args:
+        inputs (dict): input name -> new rows
+        history (dict): name -> value of the previous run, for the inputs
+            and the outputs of the row-wise nodes
+        incremental (dict): id -> lookback of the nodes run on the new rows
+        do_deepcopy (bool): Deep-copy the new rows
+    """
+
+    def __init__(self, inputs, history, incremental, do_deepcopy=True):
+        super().__init__(inputs, do_deepcopy=do_deepcopy)
+        self._history = history
+        self._incremental = incremental
+        self._inputs = {
+            name: concat(history[name], value) if name in history else value
+            for name, value in self._inputs.items()
+        }
+
+    def read(self, node, name):
+        lookback = self._incremental.get(node.id)
+        if lookback is None or name not in self._history:
+            return self[name]
+        start = max(0, rows(self._history[name]) - lookback)
+        return take(self[name], start)
+
+    def save(self, node, name, value):
+        lookback = self._incremental.get(node.id)
+        if lookback is not None:
+            previous = self._history[name]
+            value = concat(previous, take(value, min(lookback, rows(previous))))
+        self[name] = value
@@ -0,0 +1,117 @@
+""" Micro-batching of the calls to a node from concurrent calculations
+
+Nodes declared with a `batch_size` are not run by each calculation on its
+own: the calls from the calculations running at the same time (in several
+threads) are queued, and run together with one call of the function, which
+receives the list of the values of each input and returns the list of the
+results. Each calculation then gets its own result back.
+"""
+
+import collections
+import os
+import threading
+import time
+
+from .providers import inject
+
+
+class _Call:
+    """ call to a batched node, waiting to be run """
+
+    __slots__ = ("values", "callback", "error_callback", "submitted")
+
+    def __init__(self, values, callback, error_callback):
+        self.values = values
+        self.callback = callback
+        self.error_callback = error_callback
+        self.submitted = time.perf_counter()
+
+
+class Batcher:
+    """ queue of the calls to a batched node, run by a thread of its own
+
+    A batch is run as soon as `batch_size` calls are queued, or `batch_wait`
+    seconds after the oldest call was queued. Calls queued while a batch runs
+    make the next batch, so batches grow with the load. When the function
+    fails, every call of the batch fails.
+
+    Args:
+        node (Node): The batched node
+    """
+
+    def __init__(self, node):
+        self._node = node
+        self._cond = threading.Condition()
+        self._pending = collections.deque()
+        self._thread = None
+        self._closed = False
+        self.batches = 0
+        self.calls = 0
+
+    def submit(self, values, callback, error_callback):
+        """ queue a call to the node
+
+        Args:
+            values (dict): input name -> value of the call
+            callback (function): Called with the result and the worker
+                information (see `run_node`) once the batch is run
+            error_callback (function): Called with the error if the batch failed
+        """
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, daemon=True)
+                self._thread.start()
+            self._pending.append(_Call(values, callback, error_callback))
+            self._cond.notify()
+
+    def _next_batch(self):
+        """ wait for the next batch, None once closed """
+        size, wait = self._node.batch_size, self._node.batch_wait
+        with self._cond:
+            while not self._pending and not self._closed:
+                self._cond.wait()
+            if not self._pending:
+                return None
+            deadline = self._pending[0].submitted + wait
+            while len(self._pending) < size and not self._closed:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return [
+                self._pending.popleft() for _ in range(min(size, len(self._pending)))
+            ]
+
+    def _loop(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            self._run(batch)
+
+    def _run(self, batch):
+        start = time.perf_counter()
+        try:
+            results = self._node.run_batch([inject(c.values) for c in batch])
+        except Exception as err:
+            for call in batch:
+                call.error_callback(err)
+            return
+        self.batches += 1
+        self.calls += len(batch)
+        worker = {
+            "pid": os.getpid(),
+            "thread": threading.get_ident(),
+            "start": start,
+            "runtime": time.perf_counter() - start,
+            "peak_memory": None,
+            "batch": len(batch),
+        }
+        for call, res in zip(batch, results):
+            call.callback((res, dict(worker)))
+
+    def close(self):
+        """ stop the thread once the calls queued are run """
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
@@ -0,0 +1,251 @@
+""" Checkpoints of node outputs, used to resume long calculations
+
+Each completed node outputs are saved to a directory, under a key derived
+from the node function code and the fingerprints of its inputs. NumPy arrays
+are saved in `.npy` files (loaded back memory-mapped), other values are
+pickled.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import pickle
+import re
+import shutil
+import tempfile
+import types
+
+from .errors import PyungoError
+
+LOGGER = logging.getLogger()
+
+
+def _hasher():
+    return hashlib.blake2b(digest_size=16)
+
+
+def fingerprint(value):
+    """ return a fingerprint (hex digest) of a value
+
+    Raises:
+        PyungoError: In case the value cannot be pickled
+    """
+    h = _hasher()
+    tobytes = getattr(value, "tobytes", None)
+    if tobytes is not None and hasattr(value, "dtype") and value.dtype != object:
+        # NumPy array, hash the buffer directly
+        h.update(str((value.dtype, value.shape)).encode())
+        h.update(tobytes())
+        return h.hexdigest()
+    try:
+        h.update(pickle.dumps(value, protocol=4))
+    except Exception as err:
+        msg = "Cannot fingerprint value of type {}: {}"
+        raise PyungoError(msg.format(type(value).__name__, err))
+    return h.hexdigest()
+
+
+def code_hash(fct):
+    """ return a hash of a function code, including its closures, defaults and
+    the functions it calls through module globals
+    """
+    h = _hasher()
+    seen = set()
+
+    def visit_code(code, globals_):
+        h.update(code.co_code)
+        h.update(repr(code.co_names).encode())
+        for const in code.co_consts:
+            if isinstance(const, types.CodeType):
+                visit_code(const, globals_)
+            else:
+                h.update(repr(const).encode())
+        for name in code.co_names:
+            value = globals_.get(name)
+            if isinstance(value, types.FunctionType):
+                # helpers edited between runs invalidate the checkpoints
+                visit(value)
+
+    def visit(f):
+        if id(f) in seen:
+            return
+        seen.add(id(f))
+        h.update(
+            "{}.{}".format(
+                getattr(f, "__module__", None), getattr(f, "__qualname__", None)
+            ).encode()
+        )
+        code = getattr(f, "__code__", None)
+        if code is None:
+            h.update(repr(f).encode())
+            return
+        visit_code(code, getattr(f, "__globals__", {}))
+        h.update(repr(f.__defaults__).encode())
+        for cell in f.__closure__ or []:
+            content = cell.cell_contents
+            if callable(content):
+                visit(content)
+            else:
+                h.update(fingerprint(content).encode())
+
+    visit(fct)
+    return h.hexdigest()
+
+
+def save_value(folder, name, value):
+    """ save a value in a folder, NumPy arrays in `.npy` files, others pickled
+
+    Args:
+        folder (str): The folder
+        name: Name of the file, without extension
+
+    Returns:
+        filename (str): the name of the file holding the value
+    """
+    if type(value).__module__ == "numpy" and hasattr(value, "dtype"):
+        if value.dtype != object and value.shape:
+            import numpy as np
+
+            filename = "{}.npy".format(name)
+            np.save(os.path.join(folder, filename), value, allow_pickle=False)
+            return filename
+    filename = "{}.pkl".format(name)
+    with open(os.path.join(folder, filename), "wb") as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return filename
+
+
+def load_value(folder, filename, mmap=True):
+    """ load a value saved with `save_value`, memory-mapped if `mmap` """
+    path = os.path.join(folder, filename)
+    if filename.endswith(".npy"):
+        import numpy as np
+
+        return np.load(path, mmap_mode="r" if mmap else None)
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def node_key(node, sources, selector=None):
+    """ return the checkpoint key of a node
+
+    Args:
+        node (Node): The node
+        sources (dict): input name -> fingerprint of the value passed to it
+        selector (str): fingerprint of the selector value, for branch nodes
+
+    Returns:
+        key (str): hex digest, changes when the node code or its inputs change
+    """
+    h = _hasher()
+    h.update(code_hash(node._fct).encode())
+    for input_ in node._inputs:
+        if input_.is_constant:
+            source = fingerprint(input_.value)
+        else:
+            source = sources[input_.name]
+        h.update(repr((input_.name, input_.is_arg, input_.is_kwarg)).encode())
+        h.update(source.encode())
+    h.update(repr(node.output_names).encode())
+    if node.map_over is not None:
+        h.update(node.map_over.encode())
+        if node._reduce is not None:
+            h.update(code_hash(node._reduce).encode())
+    if node.condition is not None:
+        h.update(repr(node.condition).encode())
+        h.update(selector.encode())
+    return h.hexdigest()
+
+
+class Checkpoint:
+    """ directory of node outputs checkpoints
+
+    For each node (identified by its outputs names), a small JSON file gives
+    the key of its last checkpoint and the files holding its outputs. A
+    checkpoint with a different key is stale and is ignored, then replaced.
+
+    Args:
+        directory (str): The directory where checkpoints are saved
+    """
+
+    def __init__(self, directory):
+        self._directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def directory(self):
+        return self._directory
+
+    @staticmethod
+    def _name(node):
+        name = "__".join(o.map for o in node.outputs)
+        if node.condition is not None:
+            # alternative branches produce the same outputs
+            name += "__when__{}_{}".format(*node.condition)
+        return re.sub(r"[^\w.-]", "_", name)
+
+    def _index_path(self, node):
+        return os.path.join(self._directory, self._name(node) + ".json")
+
+    def _read_index(self, node):
+        try:
+            with open(self._index_path(node)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def load(self, node, key):
+        """ load the outputs of a node, if checkpointed with the same key
+
+        Returns:
+            results (tuple): found flag, node output values
+        """
+        index = self._read_index(node)
+        if index is None:
+            return False, None
+        if index["key"] != key:
+            LOGGER.info("Stale checkpoint ignored for {}".format(node))
+            return False, None
+        folder = os.path.join(self._directory, index["key"])
+        try:
+            values = [load_value(folder, f) for f in index["files"]]
+        except OSError:
+            return False, None
+        if index["container"] == "tuple":
+            return True, tuple(values)
+        if index["container"] == "list":
+            return True, values
+        return True, values[0]
+
+    def save(self, node, key, res):
+        """ save the outputs of a node
+
+        Values that cannot be pickled are not checkpointed (a warning is
+        logged).
+        """
+        if isinstance(res, (tuple, list)) and len(node.outputs) > 1:
+            container = type(res).__name__
+            values = list(res)
+        else:
+            container = "single"
+            values = [res]
+        folder = os.path.join(self._directory, key)
+        tmp = tempfile.mkdtemp(dir=self._directory, prefix=".tmp-")
+        try:
+            files = [save_value(tmp, i, v) for i, v in enumerate(values)]
+        except Exception as err:
+            shutil.rmtree(tmp, ignore_errors=True)
+            LOGGER.warning("Cannot checkpoint {}: {}".format(node, err))
+            return
+        previous = self._read_index(node)
+        shutil.rmtree(folder, ignore_errors=True)
+        os.rename(tmp, folder)
+        index_tmp = self._index_path(node) + ".tmp"
+        with open(index_tmp, "w") as f:
+            json.dump({"key": key, "files": files, "container": container}, f)
+        os.replace(index_tmp, self._index_path(node))
+        if previous is not None and previous["key"] != key:
+            shutil.rmtree(
+                os.path.join(self._directory, previous["key"]), ignore_errors=True
+            )
@@ -0,0 +1,323 @@
+""" Command line interface
+
+`pyungo run` calculates a graph for every record of an input file: records
+are streamed by chunks, sharded across worker processes (each one loading
+the graph and building its plan once), and the outputs are written as soon
+as the chunks are done, in order. At most a few chunks per process are in
+flight, so the memory used does not depend on the number of records.
+
+`pyungo serve` starts a `pyungo.server.GraphServer` for some graphs.
+
+Graphs are given as `module:attribute`, the attribute being a `Graph` or a
+function returning one.
+"""
+
+import argparse
+import collections
+import importlib
+import logging
+import os
+import sys
+import time
+
+from .core import Graph
+from .errors import PyungoError
+from .records import open_writer, read_records
+
+LOGGER = logging.getLogger()
+
+# chunks submitted to each process, and not written yet
+CHUNKS_IN_FLIGHT = 2
+
+
+def load_graph(spec):
+    """ return the graph of a `module:attribute` specification
+
+    Modules are imported from the current directory too.
+
+    Raises:
+        PyungoError: In case the specification is not a graph
+    """
+    module_name, _, attribute = spec.partition(":")
+    if not module_name or not attribute:
+        msg = "graph should be given as module:attribute, not {!r}".format(spec)
+        raise PyungoError(msg)
+    if os.getcwd() not in sys.path:
+        sys.path.insert(0, os.getcwd())
+    obj = getattr(importlib.import_module(module_name), attribute)
+    graph = obj if isinstance(obj, Graph) else obj()
+    if not isinstance(graph, Graph):
+        raise PyungoError("{} is not a graph".format(spec))
+    return graph
+
+
+def _quiet(verbose):
+    if not verbose:
+        LOGGER.setLevel(logging.ERROR)
+
+
+_WORKER = {}
+
+
+def init_worker(spec, verbose=False):
+    """ pool initializer: load the graph and build its plan, once per process """
+    _quiet(verbose)
+    graph = load_graph(spec)
+    # each process calculates a shard of the records, sequentially
+    graph._parallel = False
+    graph._scheduler = None
+    graph._compile()
+    _WORKER["graph"] = graph
+
+
+def run_chunk(records, start, outputs, keep, skip_errors, graph=None):
+    """ calculate the graph for a chunk of records
+
+    Args:
+        records (list): The records (input name -> value)
+        start (int): Position of the first record in the input
+        outputs (list): Names of the outputs written
+        keep (list): Names of the record fields copied to the results
+        skip_errors (bool): Skip the records whose calculation fails
+        graph (Graph): The graph, defaults to the one of `init_worker`
+
+    Returns:
+        results (tuple): rows of the records calculated, number of errors
+
+    Raises:
+        PyungoError: In case a calculation fails, and errors are not skipped
+    """
+    graph = graph or _WORKER["graph"]
+    used = set(graph.sim_inputs) | set(graph.sim_kwargs)
+    rows, errors = [], 0
+    for i, record in enumerate(records):
+        try:
+            graph.calculate({k: v for k, v in record.items() if k in used})
+        except Exception as err:
+            if not skip_errors:
+                msg = "record {} failed: {}".format(start + i, err)
+                raise PyungoError(msg) from err
+            errors += 1
+            continue
+        row = {k: record.get(k) for k in keep}
+        data = graph.data
+        row.update((o, data[o]) for o in outputs)
+        rows.append(row)
+    return rows, errors
+
+
+class Progress:
+    """ report the records done and the throughput, every `interval` seconds
+
+    Args:
+        stream: File the reports are written to
+        interval (float): Seconds between reports, None for no report
+    """
+
+    def __init__(self, stream=None, interval=5.0):
+        self._stream = stream or sys.stderr
+        self._interval = interval
+        self._started = self._reported = time.perf_counter()
+        self.records = 0
+        self.errors = 0
+
+    def _report(self, now):
+        elapsed = now - self._started
+        rate = self.records / elapsed if elapsed else 0.0
+        msg = "{} records, {} errors, {:.1f}s, {:.1f} records/s\n"
+        self._stream.write(msg.format(self.records, self.errors, elapsed, rate))
+        self._stream.flush()
+        self._reported = now
+
+    def update(self, records, errors):
+        self.records += records
+        self.errors += errors
+        now = time.perf_counter()
+        if self._interval is not None and now - self._reported >= self._interval:
+            self._report(now)
+
+    def done(self):
+        if self._interval is not None:
+            self._report(time.perf_counter())
+
+
+def run(
+    spec,
+    input_path,
+    output_path,
+    outputs=None,
+    keep=(),
+    processes=None,
+    chunk_size=1000,
+    skip_errors=False,
+    progress=None,
+    verbose=False,
+):
+    """ calculate a graph for every record of a file, writing the results
+
+    Args:
+        spec (str): The graph, as `module:attribute`
+        input_path (str): Input file (JSON lines, CSV, NumPy or Parquet)
+        output_path (str): Output file (JSON lines, CSV or Parquet)
+        outputs (list): Names of the outputs written, defaults to the
+            outputs read by no node
+        keep (list): Names of the record fields copied to the results
+        processes (int): Number of processes (number of CPUs by default, 1
+            to calculate in the current process)
+        chunk_size (int): Number of records per chunk
+        skip_errors (bool): Skip the records whose calculation fails
+        progress (Progress): Optional progress reporter
+        verbose (bool): Keep the calculation logs of the worker processes
+
+    Returns:
+        progress (Progress): the number of records written and of errors
+    """
+    graph = load_graph(spec)
+    if outputs is None:
+        outputs = sorted(graph._final_outputs())
+    diff = set(outputs) - set(graph.sim_outputs)
+    if diff:
+        msg = "The following outputs are not calculated by the model: {}"
+        raise PyungoError(msg.format(sorted(diff)))
+    keep = list(keep)
+    progress = progress or Progress(interval=None)
+    processes = processes or os.cpu_count() or 1
+    chunks = read_records(input_path, chunk_size)
+    writer = open_writer(output_path)
+    pool = None
+
+    def write(result):
+        rows, errors = result
+        writer.write(rows)
+        progress.update(len(rows), errors)
+
+    try:
+        if processes == 1:
+            # records are calculated one after the other, as in the workers
+            graph._parallel = False
+            start = 0
+            for records in chunks:
+                write(run_chunk(records, start, outputs, keep, skip_errors, graph))
+                start += len(records)
+        else:
+            try:
+                from multiprocess import Pool
+            except ImportError:
+                msg = "multiprocess package is needed for parralelism"
+                raise ImportError(msg)
+            pool = Pool(processes, initializer=init_worker, initargs=(spec, verbose))
+            pending = collections.deque()
+            start = 0
+            for records in chunks:
+                args = (records, start, outputs, keep, skip_errors)
+                pending.append(pool.apply_async(run_chunk, args))
+                start += len(records)
+                while len(pending) >= processes * CHUNKS_IN_FLIGHT:
+                    write(pending.popleft().get())
+            while pending:
+                write(pending.popleft().get())
+            pool.close()
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        writer.close()
+    progress.done()
+    return progress
+
+
+def serve(specs, address, processes=None):
+    """ serve graphs (see `pyungo.server.GraphServer`), named by attribute """
+    from .server import GraphServer
+
+    graphs = {spec.partition(":")[2]: load_graph(spec) for spec in specs}
+    server = GraphServer(graphs, address=address, processes=processes)
+    address = server.start()
+    sys.stderr.write("Serving {} on {}\n".format(sorted(graphs), address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+
+
+def _address(text):
+    """ return a TCP address from `host:port`, or a UNIX socket path """
+    host, sep, port = text.rpartition(":")
+    if sep and port.isdigit() and "/" not in text:
+        return (host or "127.0.0.1", int(port))
+    return text
+
+
+def _names(text):
+    return [name for name in text.split(",") if name]
+
+
+def parser():
+    """ return the parser of the command line arguments """
+    main = argparse.ArgumentParser(prog="pyungo", description=__doc__.split("\n")[0])
+    commands = main.add_subparsers(dest="command")
+    commands.required = True
+
+    run_ = commands.add_parser("run", help="calculate a graph for every record")
+    run_.add_argument("graph", help="graph, as module:attribute")
+    run_.add_argument("input", help="input file (.jsonl, .csv, .npy, .npz, .parquet)")
+    run_.add_argument(
+        "-o", "--output", default="-", help="output file (.jsonl, .csv, .parquet)"
+    )
+    run_.add_argument("--outputs", type=_names, help="comma separated outputs to write")
+    run_.add_argument(
+        "--keep", type=_names, default=[], help="comma separated fields to copy"
+    )
+    run_.add_argument("-j", "--processes", type=int, help="number of processes")
+    run_.add_argument("--chunk-size", type=int, default=1000)
+    run_.add_argument("--skip-errors", action="store_true")
+    run_.add_argument(
+        "--progress", type=float, default=5.0, help="seconds between reports"
+    )
+    run_.add_argument("-q", "--quiet", action="store_true", help="no progress")
+    run_.add_argument("-v", "--verbose", action="store_true", help="keep logs")
+
+    serve_ = commands.add_parser("serve", help="serve graphs on a local socket")
+    serve_.add_argument("graphs", nargs="+", help="graphs, as module:attribute")
+    serve_.add_argument(
+        "--address",
+        type=_address,
+        default=("127.0.0.1", 8765),
+        help="host:port, or path of a UNIX socket",
+    )
+    serve_.add_argument("-j", "--processes", type=int, help="number of processes")
+    serve_.add_argument("-v", "--verbose", action="store_true", help="keep logs")
+    return main
+
+
+def main(argv=None):
+    """ entry point of the `pyungo` command
+
+    Returns:
+        code (int): exit code
+    """
+    args = parser().parse_args(argv)
+    _quiet(args.verbose)
+    try:
+        if args.command == "serve":
+            serve(args.graphs, args.address, args.processes)
+            return 0
+        progress = Progress(interval=None if args.quiet else args.progress)
+        run(
+            args.graph,
+            args.input,
+            args.output,
+            outputs=args.outputs,
+            keep=args.keep,
+            processes=args.processes,
+            chunk_size=args.chunk_size,
+            skip_errors=args.skip_errors,
+            progress=progress,
+            verbose=args.verbose,
+        )
+    except (PyungoError, ImportError, OSError) as err:
+        sys.stderr.write("pyungo: {}\n".format(err))
+        return 1
+    return 0
@@ -0,0 +1,101 @@
+""" Thin client of the graph server (see `pyungo.server`) """
+
+import socket
+import threading
+
+from .errors import PyungoError
+from .protocol import receive, send
+
+
+class Client:
+    """ connection to a graph server
+
+    The connection is opened on first use, and kept open. A client can be
+    used by several threads, their requests being sent one after the other
+    (use a client per thread to send them at the same time).
+
+    Args:
+        address: `(host, port)` of a TCP server, or the path of a UNIX socket
+        timeout (float): Optional timeout (in seconds) of the socket operations
+
+    Example:
+        with Client('/tmp/pyungo.sock') as client:
+            res = client.calculate('pv', {'weather': weather})
+    """
+
+    def __init__(self, address, timeout=None):
+        self._address = address
+        self._timeout = timeout
+        self._socket = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if isinstance(self._address, str):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.settimeout(self._timeout)
+        sock.connect(self._address)
+        return sock
+
+    def request(self, message):
+        """ send a request and return the response
+
+        Raises:
+            PyungoError: In case the request failed on the server
+        """
+        with self._lock:
+            if self._socket is None:
+                self._socket = self._connect()
+            try:
+                send(self._socket, message)
+                response = receive(self._socket)
+            except BaseException:
+                # the connection is in an unknown state
+                self.close()
+                raise
+        error = response.get("error")
+        if error is not None:
+            raise PyungoError("{type}: {message}".format(**error))
+        return response
+
+    def calculate(self, graph, data, outputs=None):
+        """ calculate a graph of the server
+
+        Args:
+            graph (str): Name of the graph
+            data (dict): Inputs data
+            outputs (list): Optional names of outputs to get back
+
+        Returns:
+            The output(s) of the last node being run, or the requested outputs
+            (dict name -> value) if `outputs` is given
+        """
+        message = {"op": "calculate", "graph": graph, "data": data}
+        if outputs is not None:
+            message["outputs"] = list(outputs)
+        response = self.request(message)
+        if outputs is not None:
+            return response["outputs"]
+        return response["result"]
+
+    def health(self):
+        """ return the status of the server (see `GraphServer.health`) """
+        return self.request({"op": "health"})
+
+    def metrics(self):
+        """ return the metrics of the server (see `GraphServer.metrics`) """
+        return self.request({"op": "metrics"})
+
+    def close(self):
+        """ close the connection """
+        sock, self._socket = self._socket, None
+        if sock is not None:
+            sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,21 +1,67 @@
 """ Main module containing Graph / Node classes """
 
-import uuid
 import datetime as dt
+import heapq
 from functools import reduce
+import itertools
 import logging
 import inspect
+import threading
+import time
+import uuid
 
 from .io import Input, Output, get_if_exists
 from .errors import PyungoError
 from .utils import get_function_return_names
 from .data import Data
+from .append import AppendedData
+from .batching import Batcher
+from .checkpoint import Checkpoint, fingerprint, node_key
+from .execution import Execution, run_node
+from .memory import MemoryProfile
+from .providers import Provider
+from .sweep import init_sweep, run_point
+from .tracing import Trace
 
 logging.basicConfig()
 LOGGER = logging.getLogger()
 LOGGER.setLevel(logging.INFO)
 
 COPY_TIME_MAX_PERCENTAGE = 0.05
+# weight of the latest run when updating a node runtime estimate (EWMA)
+RUNTIME_EWMA_ALPHA = 0.3
+# runtime (in seconds) assumed for a node never run and without cost hint
+DEFAULT_NODE_COST = 1e-3
+# cost model of running a node in the pool (adaptive offload)
+OFFLOAD_FIXED_OVERHEAD = 1e-3
+OFFLOAD_SECONDS_PER_BYTE = 1e-9
+# hysteresis thresholds on runtime / offload overhead
+OFFLOAD_RATIO_HIGH = 2.0
+OFFLOAD_RATIO_LOW = 0.5
+# maximum time (in seconds) a call to a batched node waits for other calls
+BATCH_WAIT = 0.005
+
+# shared by the nodes without resources / kwargs defaults, never modified
+_EMPTY = {}
+# ids of the nodes, unique in the process
+_NODE_IDS_LOCK = threading.Lock()
+_next_node_id = 0
+
+
+def _new_node_id():
+    """ return a new node id """
+    global _next_node_id
+    with _NODE_IDS_LOCK:
+        node_id = _next_node_id
+        _next_node_id += 1
+    return node_id
+
+
+def _reserve_node_id(node_id):
+    """ make sure nodes created later do not reuse the id of a node loaded """
+    global _next_node_id
+    with _NODE_IDS_LOCK:
+        _next_node_id = max(_next_node_id, node_id + 1)
 
 
 def topological_sort(data):
@@ -62,24 +108,129 @@ class Node:
         outputs (list): List of outputs (`Output` or `str`)
         args (list): Optional list of args
         kwargs (list): Optional list of kwargs
+        cost (float): Optional estimated runtime (in seconds), used for
+            scheduling until the node has actually been run
+        when (dict): Optional condition {selector name: value}, the node is
+            only run when the selector data has the given value
+        map_over (str): Optional name of an iterable input. The function is
+            called for each of its elements (the other inputs being the same),
+            and the node output is the list of the results
+        chunk_size (int): Number of elements per task when a map node is run
+            in the pool (by default, a few chunks per process)
+        reduce (function): Optional function applied to the list of results
+            of a map node, returning the node output(s)
+        resources (dict): Optional resources needed to run the node: `cpus`
+            (threads used, 1 by default), `memory` (bytes) and any named
+            resource limited by the graph (e.g. {'database': 1})
+        lookback (int): Optional number of previous rows needed to calculate
+            a row. The node is row-wise (0) or windowed, and is run on the
+            appended rows only by `Graph.append`
+        batch_size (int): Optional maximum number of calls, from concurrent
+            calculations, run together. The function then receives the list
+            of the values of each input (constants excepted), and returns the
+            list of the results of each call
+        batch_wait (float): Maximum time (in seconds) a call waits for other
+            calls to be batched with
 
     Raises:
-        PyungoError: In case inputs have the wrong type
+        PyungoError: In case inputs, condition, mapped input, resources,
+            lookback or batch size are wrong
+
+    Node ids are integers, unique in the process (nodes unpickled keep their
+    id, and the ids of the nodes created afterwards are greater).
     """
 
-    def __init__(self, fct, inputs, outputs, args=None, kwargs=None):
-        self._id = str(uuid.uuid4())
+    __slots__ = (
+        "_id",
+        "_fct",
+        "_cost",
+        "_map_over",
+        "_chunk_size",
+        "_reduce",
+        "_resources",
+        "_lookback",
+        "_batch_size",
+        "_batch_wait",
+        "_condition",
+        "_inputs",
+        "_args",
+        "_kwargs",
+        "_kwargs_default",
+        "_outputs",
+        "_input_names",
+        "_inputs_without_constants",
+        "_output_names",
+    )
+
+    def __init__(
+        self,
+        fct,
+        inputs,
+        outputs,
+        args=None,
+        kwargs=None,
+        cost=None,
+        when=None,
+        map_over=None,
+        chunk_size=None,
+        reduce=None,
+        resources=None,
+        lookback=None,
+        batch_size=None,
+        batch_wait=BATCH_WAIT,
+    ):
+        self._id = _new_node_id()
         self._fct = fct
+        self._cost = cost
+        self._map_over = map_over
+        self._chunk_size = chunk_size
+        self._reduce = reduce
+        self._resources = dict(resources) if resources else _EMPTY
+        for name, amount in self._resources.items():
+            if not isinstance(amount, (int, float)) or amount < 0:
+                msg = "resource {} should be a positive number".format(name)
+                raise PyungoError(msg)
+        if lookback is not None and (not isinstance(lookback, int) or lookback < 0):
+            raise PyungoError("lookback should be a positive integer")
+        self._lookback = lookback
+        if batch_size is not None:
+            if not isinstance(batch_size, int) or batch_size < 1:
+                raise PyungoError("batch_size should be a strictly positive integer")
+            if map_over is not None:
+                raise PyungoError("map nodes cannot be batched")
+        self._batch_size = batch_size
+        self._batch_wait = batch_wait
+        self._condition = None
+        if when is not None:
+            if not isinstance(when, dict) or len(when) != 1:
+                msg = "when should be a dict with only one key (the selector name)"
+                raise PyungoError(msg)
+            self._condition = next(iter(when.items()))
         self._inputs = []
         self._process_inputs(inputs)
-        self._args = args if args else []
+        self._args = args if args else ()
         self._process_inputs(self._args, is_arg=True)
         self._kwargs = kwargs if kwargs else []
         self._process_inputs(self._kwargs, is_kwarg=True)
-        self._kwargs_default = {}
+        self._kwargs_default = _EMPTY
         self._process_kwargs(self._kwargs)
         self._outputs = []
         self._process_outputs(outputs)
+        self._input_names = [i.name for i in self._inputs]
+        self._inputs_without_constants = [i for i in self._inputs if not i.is_constant]
+        self._output_names = [o.name for o in self._outputs]
+        if map_over is not None:
+            if map_over not in [i.name for i in self.inputs_without_constants]:
+                msg = "mapped input {} is not an input of the node".format(map_over)
+                raise PyungoError(msg)
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+        _reserve_node_id(self._id)
 
     def __repr__(self):
         return "Node({}, <{}>, {}, {})".format(
@@ -88,10 +239,7 @@ class Node:
 
     def __call__(self, *args, **kwargs):
         """ run the function attached to the node, and store the result """
-        t1 = dt.datetime.utcnow()
-        res = self._fct(*args, **kwargs)
-        t2 = dt.datetime.utcnow()
-        LOGGER.info("Ran {} in {}".format(self, t2 - t1))
+        res = self._run(*args, **kwargs)
         # save results to outputs
         if len(self._outputs) == 1:
             self._outputs[0].value = res
@@ -100,6 +248,14 @@ class Node:
                 out.value = res[i]
         return res
 
+    def _run(self, *args, **kwargs):
+        """ run the function attached to the node """
+        t1 = dt.datetime.utcnow()
+        res = self._fct(*args, **kwargs)
+        t2 = dt.datetime.utcnow()
+        LOGGER.info("Ran {} in {}".format(self, t2 - t1))
+        return res
+
     @property
     def id(self):
         """ return the unique id of the node """
@@ -107,15 +263,15 @@ class Node:
 
     @property
     def input_names(self):
-        """ return a list of all input names """
-        input_names = [i.name for i in self._inputs]
-        return input_names
+        """ return a list of all input names (not to be modified) """
+        return self._input_names
 
     @property
     def inputs_without_constants(self):
-        """ return the list of inputs, when inputs are not constants """
-        inputs = [i for i in self._inputs if not i.is_constant]
-        return inputs
+        """ return the list of inputs, when inputs are not constants (not to be
+        modified)
+        """
+        return self._inputs_without_constants
 
     @property
     def kwargs(self):
@@ -128,14 +284,54 @@ class Node:
 
     @property
     def output_names(self):
-        """ return a list of output names """
-        return [o.name for o in self._outputs]
+        """ return a list of output names (not to be modified) """
+        return self._output_names
 
     @property
     def fct_name(self):
         """ return the function name """
         return self._fct.__name__
 
+    @property
+    def cost(self):
+        """ return the user-declared cost hint (in seconds) if any """
+        return self._cost
+
+    @property
+    def condition(self):
+        """ return the (selector name, value) the node is run for, if any """
+        return self._condition
+
+    @property
+    def map_over(self):
+        """ return the name of the input mapped over, if any """
+        return self._map_over
+
+    @property
+    def resources(self):
+        """ return the resources declared as needed to run the node """
+        return self._resources
+
+    @property
+    def lookback(self):
+        """ return the number of previous rows needed by a row-wise node """
+        return self._lookback
+
+    @property
+    def batch_size(self):
+        """ return the maximum number of calls run together, if batched """
+        return self._batch_size
+
+    @property
+    def batch_wait(self):
+        """ return the maximum time a call waits to be batched """
+        return self._batch_wait
+
+    @property
+    def chunk_size(self):
+        """ return the number of elements per task of a map node, if set """
+        return self._chunk_size
+
     def _process_inputs(self, inputs, is_arg=False, is_kwarg=False):
         """ converter data passed to Input objects and store them """
         # if inputs are None, we inspect the function signature
@@ -165,6 +361,8 @@ class Node:
 
     def _process_kwargs(self, kwargs):
         """ read and store kwargs default values """
+        if not kwargs:
+            return
         kwarg_values = inspect.getargspec(self._fct).defaults
         if kwargs and kwarg_values:
             kwarg_names = inspect.getargspec(self._fct).args[-len(kwarg_values) :]
@@ -205,6 +403,111 @@ class Node:
         kwargs = {i.name: i.value for i in self._inputs if i.is_kwarg}
         return self(*args, **kwargs)
 
+    def _arguments(self, values, check=True):
+        """ return the function args and kwargs from the input values """
+        args, extra_args, kwargs = [], [], {}
+        for input_ in self._inputs:
+            if input_.is_constant:
+                value = input_.value
+            else:
+                value = values[input_.name]
+                if check:
+                    input_.check(value)
+            if input_.is_arg:
+                extra_args.append(value)
+            elif input_.is_kwarg:
+                kwargs[input_.name] = value
+            else:
+                args.append(value)
+        return args + extra_args, kwargs
+
+    def run_with_values(self, values):
+        """ Run the node with the given input values, without storing them
+
+        Unlike `run_with_loaded_inputs`, the node state is left untouched,
+        so the same node can be run concurrently with different values.
+
+        Args:
+            values (dict): input name -> value, for inputs that are not constants
+
+        Returns:
+            The result of the attached function
+        """
+        if self._map_over is not None:
+            return self.gather(self.run_chunk(values, values[self._map_over]))
+        args, kwargs = self._arguments(values)
+        res = self._run(*args, **kwargs)
+        self._check_outputs(res)
+        return res
+
+    def run_chunk(self, values, items):
+        """ Run a map node for some elements of its mapped input
+
+        Args:
+            values (dict): input name -> value, for the inputs not mapped over
+            items (list): elements of the mapped input
+
+        Returns:
+            results (list): the function result for each element
+        """
+        values = dict(values)
+        results = []
+        t1 = dt.datetime.utcnow()
+        for item in items:
+            values[self._map_over] = item
+            args, kwargs = self._arguments(values)
+            results.append(self._fct(*args, **kwargs))
+        t2 = dt.datetime.utcnow()
+        LOGGER.info("Ran {} over {} elements in {}".format(self, len(results), t2 - t1))
+        return results
+
+    def run_batch(self, calls):
+        """ Run a batched node once for several calls
+
+        Args:
+            calls (list): input values of each call (see `run_with_values`)
+
+        Returns:
+            results (list): the result of each call
+
+        Raises:
+            PyungoError: In case the function does not return one result per call
+        """
+        values = {}
+        for input_ in self._inputs_without_constants:
+            values[input_.name] = [call[input_.name] for call in calls]
+            for value in values[input_.name]:
+                input_.check(value)
+        args, kwargs = self._arguments(values, check=False)
+        results = self._run(*args, **kwargs)
+        if len(results) != len(calls):
+            msg = "{} returned {} results for a batch of {} calls"
+            raise PyungoError(msg.format(self, len(results), len(calls)))
+        for res in results:
+            self._check_outputs(res)
+        return list(results)
+
+    def gather(self, results):
+        """ return the output(s) of a map node from the results of each element """
+        if self._reduce is not None:
+            res = self._reduce(results)
+        elif len(self._outputs) > 1:
+            res = tuple(list(r) for r in zip(*results))
+            if not res:
+                res = tuple([] for _ in self._outputs)
+        else:
+            res = results
+        self._check_outputs(res)
+        return res
+
+    def _check_outputs(self, res):
+        """ check the result of the function against outputs contracts """
+        if len(self._outputs) == 1:
+            self._outputs[0].check(res)
+        else:
+            for i, out in enumerate(self._outputs):
+                out.check(res[i])
+
 
 class Graph:
     """ Graph object, collection of related nodes
@@ -217,10 +520,43 @@ class Graph:
         schema (dict): Optional JSON schema to validate inputs data
         do_deepcopy (bool): Enables the deep-copying of inputs in order to guarantee
             immutability
+        adaptive (bool): When parallelism is enabled, decide for each node
+            whether it is worth running in the pool or inline
+        interrupt_on_error (bool): When a node fails, interrupt the nodes
+            running in the pool instead of waiting for them
+        memory_budget (int): Optional memory budget (in bytes) of the
+            intermediate data. When exceeded, large NumPy / pandas outputs
+            are spilled to memory-mapped files
+        scratch_dir (str): Optional directory where spilled data are saved
+            (a temporary directory by default)
+        scheduler (Scheduler): Optional `pyungo.scheduler.Scheduler` shared by
+            several graphs, running the nodes instead of a pool of the graph
+            (implies parallelism)
+        priority (int): Priority of the nodes submitted to the scheduler,
+            higher first (can be overridden for each calculation)
+        tenant (str): Name the nodes are accounted to by the scheduler, for
+            fair sharing (each graph is its own tenant by default)
+        resources (dict): Optional resources available to the nodes running
+            at the same time: `cpus` (`pool_size` by default), `memory` (in
+            bytes, not limited by default) and named resources
+        deduplicate (bool): Run only once the nodes with the same function,
+            inputs and constants, the outputs of the duplicates being aliases
+            of the outputs of the node run
+        locality (bool): When parallelism is enabled, keep the outputs of the
+            nodes in the process which calculated them, and run the nodes
+            reading them in that process when possible. Only the final
+            outputs (read by no node) and the requested ones are sent back
+        recorder (Recorder): Optional `pyungo.recording.Recorder` saving
+            snapshots of the inputs and timings of sampled calculations
+
+    The graph definition is not modified while calculating: all the values of
+    a run are kept in the `Data` of that run. The same graph can then be used
+    by several threads calling `calculate` concurrently.
 
     Raises:
         ImportError will raise in case parallelism is chosen and `multiprocess`
             not installed
+        PyungoError: In case locality is asked with a scheduler
     """
 
     def __init__(
@@ -231,21 +567,94 @@ class Graph:
         pool_size=2,
         schema=None,
         do_deepcopy=True,
+        adaptive=False,
+        interrupt_on_error=True,
+        memory_budget=None,
+        scratch_dir=None,
+        scheduler=None,
+        priority=0,
+        tenant=None,
+        resources=None,
+        deduplicate=False,
+        locality=False,
+        recorder=None,
     ):
+        if locality and scheduler is not None:
+            raise PyungoError("locality is not supported with a shared scheduler")
         self._nodes = {}
         self._data = None
-        self._parallel = parallel
+        self._memory_profile = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._parallel = parallel or scheduler is not None
         self._pool_size = pool_size
+        self._scheduler = scheduler
+        self._priority = priority
+        self._tenant = tenant if tenant is not None else "graph-{}".format(id(self))
+        self._resources = dict(resources or {})
+        self._deduplicate = deduplicate
+        self._locality = locality
+        self._recorder = recorder
+        # tells apart the nodes of this graph from the ones of graphs
+        # unpickled in the same process (node ids may collide)
+        self._token = uuid.uuid4().hex
+        self._batchers = {}
+        self._duplicates = {}
+        self._bound = {}
+        self._providers = {}
+        self._history = {}
         self._schema = schema
         self._sorted_dep = None
+        self._producers = {}
+        self._readers = {}
+        self._deps = {}
+        self._dependents = {}
+        self._levels = {}
+        self._runtimes = {}
         self._inputs = {i.name: i for i in inputs} if inputs else None
         self._outputs = {o.name: o for o in outputs} if outputs else None
         self._do_deepcopy = do_deepcopy
+        self._adaptive = adaptive
+        self._interrupt_on_error = interrupt_on_error
+        self._memory_budget = memory_budget
+        self._scratch_dir = scratch_dir
+        self._offloaded = {}
+        self._offload_switches = {}
+        self._offload_overheads = {}
+        self._payload_sizes = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_local"]
+        del state["_lock"]
+        # the threads running the batches stay in this process
+        state["_batchers"] = {}
+        # the scheduler (and its pool) stays in the process that created it
+        state["_scheduler"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._token = uuid.uuid4().hex
+        self._local = threading.local()
+        self._lock = threading.Lock()
 
     @property
     def data(self):
-        """ return the data of the graph (inputs + outputs) """
-        return self._data
+        """ return the data of the graph (inputs + outputs)
+
+        This is the data of the last calculation made by the current thread,
+        or of the last calculation made by any thread if none.
+        """
+        return getattr(self._local, "data", self._data)
+
+    @property
+    def memory_profile(self):
+        """ return the `MemoryProfile` of the last calculation (see `data`)
+
+        Only available when calculating with `profile_memory=True`.
+        """
+        return getattr(self._local, "memory_profile", self._memory_profile)
 
     @property
     def sim_inputs(self):
@@ -255,6 +664,8 @@ class Graph:
             inputs.extend(
                 [i.map for i in node.inputs_without_constants if not i.is_kwarg]
             )
+            if node.condition is not None:
+                inputs.append(node.condition[0])
         return inputs
 
     @property
@@ -274,23 +685,31 @@ class Graph:
     @property
     def dag(self):
         """ return the ordered nodes graph """
+        self._compile()
         ordered_nodes = []
-        for node_ids in topological_sort(self._dependencies()):
+        for node_ids in self._sorted_dep:
             nodes = [self._get_node(node_id) for node_id in node_ids]
             ordered_nodes.append(nodes)
         return ordered_nodes
 
+    @property
+    def runtimes(self):
+        """ return the runtime estimates (in seconds) of the nodes already run """
+        return dict(self._runtimes)
+
     @staticmethod
-    def run_node(node):
+    def run_node(node, values):
         """ run the node
 
         Args:
             node (Node): The node to run
+            values (dict): Input values (see `Node.run_with_values`)
 
         Returns:
             results (tuple): node id, node output values
         """
-        return (node.id, node.run_with_loaded_inputs())
+        res, _ = run_node(node, values)
+        return (node.id, res)
 
     def _register(self, f, **kwargs):
         """ get provided inputs if anmy and create a new node """
@@ -298,7 +717,23 @@ class Graph:
         outputs = kwargs.get("outputs")
         args_names = kwargs.get("args")
         kwargs_names = kwargs.get("kwargs")
-        self._create_node(f, inputs, outputs, args_names, kwargs_names)
+        node = self._create_node(
+            f,
+            inputs,
+            outputs,
+            args_names,
+            kwargs_names,
+            cost=kwargs.get("cost"),
+            when=kwargs.get("when"),
+            map_over=kwargs.get("map_over"),
+            chunk_size=kwargs.get("chunk_size"),
+            reduce=kwargs.get("reduce"),
+            resources=kwargs.get("resources"),
+            lookback=kwargs.get("lookback"),
+            batch_size=kwargs.get("batch_size"),
+            batch_wait=kwargs.get("batch_wait", BATCH_WAIT),
+        )
+        return node.id
 
     def register(self, **kwargs):
         """ register decorator """
@@ -318,43 +753,587 @@ class Graph:
             outputs (list): List of outputs (Output or str)
             args (list): List of optional args
             kwargs (list): List of optional kwargs
+            cost (float): Optional estimated runtime (in seconds)
+            when (dict): Optional condition {selector name: value}, the node
+                is a branch only run when the selector has the given value
+            map_over (str): Optional iterable input, the function is run for
+                each of its elements (in parallel chunks when possible)
+            chunk_size (int): Number of elements per task of a map node
+            reduce (function): Optional reduction of the results of a map node
+            resources (dict): Optional resources needed to run the node (`cpus`,
+                `memory` in bytes, named resources of the graph)
+            lookback (int): Optional number of previous rows needed by a
+                row-wise / windowed node (see `append`)
+            batch_size (int): Optional maximum number of calls from concurrent
+                calculations run with one call of the function, which takes
+                and returns lists
+            batch_wait (float): Maximum time (in seconds) a call waits for
+                others to be batched with
+
+        Returns:
+            node_id (int): The id of the new node
         """
-        self._register(function, **kwargs)
+        return self._register(function, **kwargs)
+
+    def remove_node(self, node_id):
+        """ remove a node from the graph
+
+        Args:
+            node_id (int): The id of the node
+
+        Raises:
+            PyungoError: In case the node does not exist
+        """
+        if node_id not in self._nodes:
+            raise PyungoError("Node {} does not exist".format(node_id))
+        self._unlink(node_id)
+
+    def replace_node(self, node_id, function, **kwargs):
+        """ replace a node by a new one (see `add_node` for the arguments)
+
+        The graph is left unchanged if the new node cannot be created.
 
-    def _create_node(self, fct, inputs, outputs, args_names, kwargs_names):
+        Args:
+            node_id (int): The id of the node to replace
+            function (function): Python function attached to the new node
+
+        Returns:
+            node_id (int): The id of the new node
+
+        Raises:
+            PyungoError: In case the node does not exist
+        """
+        if node_id not in self._nodes:
+            raise PyungoError("Node {} does not exist".format(node_id))
+        node = self._unlink(node_id)
+        try:
+            return self._register(function, **kwargs)
+        except Exception:
+            self._link(node)
+            raise
+
+    def _create_node(self, fct, inputs, outputs, args_names, kwargs_names, **options):
         """ create a save the node to the graph """
         inputs = get_if_exists(inputs, self._inputs)
         outputs = get_if_exists(outputs, self._outputs)
-        node = Node(fct, inputs, outputs, args_names, kwargs_names)
-        # assume that we cannot have two nodes with the same output names
-        for n in self._nodes.values():
-            for out_name in n.output_names:
-                if out_name in node.output_names:
+        node = Node(fct, inputs, outputs, args_names, kwargs_names, **options)
+        # assume that we cannot have two nodes with the same output names,
+        # unless they are alternative branches of the same selector
+        for out_name in node.output_names:
+            for node_id in self._producers.get(out_name, []):
+                if not self._alternatives(self._nodes[node_id], node):
                     msg = "{} output already exist".format(out_name)
                     raise PyungoError(msg)
-        self._nodes[node.id] = node
+        self._link(node)
+        return node
+
+    @staticmethod
+    def _alternatives(node1, node2):
+        """ return True if two nodes are never run in the same calculation """
+        cond1, cond2 = node1.condition, node2.condition
+        if cond1 is None or cond2 is None:
+            return False
+        return cond1[0] == cond2[0] and cond1[1] != cond2[1]
+
+    @property
+    def _conditional(self):
+        """ return True if some nodes are branches of a selector """
+        return any(n.condition is not None for n in self._nodes.values())
+
+    def _optional_inputs(self):
+        """ return the inputs read only by nodes that selectors may skip
+
+        Like when running (see `Execution`), nodes with a condition may be
+        skipped, and so may the nodes whose dependents may all be skipped
+        (selector nodes and sinks are always run).
+        """
+        if not self._conditional:
+            return set()
+        selectors = {n.condition[0] for n in self._nodes.values() if n.condition}
+        gated = set()
+        for node_ids in reversed(self._sorted_dep):
+            for node_id in node_ids:
+                node = self._nodes[node_id]
+                dependents = self._dependents[node_id]
+                if node.condition is not None or (
+                    dependents
+                    and gated.issuperset(dependents)
+                    and not selectors.intersection(o.map for o in node.outputs)
+                ):
+                    gated.add(node_id)
+        optional, required = set(), set(selectors)
+        for node_id, node in self._nodes.items():
+            names = optional if node_id in gated else required
+            names.update(i.map for i in node.inputs_without_constants)
+        return optional - required
+
+    @staticmethod
+    def _read_names(node):
+        """ return the names a node depends on (inputs, and selector if any) """
+        names = list(node.input_names)
+        if node.condition is not None:
+            names.append(node.condition[0])
+        return names
+
+    def _link(self, node):
+        """ add a node, updating the topology incrementally
+
+        The producer and reader indexes, dependencies and levels are updated
+        for the nodes affected only, and the compiled plan is invalidated.
+        Indexes and dependencies are lists of node ids, lighter than sets for
+        the few items most nodes have.
+        """
+        node_id = node.id
+        self._nodes[node_id] = node
+        deps = set()
+        for name in self._read_names(node):
+            self._readers.setdefault(name, []).append(node_id)
+            deps.update(self._producers.get(name, []))
+        dependents = set()
+        for name in node.output_names:
+            self._producers.setdefault(name, []).append(node_id)
+            dependents.update(self._readers.get(name, []))
+        deps.discard(node_id)
+        dependents.discard(node_id)
+        for out in node.outputs:
+            # rows appended before were not processed by this node
+            self._history.pop(out.map, None)
+        self._deps[node_id] = sorted(deps)
+        self._dependents[node_id] = sorted(dependents)
+        for dep in deps:
+            self._dependents[dep].append(node_id)
+        for child in dependents:
+            self._deps[child].append(node_id)
+        self._sorted_dep = None
+        if self._levels is None:
+            return
+        levels = self._levels
+        levels[node_id] = 1 + max((levels[dep] for dep in deps), default=-1)
+        # push the dependents down, reaching the new node again means a cycle
+        stack = [node_id]
+        while stack:
+            parent = stack.pop()
+            for child in self._dependents[parent]:
+                if levels[child] <= levels[parent]:
+                    if child == node_id:
+                        # reported when compiling
+                        self._levels = None
+                        return
+                    levels[child] = levels[parent] + 1
+                    stack.append(child)
+
+    def _unlink(self, node_id):
+        """ remove a node, updating the topology incrementally (see `_link`)
+
+        Returns:
+            node (Node): The node removed
+        """
+        node = self._nodes.pop(node_id)
+        for name in self._read_names(node):
+            self._readers[name].remove(node_id)
+            if not self._readers[name]:
+                del self._readers[name]
+        for name in node.output_names:
+            self._producers[name].remove(node_id)
+            if not self._producers[name]:
+                del self._producers[name]
+        for out in node.outputs:
+            self._history.pop(out.map, None)
+        for dep in self._deps.pop(node_id):
+            self._dependents[dep].remove(node_id)
+        children = self._dependents.pop(node_id)
+        for child in children:
+            self._deps[child].remove(node_id)
+        for stats in (
+            self._runtimes,
+            self._offloaded,
+            self._offload_switches,
+            self._offload_overheads,
+            self._payload_sizes,
+        ):
+            stats.pop(node_id, None)
+        batcher = self._batchers.pop(node_id, None)
+        if batcher is not None:
+            batcher.close()
+        self._sorted_dep = None
+        if self._levels is None:
+            return node
+        levels = self._levels
+        del levels[node_id]
+        # pull the descendants up, in their previous order
+        heap = [(levels[child], child) for child in children]
+        heapq.heapify(heap)
+        while heap:
+            previous, child = heapq.heappop(heap)
+            if levels[child] != previous:
+                continue
+            level = 1 + max((levels[dep] for dep in self._deps[child]), default=-1)
+            if level != previous:
+                levels[child] = level
+                for grandchild in self._dependents[child]:
+                    heapq.heappush(heap, (levels[grandchild], grandchild))
+        return node
 
     def _dependencies(self):
-        """ return dependencies among the nodes """
-        dep = {}
-        for node in self._nodes.values():
-            d = dep.setdefault(node.id, [])
-            for inp in node.input_names:
-                for node2 in self._nodes.values():
-                    if inp in node2.output_names:
-                        d.append(node2.id)
-        return dep
+        """ return dependencies among the nodes
+
+        A branch node also depends on the node producing its selector.
+        """
+        return {node_id: sorted(deps) for node_id, deps in self._deps.items()}
+
+    def _descendants(self, node_ids):
+        """ return the ids of the nodes depending (indirectly too) on the given ones """
+        descendants = set()
+        stack = list(node_ids)
+        while stack:
+            for child in self._dependents[stack.pop()]:
+                if child not in descendants:
+                    descendants.add(child)
+                    stack.append(child)
+        return descendants
+
+    def _subgraph(self, node_ids):
+        """ return a new graph (run sequentially) made of the given nodes only """
+        graph = Graph(do_deepcopy=self._do_deepcopy)
+        for node_id in node_ids:
+            graph._link(self._nodes[node_id])
+        graph._providers = self._providers
+        graph._runtimes = {i: r for i, r in self._runtimes.items() if i in node_ids}
+        used = set(graph.sim_inputs) | set(graph.sim_kwargs)
+        graph._bound = {k: v for k, v in self._bound.items() if k in used}
+        return graph
 
     def _get_node(self, id_):
         """ get a node from its id """
         return self._nodes[id_]
 
+    def _compile(self):
+        """ build the plan (nodes by level) if the graph changed since the last one """
+        if self._sorted_dep is None:
+            with self._lock:
+                if self._sorted_dep is None:
+                    self._topological_sort()
+
     def _topological_sort(self):
-        """ run topological sort algorithm """
-        self._sorted_dep = list(topological_sort(self._dependencies()))
+        """ group the nodes by level
 
-    def calculate(self, data):
-        """ run graph calculations """
+        Levels are kept up to date when adding / removing nodes, they are only
+        computed from scratch after a cyclic dependency was found.
+
+        Raises:
+            PyungoError: In case a cyclic dependency exists
+        """
+        if self._levels is None:
+            levels = {}
+            for level, node_ids in enumerate(topological_sort(self._dependencies())):
+                levels.update((node_id, level) for node_id in node_ids)
+            self._levels = levels
+        sorted_dep = [[] for _ in range(max(self._levels.values(), default=-1) + 1)]
+        for node_id, level in self._levels.items():
+            sorted_dep[level].append(node_id)
+        for node_ids in sorted_dep:
+            node_ids.sort()
+        self._duplicates = self._find_duplicates(sorted_dep)
+        self._sorted_dep = sorted_dep
+
+    @staticmethod
+    def _signature(node):
+        """ return what identifies the calculation made by a node
+
+        Returns None for nodes that cannot be compared (unpicklable constant).
+        """
+        inputs = []
+        for inp in node._inputs:
+            if inp.is_constant:
+                try:
+                    value = fingerprint(inp.value)
+                except PyungoError:
+                    return None
+            else:
+                value = inp.map
+            item = (inp.name, inp.is_arg, inp.is_kwarg, inp.is_constant, value)
+            inputs.append(item + (repr(inp.contract),))
+        outputs = tuple(repr(o.contract) for o in node.outputs)
+        return (
+            id(node._fct),
+            tuple(inputs),
+            outputs,
+            node.condition,
+            node.map_over,
+            id(node._reduce),
+            node.lookback,
+        )
+
+    def _find_duplicates(self, sorted_dep):
+        """ return node id -> ids of the nodes making the same calculation
+
+        Only the first node (in the plan order) of each group is a key.
+        """
+        if not self._deduplicate:
+            return {}
+        duplicates = {}
+        for node_ids in sorted_dep:
+            first = {}
+            for node_id in node_ids:
+                signature = self._signature(self._nodes[node_id])
+                if signature is None:
+                    continue
+                if signature in first:
+                    duplicates.setdefault(first[signature], []).append(node_id)
+                else:
+                    first[signature] = node_id
+        return duplicates
+
+    @property
+    def aliases(self):
+        """ return output name -> output name it is an alias of (deduplicate) """
+        self._compile()
+        aliases = {}
+        for node_id, node_ids in self._duplicates.items():
+            outputs = self._nodes[node_id].outputs
+            for duplicate in node_ids:
+                for alias, out in zip(self._nodes[duplicate].outputs, outputs):
+                    aliases[alias.map] = out.map
+        return aliases
+
+    def _estimate_runtime(self, node_id):
+        """ return the expected runtime of a node (history, then cost hint) """
+        runtime = self._runtimes.get(node_id)
+        if runtime is None:
+            runtime = self._get_node(node_id).cost
+        if runtime is None:
+            runtime = DEFAULT_NODE_COST
+        return runtime
+
+    def _update_runtime(self, node_id, runtime):
+        """ update the runtime estimate of a node with the latest measure """
+        previous = self._runtimes.get(node_id)
+        if previous is not None:
+            runtime = RUNTIME_EWMA_ALPHA * runtime + (1 - RUNTIME_EWMA_ALPHA) * previous
+        self._runtimes[node_id] = runtime
+
+    def _priorities(self):
+        """ return the estimated longest remaining path to a sink of each node """
+        priorities = {}
+        for node_ids in reversed(self._sorted_dep):
+            for node_id in node_ids:
+                downstream = [priorities[i] for i in self._dependents[node_id]]
+                priorities[node_id] = self._estimate_runtime(node_id) + max(
+                    downstream, default=0
+                )
+        return priorities
+
+    @staticmethod
+    def _input_values(node, data):
+        """ return the node input values from the data of a run """
+        values = {}
+        for inp in node.inputs_without_constants:
+            if not inp.is_kwarg or (inp.is_kwarg and inp.map in data.inputs):
+                values[inp.name] = data.read(node, inp.map)
+            else:
+                values[inp.name] = node._kwargs_default[inp.name]
+        return values
+
+    @staticmethod
+    def _save_outputs(node, res, data):
+        """ save the node results to the data of a run """
+        if len(node.outputs) == 1:
+            data.save(node, node.outputs[0].map, res)
+        else:
+            for i, out in enumerate(node.outputs):
+                data.save(node, out.map, res[i])
+
+    def _estimate_overhead(self, node_id):
+        """ return the expected cost of running a node in the pool """
+        overhead = self._offload_overheads.get(node_id)
+        if overhead is None:
+            payload_bytes = self._payload_sizes.get(node_id, 0)
+            overhead = OFFLOAD_FIXED_OVERHEAD + payload_bytes * OFFLOAD_SECONDS_PER_BYTE
+        return overhead
+
+    def _should_offload(self, node_id):
+        """ decide if a node is run in the pool or inline, with hysteresis
+
+        A node inline is moved to the pool when its runtime exceeds
+        `OFFLOAD_RATIO_HIGH` times the offload overhead, and is moved back
+        inline when it drops below `OFFLOAD_RATIO_LOW` times the overhead.
+        """
+        if not self._adaptive:
+            return True
+        ratio = self._estimate_runtime(node_id) / self._estimate_overhead(node_id)
+        offloaded = self._offloaded.get(node_id)
+        if offloaded:
+            decision = ratio >= OFFLOAD_RATIO_LOW
+        else:
+            decision = ratio > OFFLOAD_RATIO_HIGH
+        if offloaded is not None and decision != offloaded:
+            self._offload_switches[node_id] = self._offload_switches.get(node_id, 0) + 1
+            LOGGER.info(
+                "{} now runs {}".format(
+                    self._get_node(node_id), "in the pool" if decision else "inline"
+                )
+            )
+        self._offloaded[node_id] = decision
+        return decision
+
+    @property
+    def offload_report(self):
+        """ return the inline / pool decisions made for each node """
+        report = {}
+        for node_id, offloaded in self._offloaded.items():
+            report[node_id] = {
+                "function": self._get_node(node_id).fct_name,
+                "offloaded": offloaded,
+                "runtime": self._runtimes.get(node_id),
+                "overhead": self._estimate_overhead(node_id),
+                "payload_bytes": self._payload_sizes.get(node_id),
+                "switches": self._offload_switches.get(node_id, 0),
+            }
+        return report
+
+    def _batcher(self, node_id):
+        """ return the batcher of a batched node, created on first use """
+        batcher = self._batchers.get(node_id)
+        if batcher is None:
+            with self._lock:
+                batcher = self._batchers.get(node_id)
+                if batcher is None:
+                    batcher = Batcher(self._nodes[node_id])
+                    self._batchers[node_id] = batcher
+        return batcher
+
+    @property
+    def batch_report(self):
+        """ return the number of batches and calls run by each batched node """
+        return {
+            node_id: {
+                "function": self._get_node(node_id).fct_name,
+                "batches": batcher.batches,
+                "calls": batcher.calls,
+                "mean_size": batcher.calls / batcher.batches if batcher.batches else 0,
+            }
+            for node_id, batcher in self._batchers.items()
+        }
+
+    def _update_overhead(self, node_id, overhead):
+        """ update the pool overhead estimate of a node with the latest measure """
+        previous = self._offload_overheads.get(node_id)
+        if previous is not None:
+            overhead = (
+                RUNTIME_EWMA_ALPHA * overhead + (1 - RUNTIME_EWMA_ALPHA) * previous
+            )
+        self._offload_overheads[node_id] = overhead
+
+    def _checkpoint_keys(self, data):
+        """ return node id -> checkpoint key, for the data of a run
+
+        Nodes that cannot be fingerprinted (e.g. unpicklable closure or
+        input), and the nodes depending on them, have no key and are not
+        checkpointed (a warning is logged).
+        """
+        producers = {}
+        for node_id, node in self._nodes.items():
+            for o in node.outputs:
+                producers.setdefault(o.map, []).append(node_id)
+        fingerprints = {}
+        keys = {}
+
+        def source(name):
+            if name in self._providers:
+                # the objects provided are not part of the results
+                return name
+            if name in data.inputs:
+                if name not in fingerprints:
+                    fingerprints[name] = fingerprint(data.inputs[name])
+                return fingerprints[name]
+            # KeyError when an upstream node has no key
+            return "".join(keys[i] for i in producers[name]) + name
+
+        for node_ids in self._sorted_dep:
+            for node_id in node_ids:
+                node = self._get_node(node_id)
+                try:
+                    sources = {}
+                    for inp in node.inputs_without_constants:
+                        if inp.map in data.inputs or inp.map in producers:
+                            sources[inp.name] = source(inp.map)
+                        else:
+                            default = node._kwargs_default[inp.name]
+                            sources[inp.name] = fingerprint(default)
+                    selector = None
+                    if node.condition is not None:
+                        selector = source(node.condition[0])
+                    keys[node_id] = node_key(node, sources, selector)
+                except KeyError:
+                    continue
+                except PyungoError as err:
+                    LOGGER.warning("Cannot checkpoint {}: {}".format(node, err))
+        return keys
+
+    def calculate(
+        self,
+        data,
+        trace=None,
+        profile_memory=False,
+        checkpoint_dir=None,
+        priority=None,
+        outputs=None,
+    ):
+        """ run graph calculations
+
+        Args:
+            data (dict): Inputs data
+            trace (Trace): Optional `pyungo.tracing.Trace` recording the
+                timeline of the calculation
+            profile_memory (bool): Record the memory used by each node,
+                available afterwards with `memory_profile`
+            checkpoint_dir (str): Optional directory where the outputs of each
+                node are saved as soon as it completes. Nodes whose code and
+                inputs did not change since their last checkpoint are not run
+                again, their outputs are loaded instead
+            priority (int): Optional priority of the nodes submitted to the
+                graph scheduler, instead of the graph priority
+            outputs (list): Names of the intermediate outputs sent back to the
+                parent process, when the graph has `locality` (other ones are
+                not kept in `data`)
+
+        Returns:
+            The output(s) of the last node being run
+
+        Raises:
+            PyungoError: In case requested outputs are not calculated
+        """
+        recorder = self._recorder
+        if recorder is None or not recorder.sampled():
+            return self._calculate(
+                data, trace, profile_memory, checkpoint_dir, priority, outputs
+            )
+        trace = trace if trace is not None else Trace()
+        started = time.perf_counter()
+        res = self._calculate(
+            data, trace, profile_memory, checkpoint_dir, priority, outputs
+        )
+        inputs = self.data.inputs
+        recorder.record(
+            {k: inputs[k] for k in data}, started, time.perf_counter(), trace
+        )
+        return res
+
+    def _calculate(
+        self,
+        data,
+        trace,
+        profile_memory,
+        checkpoint_dir,
+        priority,
+        outputs=None,
+        incremental=None,
+    ):
+        """ run graph calculations (see `calculate`)
+
+        `incremental` maps the ids of the nodes run on appended rows only to
+        their lookback (see `append`), the data being rows appended if given.
+        """
         # make sure data is valid when using schema
         if self._schema:
             try:
@@ -365,55 +1344,53 @@ class Graph:
             jsonschema.validate(instance=data, schema=self._schema)
         t1 = dt.datetime.utcnow()
         LOGGER.info("Starting calculation...")
+        provided = self._provided()
         dt1 = dt.datetime.utcnow()
-        self._data = Data(data, do_deepcopy=self._do_deepcopy)
+        if incremental is None:
+            data = Data(data, do_deepcopy=self._do_deepcopy)
+        else:
+            data = AppendedData(
+                data, self._history, incremental, do_deepcopy=self._do_deepcopy
+            )
+        if self._bound:
+            data.bind(self._bound)
+        if provided:
+            data.bind(provided)
         dt2 = dt.datetime.utcnow()
         data_copy_time = dt2 - dt1
-        self._data.check_inputs(self.sim_inputs, self.sim_outputs, self.sim_kwargs)
-        if not self._sorted_dep:
-            self._topological_sort()
-        for items in self._sorted_dep:
-            # loading node with inputs
-            for item in items:
-                node = self._get_node(item)
-                inputs = [i for i in node.inputs_without_constants]
-                for inp in inputs:
-                    if not inp.is_kwarg or (
-                        inp.is_kwarg and inp.map in self._data._inputs
-                    ):
-                        node.set_value_to_input(inp.name, self._data[inp.map])
-                    else:
-                        node.set_value_to_input(
-                            inp.name, node._kwargs_default[inp.name]
-                        )
-
-            # running nodes
-            if self._parallel:
-                try:
-                    from multiprocess import Pool
-                except ImportError:
-                    msg = "multiprocess package is needed for parralelism"
-                    raise ImportError(msg)
-                pool = Pool(self._pool_size)
-                results = pool.map(Graph.run_node, [self._get_node(i) for i in items])
-                pool.close()
-                pool.join()
-                results = {k: v for k, v in results}
-            else:
-                results = {}
-                for item in items:
-                    node = self._get_node(item)
-                    res = node.run_with_loaded_inputs()
-                    results[node.id] = res
-            # save results
-            for item in items:
-                node = self._get_node(item)
-                res = results[node.id]
-                if len(node.outputs) == 1:
-                    self._data[node.outputs[0].map] = res
-                else:
-                    for i, out in enumerate(node.outputs):
-                        self._data[out.map] = res[i]
+        self._compile()
+        data.check_inputs(
+            self.sim_inputs, self.sim_outputs, self.sim_kwargs, self._optional_inputs(),
+        )
+        returned = None
+        if outputs is not None:
+            diff = set(outputs) - set(self.sim_outputs)
+            if diff:
+                msg = "The following outputs are not calculated by the model: {}"
+                raise PyungoError(msg.format(sorted(diff)))
+        if self._locality and incremental is None and checkpoint_dir is None:
+            returned = self._final_outputs().union(outputs or [])
+        memory = MemoryProfile() if profile_memory else None
+        self._local.data = data
+        self._data = data
+        self._local.memory_profile = memory
+        self._memory_profile = memory
+        checkpoint, keys = None, None
+        if checkpoint_dir is not None:
+            checkpoint = Checkpoint(checkpoint_dir)
+            keys = self._checkpoint_keys(data)
+        started = time.perf_counter()
+        execution = Execution(
+            self, data, trace, memory, checkpoint, keys, priority, returned
+        )
+        try:
+            res = execution.run()
+        finally:
+            for value in provided.values():
+                value.close()
+        if trace is not None:
+            nodes = len(execution.completed)
+            trace.add_calculation(started, time.perf_counter(), nodes=nodes)
         t2 = dt.datetime.utcnow()
         total_compute_time = t2 - t1
         LOGGER.info("Calculation finished in {}".format(total_compute_time))
@@ -438,3 +1415,317 @@ class Graph:
             )
 
         return res
+
+    def _provided(self):
+        """ return name -> placeholder of the objects provided to the nodes """
+        if not self._providers:
+            return {}
+        used = set(self.sim_inputs) | set(self.sim_kwargs)
+        return {
+            name: provider.provided()
+            for name, provider in self._providers.items()
+            if name in used
+        }
+
+    def provide(self, name, factory, scope="process", close=None):
+        """ provide an object to the nodes reading the `name` input
+
+        The object is not passed to `calculate`: it is created by calling
+        `factory` the first time a node reads it, once per scope, and closed
+        when the scope ends (see `pyungo.providers`):
+
+        - `process`: one object per process, the main one and each worker of
+          the pool, kept between calculations (in the workers, only when
+          the pool stays open, i.e. with a `Scheduler`)
+        - `thread`: one object per thread, kept between calculations
+        - `calculate`: one object per calculation, closed at its end (sent to
+          the workers, so it should be picklable with `dill`)
+
+        Objects of the `process` and `thread` scopes are closed with `close`,
+        or when the process exits.
+
+        Args:
+            name (str): Name of the input
+            factory (function): Called without argument to create the object
+            scope (str): `process`, `thread` or `calculate`
+            close (function): Optional function called with the object to
+                close it, its `close` method (if any) by default
+
+        Raises:
+            PyungoError: In case the scope is unknown, or the name is already
+                fixed or calculated in the model
+        """
+        if name in self._bound or name in self.sim_outputs:
+            msg = "{} is already fixed or calculated in the model".format(name)
+            raise PyungoError(msg)
+        provider = Provider(name, factory, scope=scope, close=close)
+        previous = self._providers.get(name)
+        if previous is not None:
+            previous.close()
+        self._providers = dict(self._providers)
+        self._providers[name] = provider
+
+    def close(self):
+        """ close the provided objects created in the current process """
+        for provider in self._providers.values():
+            provider.close()
+
+    def append(self, data, trace=None, profile_memory=False, priority=None):
+        """ run graph calculations on rows appended to the previous ones
+
+        Every input holds new rows (inputs that do not change should be fixed
+        with `specialize`). The inputs are the rows of all the calls to
+        `append` put together, and the results are the same as a calculation
+        on these inputs.
+
+        Nodes declared with a `lookback` whose inputs are rows (inputs, or
+        outputs of such nodes) or fixed inputs are run on the new rows and the
+        `lookback` rows before them only; their outputs are the outputs of the
+        previous call followed by the new rows. Other nodes are run on all the
+        rows. The inputs and outputs of the row-wise nodes are kept by the
+        graph between calls: `append` should not be called by several
+        threads at the same time.
+
+        Args:
+            data (dict): Inputs data (new rows of NumPy arrays, pandas objects
+                or lists)
+            trace (Trace): Optional `pyungo.tracing.Trace` (see `calculate`)
+            profile_memory (bool): Record the memory used by each node
+            priority (int): Optional priority of the nodes submitted to the
+                graph scheduler
+
+        Returns:
+            The output(s) of the last node being run, for all the rows
+        """
+        self._compile()
+        rows, row_wise = self._row_wise(data)
+        incremental = {
+            node_id: self._nodes[node_id].lookback
+            for node_id in row_wise
+            if all(
+                name in self._history
+                for name in self._rows_read(self._nodes[node_id], rows)
+            )
+            and all(o.map in self._history for o in self._nodes[node_id].outputs)
+        }
+        res = self._calculate(
+            data, trace, profile_memory, None, priority, incremental=incremental
+        )
+        data = self.data
+        self._history = {
+            name: data[name]
+            for name in rows
+            if name in data.inputs or name in data.outputs
+        }
+        last = self._sorted_dep[-1][-1] if self._sorted_dep else None
+        if res is not None and last in incremental:
+            values = tuple(data[o.map] for o in self._nodes[last].outputs)
+            res = values[0] if len(values) == 1 else values
+        return res
+
+    def _final_outputs(self):
+        """ return the names of the outputs read by no node """
+        read = {i.map for n in self._nodes.values() for i in n.inputs_without_constants}
+        return {
+            o.map for n in self._nodes.values() for o in n.outputs if o.map not in read
+        }
+
+    @staticmethod
+    def _rows_read(node, rows):
+        """ return the names of the rows read by a node """
+        return [i.map for i in node.inputs_without_constants if i.map in rows]
+
+    def _row_wise(self, data):
+        """ return the names holding rows, and the nodes that can run on rows
+
+        Names holding rows are the inputs appended and the outputs of the
+        row-wise nodes: nodes with a lookback only reading rows, or names not
+        calculated by the graph (fixed inputs, default values).
+        """
+        rows = set(data)
+        row_wise = []
+        for node_ids in self._sorted_dep:
+            for node_id in node_ids:
+                node = self._nodes[node_id]
+                if node.lookback is None:
+                    continue
+                names = [i.map for i in node.inputs_without_constants]
+                if node.condition is not None:
+                    names.append(node.condition[0])
+                if any(n not in rows and n in self._producers for n in names):
+                    continue
+                if node.condition is not None and node.condition[0] in rows:
+                    continue
+                if not self._rows_read(node, rows):
+                    continue
+                row_wise.append(node_id)
+                rows.update(o.map for o in node.outputs)
+        return rows, row_wise
+
+    def specialize(self, fixed):
+        """ return a graph where some inputs are fixed, and precalculated
+
+        Every node whose inputs only depend on the fixed inputs is run once,
+        now. The returned graph is made of the other nodes, and only takes the
+        remaining inputs: the fixed inputs and precalculated outputs it needs
+        are bound to it (shared, never copied, between its calculations).
+
+        The returned graph has the same settings, except the JSON schema (which
+        would describe all the inputs). Like any graph, it can be calculated
+        by several threads at the same time, and pickled.
+
+        Args:
+            fixed (dict): fixed input name -> value
+
+        Returns:
+            graph (Graph): The specialized graph
+
+        Raises:
+            PyungoError: In case a fixed input is not used by the model, or is
+                already fixed
+        """
+        self._compile()
+        diff = set(fixed) - set(self.sim_inputs) - set(self.sim_kwargs)
+        if diff:
+            msg = "The following fixed inputs are not used by the model: {}"
+            raise PyungoError(msg.format(sorted(diff)))
+        diff = set(fixed).intersection(self._bound)
+        if diff:
+            msg = "The following inputs are fixed in the model: {}"
+            raise PyungoError(msg.format(sorted(diff)))
+        known = set(fixed).union(self._bound)
+        evaluable = set()
+        for node_ids in self._sorted_dep:
+            for node_id in node_ids:
+                node = self._nodes[node_id]
+                reads = [i.map for i in node.inputs_without_constants]
+                if node.condition is not None:
+                    reads.append(node.condition[0])
+                if not all(name in known for name in reads):
+                    continue
+                evaluable.add(node_id)
+                # alternative branches: known once all of them are evaluated
+                for out in node.outputs:
+                    if evaluable.issuperset(self._producers[out.name]):
+                        known.add(out.map)
+        values = dict(self._bound)
+        values.update(fixed)
+        if evaluable:
+            graph = self._subgraph(evaluable)
+            used = set(graph.sim_inputs) | set(graph.sim_kwargs)
+            graph.calculate({k: v for k, v in fixed.items() if k in used})
+            values.update(graph.data.outputs)
+        graph = Graph(
+            parallel=self._parallel,
+            pool_size=self._pool_size,
+            do_deepcopy=self._do_deepcopy,
+            adaptive=self._adaptive,
+            interrupt_on_error=self._interrupt_on_error,
+            memory_budget=self._memory_budget,
+            scratch_dir=self._scratch_dir,
+            scheduler=self._scheduler,
+            priority=self._priority,
+            tenant=self._tenant,
+            resources=self._resources,
+            deduplicate=self._deduplicate,
+            locality=self._locality,
+            recorder=self._recorder,
+        )
+        graph._inputs, graph._outputs = self._inputs, self._outputs
+        graph._providers = self._providers
+        for node_id in self._nodes:
+            if node_id not in evaluable:
+                graph._link(self._nodes[node_id])
+        graph._runtimes = {i: r for i, r in self._runtimes.items() if i in graph._nodes}
+        used = set(graph.sim_inputs) | set(graph.sim_kwargs)
+        graph._bound = {k: v for k, v in values.items() if k in used}
+        return graph
+
+    def sweep(self, data, grid, outputs=None):
+        """ run the graph for every combination of the swept inputs values
+
+        Nodes that do not depend on the swept inputs are calculated only once.
+        For each point of the grid, only the affected nodes are run (in
+        parallel, one point per process, when parallelism is enabled).
+
+        Args:
+            data (dict): Inputs data that are not swept
+            grid (dict): swept input name -> list of values
+            outputs (list): Names of the outputs to collect, defaults to the
+                outputs of the last affected nodes
+
+        Returns:
+            A pandas `DataFrame` indexed by the grid points, with one column per
+            output (a dict grid point -> {output name: value} if pandas is not
+            installed)
+
+        Raises:
+            PyungoError: In case a swept input is not used by the model
+        """
+        self._compile()
+        names = list(grid)
+        diff = set(names) - set(self.sim_inputs) - set(self.sim_kwargs)
+        if diff:
+            msg = "The following swept inputs are not used by the model: {}"
+            raise PyungoError(msg.format(sorted(diff)))
+        roots = [
+            node_id
+            for node_id, node in self._nodes.items()
+            if any(i.map in grid for i in node.inputs_without_constants)
+            or (node.condition is not None and node.condition[0] in grid)
+        ]
+        affected = self._descendants(roots).union(roots)
+        if outputs is None:
+            outputs = [
+                o.map
+                for node_id, node in self._nodes.items()
+                if node_id in affected and not self._dependents[node_id]
+                for o in node.outputs
+            ]
+        shared = {k: v for k, v in data.items() if k not in grid}
+        fixed = [i for i in self._nodes if i not in affected]
+        if fixed:
+            fixed_graph = self._subgraph(fixed)
+            used = set(fixed_graph.sim_inputs) | set(fixed_graph.sim_kwargs)
+            fixed_graph.calculate({k: v for k, v in shared.items() if k in used})
+            shared.update(fixed_graph.data.outputs)
+        graph = self._subgraph(affected)
+        used = set(graph.sim_inputs) | set(graph.sim_kwargs)
+        fixed_outputs = {o: shared[o] for o in outputs if o in shared}
+        outputs_to_run = [o for o in outputs if o not in fixed_outputs]
+        shared = {k: v for k, v in shared.items() if k in used}
+        points = list(itertools.product(*grid.values()))
+        if self._parallel:
+            try:
+                from multiprocess import Pool
+            except ImportError:
+                msg = "multiprocess package is needed for parralelism"
+                raise ImportError(msg)
+            pool = Pool(
+                self._pool_size,
+                initializer=init_sweep,
+                initargs=(graph, shared, names, outputs_to_run),
+            )
+            try:
+                values = pool.map(run_point, points)
+            finally:
+                pool.terminate()
+                pool.join()
+        else:
+            values = [
+                run_point(p, graph, shared, names, outputs_to_run) for p in points
+            ]
+        rows = []
+        for point_values in values:
+            row = dict(fixed_outputs)
+            row.update(zip(outputs_to_run, point_values))
+            rows.append([row[o] for o in outputs])
+        try:
+            import pandas as pd
+        except ImportError:
+            return {p: dict(zip(outputs, row)) for p, row in zip(points, rows)}
+        if len(names) == 1:
+            index = pd.Index([p[0] for p in points], name=names[0])
+        else:
+            index = pd.MultiIndex.from_tuples(points, names=names)
+        return pd.DataFrame(rows, index=index, columns=outputs)
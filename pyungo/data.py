@@ -2,6 +2,7 @@
 from copy import deepcopy
 
 from .errors import PyungoError
+from .spill import Spilled
 
 
 class Data:
@@ -24,20 +25,48 @@ class Data:
         try:
             return self._inputs[key]
         except KeyError:
-            return self._outputs[key]
+            value = self._outputs[key]
+        if isinstance(value, Spilled):
+            return value.load()
+        return value
+
+    def bind(self, values):
+        """ add inputs fixed beforehand, shared (never copied) between runs
+
+        Raises:
+            PyungoError: In case some of these inputs are provided again
+        """
+        diff = set(values).intersection(self._inputs)
+        if diff:
+            msg = "The following inputs are fixed in the model: {}"
+            raise PyungoError(msg.format(sorted(diff)))
+        self._inputs = dict(self._inputs)
+        self._inputs.update(values)
 
     def __setitem__(self, key, val):
         self._outputs[key] = val
 
-    def check_inputs(self, sim_inputs, sim_outputs, sim_kwargs):
-        """ make sure data inputs provided are good enough """
+    def read(self, node, name):
+        """ return the value of an input read by a node """
+        return self[name]
+
+    def save(self, node, name, value):
+        """ save the value of an output of a node """
+        self[name] = value
+
+    def check_inputs(self, sim_inputs, sim_outputs, sim_kwargs, optional=()):
+        """ make sure data inputs provided are good enough
+
+        `optional` are inputs that may not be needed (read only by branches
+        of a selector), only checked when running the nodes reading them.
+        """
         data_inputs = set(self.inputs.keys())
         diff = data_inputs - (data_inputs - set(sim_outputs))
         if diff:
             msg = "The following inputs are already used in the model: {}"
             raise PyungoError(msg.format(list(diff)))
         inputs_to_provide = set(sim_inputs) - set(sim_outputs)
-        diff = inputs_to_provide - data_inputs
+        diff = inputs_to_provide - data_inputs - set(optional)
         if diff:
             msg = "The following inputs are needed: {}".format(list(diff))
             raise PyungoError(msg)
@@ -5,3 +5,87 @@ class PyungoError(Exception):
     """ pyungo custom exception """
 
     pass
+
+
+class NodeError(PyungoError):
+    """ raised when a node failed during a calculation
+
+    Use `node_error` to create one: the error raised is also an instance of
+    the type of the original error, so callers catching it keep working.
+
+    Args:
+        node_id (int): Id of the node that failed
+        fct_name (str): Name of the function attached to the node
+        error (Exception): The original error
+        completed (list): Ids of the nodes that completed
+        cancelled (list): Ids of the nodes ready to run, or running, that
+            have been cancelled
+        not_started (list): Ids of the nodes that never started
+    """
+
+    def __init__(self, node_id, fct_name, error, completed, cancelled, not_started):
+        msg = (
+            "Node {} <{}> failed: {}: {} "
+            "(completed: {}, cancelled: {}, not started: {})".format(
+                node_id,
+                fct_name,
+                type(error).__name__,
+                error,
+                len(completed),
+                len(cancelled),
+                len(not_started),
+            )
+        )
+        # not super: the original error type may take other arguments
+        Exception.__init__(self, msg)
+        self.node_id = node_id
+        self.fct_name = fct_name
+        self.error = error
+        self.completed = completed
+        self.cancelled = cancelled
+        self.not_started = not_started
+
+    def __str__(self):
+        return self.args[0]
+
+    def __reduce__(self):
+        args = (
+            self.node_id,
+            self.fct_name,
+            self.error,
+            self.completed,
+            self.cancelled,
+            self.not_started,
+        )
+        return (node_error, args)
+
+
+_NODE_ERRORS = {}
+
+
+def _node_error_type(error_type):
+    """ return a subclass of `NodeError` and of the original error type """
+    if issubclass(error_type, NodeError) or not issubclass(error_type, Exception):
+        return NodeError
+    if error_type not in _NODE_ERRORS:
+        try:
+            cls = type("NodeError", (NodeError, error_type), {})
+        except TypeError:
+            # e.g. instance lay-out conflict with some builtin errors
+            cls = NodeError
+        cls.__module__ = NodeError.__module__
+        _NODE_ERRORS[error_type] = cls
+    return _NODE_ERRORS[error_type]
+
+
+def node_error(node_id, fct_name, error, completed, cancelled, not_started):
+    """ return the `NodeError` of a failed node, also an instance of the type
+    of the original error (`ValueError`, contract errors, ...) when possible
+
+    Args:
+        see `NodeError`
+    """
+    cls = _node_error_type(type(error))
+    err = cls.__new__(cls)
+    NodeError.__init__(err, node_id, fct_name, error, completed, cancelled, not_started)
+    return err
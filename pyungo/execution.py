@@ -0,0 +1,1023 @@
+""" Execution of a graph calculation
+
+An `Execution` holds everything specific to one call of `Graph.calculate`
+(data, ready queue, running nodes, instrumentation), so the graph itself is
+never modified while calculating.
+"""
+
+import collections
+import contextlib
+import heapq
+import math
+import os
+import queue
+import threading
+import time
+
+from .errors import PyungoError, node_error
+from .memory import PeakMemory, retained_size
+from .providers import inject
+from .resident import Local, Resident, drop, fetch, references, resolve, store
+from .spill import Spiller
+
+# default number of chunks per process of the pool, for map nodes
+CHUNKS_PER_PROCESS = 4
+# environment variables limiting the threads of native libraries
+THREAD_ENV_VARS = (
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+)
+
+
+@contextlib.contextmanager
+def thread_limits(cpus):
+    """ limit the threads used by native libraries (BLAS, OpenMP) to `cpus`
+
+    The thread count environment variables are set for the block (they apply
+    to libraries loaded, and processes started, within it). Libraries already
+    loaded are limited too when `threadpoolctl` is installed.
+    """
+    cpus = max(1, int(cpus))
+    previous = {name: os.environ.get(name) for name in THREAD_ENV_VARS}
+    os.environ.update({name: str(cpus) for name in THREAD_ENV_VARS})
+    try:
+        try:
+            from threadpoolctl import threadpool_limits
+        except ImportError:
+            yield
+        else:
+            with threadpool_limits(limits=cpus):
+                yield
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def run_node(node, values, profile_memory=False, items=None):
+    """ run a node with the given input values
+
+    Args:
+        node (Node): The node to run
+        values (dict): input name -> value (see `Node.run_with_values`), the
+            objects provided by the graph being created if needed
+        profile_memory (bool): Measure the peak memory allocated by the node
+        items (list): Optional elements of the mapped input of a map node, to
+            run the node for these elements only (see `Node.run_chunk`)
+
+    Returns:
+        results (tuple): node output values, worker information (dict with
+            pid, thread, start, runtime and peak_memory)
+    """
+
+    values = inject(values)
+
+    def run():
+        if items is None:
+            return node.run_with_values(values)
+        return node.run_chunk(values, items)
+
+    peak = PeakMemory() if profile_memory else None
+    start = time.perf_counter()
+    if peak:
+        with peak:
+            res = run()
+    else:
+        res = run()
+    worker = {
+        "pid": os.getpid(),
+        "thread": threading.get_ident(),
+        "start": start,
+        "runtime": time.perf_counter() - start,
+        "peak_memory": peak.value if peak else None,
+    }
+    return res, worker
+
+
+# nodes of the graph being calculated, registered once in each worker
+_NODES = {}
+# nodes sent with the tasks of a scheduler, least recently used first
+_SHIPPED = collections.OrderedDict()
+MAX_SHIPPED_NODES = 4096
+
+
+def init_worker(nodes):
+    """ pool initializer: register the nodes of a graph in the worker
+
+    Args:
+        nodes (dict): node id -> Node
+    """
+    _NODES.clear()
+    _NODES.update(nodes)
+
+
+def _registered(key):
+    """ return the node sent with a task, None if the worker does not have it """
+    node = _SHIPPED.get(key)
+    if node is not None:
+        _SHIPPED.move_to_end(key)
+    return node
+
+
+def _register_shipped(key, node):
+    """ register a node sent with a task, evicting the least recently used
+    ones beyond `MAX_SHIPPED_NODES` (graphs of a long-lived scheduler come
+    and go)
+    """
+    _SHIPPED[key] = node
+    _SHIPPED.move_to_end(key)
+    while len(_SHIPPED) > MAX_SHIPPED_NODES:
+        _SHIPPED.popitem(last=False)
+
+
+class UnknownNode(Exception):
+    """ raised by a worker asked to run a node not registered in it
+
+    Args:
+        key: Id of the node, or key of the node sent with the tasks of a
+            scheduler (see `run_serialized_node`)
+        pid (int): Process id of the worker
+    """
+
+    def __init__(self, key, pid):
+        super(UnknownNode, self).__init__(key, pid)
+        self.key = key
+        self.pid = pid
+
+
+def run_serialized_node(payload, profile_memory=False, node=None, keep=None, key=None):
+    """ run a node registered in the worker, used for running nodes in the pool
+
+    Args:
+        payload (bytes): The node id, its input values and the elements of the
+            mapped input (None if not a map chunk) serialized with dill
+        profile_memory (bool): Measure the peak memory allocated by the node
+        node (bytes): Optional node serialized with dill, registered in the
+            worker under `key` before running it
+        keep (dict): Optional output position -> key of the outputs kept in
+            the worker (see `pyungo.resident`)
+        key (tuple): Key of the nodes sent with the tasks of a scheduler (graph
+            token and node id, node ids being only unique in the process
+            which created them). When None, the node is one of the nodes
+            registered with `init_worker`
+
+    Returns:
+        results (tuple): serialized output values, worker information (see
+            `run_node`, with the output serialization start and end times)
+
+    Raises:
+        UnknownNode: In case the node is not registered in the worker
+    """
+    import dill
+
+    node_id, values, items = dill.loads(payload)
+    if key is None:
+        node = _NODES.get(node_id)
+    else:
+        if node is not None:
+            _register_shipped(key, dill.loads(node))
+        node = _registered(key)
+    if node is None:
+        raise UnknownNode(node_id if key is None else key, os.getpid())
+    values = resolve(values)
+    cpus = node.resources.get("cpus")
+    if cpus is None:
+        res, worker = run_node(node, values, profile_memory, items)
+    else:
+        with thread_limits(cpus):
+            res, worker = run_node(node, values, profile_memory, items)
+    if keep:
+        res = store(res, len(node.outputs), keep)
+    dump_start = time.perf_counter()
+    payload = dill.dumps(res)
+    worker["serialization"] = (dump_start, time.perf_counter())
+    return payload, worker
+
+
+class Execution:
+    """ State of one graph calculation
+
+    Nodes are run as soon as their dependencies are resolved. Ready nodes
+    are submitted by decreasing longest remaining path (critical path first),
+    so long chains start as early as possible when there are more ready nodes
+    than processes in the pool.
+
+    As soon as a node fails, no other node is started. Nodes running in the
+    pool are interrupted when the graph `interrupt_on_error` is set, otherwise
+    they are waited for.
+
+    A node only starts when the resources it needs (`cpus`, `memory`, named
+    resources) are available, given what the nodes running already use.
+    Nodes run inline do not use the `cpus` of the pool.
+
+    When the graph has a `Scheduler`, nodes are submitted to its shared pool
+    (with the priority of the calculation) instead of a pool of its own. On
+    failure, the tasks not started yet are cancelled and the running ones
+    are waited for.
+
+    When the graph has a `memory_budget`, intermediate data exceeding it are
+    spilled to files, starting with the ones needed the latest.
+
+    Map nodes run in the pool are split in chunks of elements, submitted as
+    separate tasks, and their results are gathered once all chunks are done.
+
+    Duplicate nodes found by the graph (`deduplicate`) are not run: they
+    complete with the results of the node they duplicate.
+
+    Batched nodes are run inline, by the batcher of the graph, together with
+    the calls of the other calculations: they complete like tasks of the pool,
+    so the calculation goes on with other nodes while they wait.
+
+    When the graph has `locality`, each process of the pool is a pool of its
+    own. The outputs of the nodes run in the pool stay in the process that
+    calculated them (except the `returned` ones), the data only holding
+    `Resident` references. A node is run, among the idle processes, by the
+    one holding the most bytes of its inputs; the inputs held by other
+    processes, or read by nodes run inline, are fetched through the parent
+    process. Values are dropped from the processes once no node reads them.
+
+    When the graph has branch nodes, a node is only run when it is needed:
+    branches of another selector value are skipped, as well as the nodes
+    only feeding them. Nodes whose need depends on a selector not calculated
+    yet are parked until it is.
+
+    Args:
+        graph (Graph): The graph being calculated
+        data (Data): The data of the run, where results are saved
+        trace (Trace): Optional trace where nodes runs are recorded
+        memory (MemoryProfile): Optional profile where memory usage is recorded
+        checkpoint (Checkpoint): Optional checkpoint where nodes outputs are
+            saved, and loaded back instead of running nodes already run
+        keys (dict): node id -> checkpoint key, needed with `checkpoint`
+        priority (int): Priority of the tasks submitted to the graph scheduler
+        returned (set): Names of the outputs sent back to the parent process
+            when the graph has `locality` (None to send back all outputs)
+    """
+
+    def __init__(
+        self,
+        graph,
+        data,
+        trace=None,
+        memory=None,
+        checkpoint=None,
+        keys=None,
+        priority=None,
+        returned=None,
+    ):
+        self._graph = graph
+        self._scheduler = graph._scheduler
+        self._priority = graph._priority if priority is None else priority
+        self._slots = graph._pool_size
+        if self._scheduler is not None:
+            self._slots = self._scheduler.max_concurrency
+        self._capacity = dict(graph._resources)
+        self._capacity.setdefault("cpus", self._slots)
+        self._in_use = collections.Counter()
+        self._held = {}
+        self._backlog = collections.deque()
+        for node in graph._nodes.values():
+            self._requirements(node, graph._parallel)
+        self._data = data
+        self._trace = trace
+        self._memory = memory
+        self._checkpoint = checkpoint
+        self._keys = keys
+        self._started = time.perf_counter()
+        self._priorities = graph._priorities()
+        self._waiting_for = {node_id: 0 for node_id in graph._nodes}
+        for node_ids in graph._dependents.values():
+            for node_id in node_ids:
+                self._waiting_for[node_id] += 1
+        self._aliased = {i for ids in graph._duplicates.values() for i in ids}
+        self._ready = []
+        self._ready_at = {}
+        for node_id, n in self._waiting_for.items():
+            if n == 0:
+                self._push(node_id, self._started)
+        self._serialization = {}
+        self._pid, self._thread = os.getpid(), threading.get_ident()
+        self._pool = None
+        self._dill = None
+        self._locality = (
+            returned is not None and graph._parallel and self._scheduler is None
+        )
+        self._workers = []
+        self._running_on = []
+        self._placed = {}
+        self._residents = {}
+        self._resident_names = {}
+        if self._locality:
+            self._returned = set(returned).union(
+                n.condition[0] for n in graph._nodes.values() if n.condition
+            )
+        self._finished = queue.Queue()
+        self._submitted = {}
+        self._batched = set()
+        self._gathering = {}
+        self._last = graph._sorted_dep[-1][-1] if graph._sorted_dep else None
+        self._spiller = None
+        if graph._memory_budget is not None:
+            self._spiller = Spiller(graph._memory_budget, graph._scratch_dir)
+            self._levels = {
+                node_id: level
+                for level, node_ids in enumerate(graph._sorted_dep)
+                for node_id in node_ids
+            }
+        self._consumers = None
+        if self._spiller is not None or self._locality:
+            self._consumers = {}
+            for node_id, node in graph._nodes.items():
+                for inp in node.inputs_without_constants:
+                    self._consumers.setdefault(inp.map, set()).add(node_id)
+        self._needs = None
+        if graph._conditional:
+            self._needs = {}
+            self._parked = set()
+            self._selectors = {}
+            self._selector_names = {
+                n.condition[0] for n in graph._nodes.values() if n.condition
+            }
+            self._selector_nodes = {
+                node_id
+                for node_id, node in graph._nodes.items()
+                if self._selector_names.intersection(o.map for o in node.outputs)
+            }
+            for name in self._selector_names.intersection(data.inputs):
+                self._selectors[name] = data[name]
+            self._update_needs()
+        self.completed = []
+        self.skipped = []
+        self.result = None
+
+    def _update_needs(self):
+        """ decide which nodes are needed, with the selectors known so far
+
+        A node is needed when it produces a selector, or is a sink, or feeds a
+        needed node, and when its condition (if any) holds. Duplicate nodes
+        are needed when one of them is. Undecided nodes are left out of
+        `_needs`.
+        """
+        graph = self._graph
+        for node_ids in reversed(graph._sorted_dep):
+            needs = {}
+            for node_id in node_ids:
+                if self._needs.get(node_id) is not None:
+                    continue
+                dependents = graph._dependents[node_id]
+                if node_id in self._selector_nodes or not dependents:
+                    need = True
+                else:
+                    states = [self._needs.get(i) for i in dependents]
+                    if True in states:
+                        need = True
+                    elif all(state is False for state in states):
+                        need = False
+                    else:
+                        need = None
+                condition = graph._get_node(node_id).condition
+                if need is not False and condition is not None:
+                    name, value = condition
+                    if name not in self._selectors:
+                        need = None
+                    elif self._selectors[name] != value:
+                        need = False
+                needs[node_id] = need
+            for node_id, duplicates in graph._duplicates.items():
+                if node_id not in needs:
+                    continue
+                group = [node_id] + duplicates
+                states = [needs.get(i, self._needs.get(i)) for i in group]
+                if True in states:
+                    need = True
+                elif all(state is False for state in states):
+                    need = False
+                else:
+                    need = None
+                needs.update((i, need) for i in group)
+            self._needs.update((i, n) for i, n in needs.items() if n is not None)
+
+    def _resolve(self, name, now):
+        """ record the value of a selector, and run or skip the parked nodes """
+        self._selectors[name] = self._data[name]
+        self._update_needs()
+        for node_id in [i for i in self._parked if i in self._needs]:
+            self._parked.discard(node_id)
+            if self._needs[node_id]:
+                self._push(node_id, now)
+            else:
+                self._skip(node_id, now)
+
+    def _skip(self, node_id, now):
+        """ skip a node not needed, and release its dependents """
+        self.skipped.append(node_id)
+        if self._consumers is not None:
+            for inp in self._graph._get_node(node_id).inputs_without_constants:
+                self._consumers[inp.map].discard(node_id)
+                self._unread(inp.map)
+        self._release(node_id, now)
+        for duplicate in self._graph._duplicates.get(node_id, []):
+            self._skip(duplicate, now)
+
+    def _release(self, node_id, now):
+        """ push the dependents of a node to the ready queue once resolved """
+        for child in self._graph._dependents[node_id]:
+            self._waiting_for[child] -= 1
+            if not self._waiting_for[child]:
+                self._push(child, now)
+
+    def _missing(self, node):
+        """ return the node inputs produced by none of the selected branches """
+        missing = []
+        for inp in node.inputs_without_constants:
+            if inp.is_kwarg:
+                continue
+            try:
+                self._data[inp.map]
+            except KeyError:
+                missing.append(inp.map)
+        return missing
+
+    def _requirements(self, node, offload):
+        """ return the resources needed to run a node
+
+        Raises:
+            PyungoError: In case the node needs resources the graph does not have
+        """
+        required = dict(node.resources)
+        if offload:
+            required.setdefault("cpus", 1)
+        else:
+            required.pop("cpus", None)
+        for name, amount in list(required.items()):
+            if name not in self._capacity:
+                if name == "memory":
+                    del required[name]
+                    continue
+                msg = "{} needs resource {} not provided by the graph"
+                raise PyungoError(msg.format(node, name))
+            if amount > self._capacity[name]:
+                msg = "{} needs {} {}, the graph only has {}"
+                raise PyungoError(msg.format(node, amount, name, self._capacity[name]))
+        return required
+
+    def _fits(self, required):
+        """ return True if the resources are available """
+        return all(
+            self._in_use[name] + amount <= self._capacity[name]
+            for name, amount in required.items()
+        )
+
+    def _acquire(self, key, required):
+        self._in_use.update(required)
+        self._held[key] = required
+
+    def _free(self, key):
+        self._in_use.subtract(self._held.pop(key, {}))
+
+    def _push(self, node_id, now):
+        """ add a node to the ready queue (unless a duplicate of another one) """
+        if node_id in self._aliased:
+            return
+        heapq.heappush(self._ready, (-self._priorities[node_id], node_id))
+        self._ready_at[node_id] = now
+
+    def _open_pool(self):
+        """ create the pool of processes used to run nodes in parallel
+
+        The nodes are sent once to each process, so tasks only carry a node
+        id and its input values.
+        """
+        try:
+            from multiprocess import Pool
+            import dill
+        except ImportError:
+            msg = "multiprocess package is needed for parralelism"
+            raise ImportError(msg)
+        self._dill = dill
+        if self._scheduler is not None:
+            return
+        if self._locality:
+            # a pool per process, to choose the process running each node
+            self._workers = [
+                Pool(1, initializer=init_worker, initargs=(self._graph._nodes,))
+                for _ in range(self._graph._pool_size)
+            ]
+            self._running_on = [0] * len(self._workers)
+            return
+        self._pool = Pool(
+            self._graph._pool_size,
+            initializer=init_worker,
+            initargs=(self._graph._nodes,),
+        )
+
+    @property
+    def _pools(self):
+        """ return the pools of processes opened by the calculation """
+        return [self._pool] if self._pool is not None else self._workers
+
+    def _next_use(self, name):
+        """ return the level of the next node reading a data """
+        consumers = self._consumers.get(name)
+        if not consumers:
+            return float("inf")
+        return min(self._levels[i] for i in consumers)
+
+    def run(self):
+        """ run the calculation
+
+        Returns:
+            The output values of the last node of the graph
+
+        Raises:
+            NodeError: In case a node failed
+        """
+        graph = self._graph
+        if graph._parallel:
+            self._open_pool()
+        failure = None
+        interrupted = False
+        cancelled = []
+        try:
+            while (self._ready or self._submitted) and failure is None:
+                failure = self._run_ready()
+                if self._submitted and failure is None:
+                    failure = self._receive()
+            if failure is not None:
+                # the chunks waiting for resources are not submitted anymore
+                cancelled.extend(node_id for node_id, *_ in self._backlog)
+                self._backlog.clear()
+            if failure is not None and self._scheduler is not None:
+                for key in self._scheduler.cancel(self):
+                    del self._submitted[key]
+                    cancelled.append(key[0])
+                while self._submitted:
+                    self._receive()
+            elif failure is not None and self._submitted:
+                if graph._interrupt_on_error:
+                    for pool in self._pools:
+                        pool.terminate()
+                    interrupted = True
+                else:
+                    while self._submitted:
+                        self._receive()
+        finally:
+            for pool in self._pools:
+                if failure is None and not self._submitted:
+                    pool.close()
+                else:
+                    pool.terminate()
+                pool.join()
+            if self._locality:
+                # the values kept in the processes are gone
+                outputs = self._data.outputs
+                for name in [n for n, v in outputs.items() if isinstance(v, Resident)]:
+                    del outputs[name]
+            if self._spiller is not None:
+                self._spiller.close(self._data)
+        if failure is not None:
+            node_id, err = failure
+            cancelled.extend(i for _, i in self._ready)
+            if interrupted:
+                cancelled.extend(i for i, _ in self._submitted)
+            # a node is listed once, even if several of its chunks are
+            cancelled = [i for i in dict.fromkeys(cancelled) if i != node_id]
+            raise node_error(
+                node_id,
+                graph._get_node(node_id).fct_name,
+                err,
+                completed=list(self.completed),
+                cancelled=cancelled,
+                not_started=[
+                    i
+                    for i in graph._nodes
+                    if i not in self.completed
+                    and i not in self.skipped
+                    and i not in cancelled
+                    and i != node_id
+                ],
+            ) from err
+        return self.result
+
+    def _run_ready(self):
+        """ run inline, or submit to the pool, the nodes ready to run
+
+        Returns:
+            failure (tuple): node id and error if a node run inline failed
+        """
+        graph = self._graph
+        parallel = self._dill is not None
+        deferred = []
+        failure = None
+        while self._ready:
+            item = heapq.heappop(self._ready)
+            node_id = item[1]
+            if self._needs is not None:
+                need = self._needs.get(node_id)
+                if need is None:
+                    self._parked.add(node_id)
+                    continue
+                if not need:
+                    self._skip(node_id, time.perf_counter())
+                    continue
+                missing = self._missing(graph._get_node(node_id))
+                if missing:
+                    # inputs read only by branches are not checked beforehand
+                    inputs = sorted(set(missing) - set(graph.sim_outputs))
+                    msg = "No branch selected for {} ({})".format(
+                        missing, self._selectors
+                    )
+                    if inputs:
+                        msg = "The following inputs are needed: {}".format(inputs)
+                    failure = (node_id, PyungoError(msg))
+                    break
+            if self._checkpoint is not None and node_id in self._keys:
+                found, res = self._checkpoint.load(
+                    graph._get_node(node_id), self._keys[node_id]
+                )
+                if found:
+                    self._done(node_id, res, None)
+                    continue
+            node = graph._get_node(node_id)
+            offload = (
+                parallel and node.batch_size is None and graph._should_offload(node_id)
+            )
+            required = self._requirements(node, offload)
+            if not self._fits(required):
+                deferred.append(item)
+                continue
+            values = graph._input_values(node, self._data)
+            if offload and node.map_over is None:
+                self._acquire((node_id, None), required)
+                self._submit(node_id, None, (node_id, values, None))
+                continue
+            values = self._load(values)
+            if offload:
+                if self._scatter(node, values, required):
+                    continue
+                required = self._requirements(node, False)
+            self._acquire((node_id, None), required)
+            if node.batch_size is not None:
+                self._batch(node_id, values)
+                continue
+            try:
+                res, worker = run_node(node, values, self._memory is not None)
+            except Exception as err:
+                failure = (node_id, err)
+                break
+            finally:
+                self._free((node_id, None))
+            if parallel and node_id not in graph._payload_sizes:
+                task, dumps = (node_id, values, None), self._dill.dumps
+                graph._payload_sizes[node_id] = len(dumps(task)) + len(dumps(res))
+            self._done(node_id, res, worker)
+        for item in deferred:
+            heapq.heappush(self._ready, item)
+        return failure
+
+    def _batch(self, node_id, values):
+        """ queue a call to a batched node, completed like a task of the pool """
+        key = (node_id, None)
+        self._batched.add(key)
+        self._submitted[key] = time.perf_counter()
+
+        def callback(result):
+            self._finished.put((key, result, time.perf_counter()))
+
+        def error_callback(error):
+            self._finished.put((key, error, None))
+
+        self._graph._batcher(node_id).submit(values, callback, error_callback)
+
+    def _submit(self, node_id, chunk, task):
+        """ submit a task to the pool
+
+        Args:
+            node_id (int): Id of the node
+            chunk (int): Index of the chunk for a map node, None otherwise
+            task (tuple): node id, input values, elements of the chunk
+        """
+        key = (node_id, chunk)
+        if self._locality:
+            worker, task, keep = self._place(task)
+        self._submitted[key] = t1 = time.perf_counter()
+        payload = self._dill.dumps(task)
+        if chunk is None:
+            self._graph._payload_sizes[node_id] = len(payload)
+        if self._trace is not None:
+            step = ("serialize inputs", self._pid, self._thread)
+            self._serialization[key] = [step + (t1, time.perf_counter())]
+
+        def callback(result):
+            self._finished.put((key, result, time.perf_counter()))
+
+        def error_callback(error):
+            self._finished.put((key, error, None))
+
+        if self._scheduler is not None:
+            self._scheduler.submit(
+                self._graph._get_node(node_id),
+                payload,
+                callback,
+                error_callback,
+                profile_memory=self._memory is not None,
+                resources=self._held[key],
+                priority=self._priority,
+                tenant=self._graph._tenant,
+                owner=self,
+                key=key,
+                graph=self._graph._token,
+            )
+            return
+        if self._locality:
+            self._placed[key] = worker
+            self._running_on[worker] += 1
+            self._workers[worker].apply_async(
+                run_serialized_node,
+                (payload, self._memory is not None, None, keep),
+                callback=callback,
+                error_callback=error_callback,
+            )
+            return
+        self._pool.apply_async(
+            run_serialized_node,
+            (payload, self._memory is not None),
+            callback=callback,
+            error_callback=error_callback,
+        )
+
+    def _place(self, task):
+        """ choose the process running a task, preferably holding its inputs
+
+        Returns:
+            placement (tuple): index of the process, task to submit to it (the
+                inputs it holds being referenced, the other ones fetched),
+                output position -> key of the outputs it should keep
+        """
+        node_id, values, items = task
+        held = [0] * len(self._workers)
+        for value in values.values():
+            if isinstance(value, Resident):
+                held[value.worker] += value.size
+        idle = [i for i, n in enumerate(self._running_on) if not n]
+        worker = max(
+            idle or range(len(self._workers)),
+            key=lambda i: (held[i], -self._running_on[i]),
+        )
+        values = {
+            name: (Local(v.key) if v.worker == worker else self._fetch(v))
+            if isinstance(v, Resident)
+            else v
+            for name, v in values.items()
+        }
+        keep = {}
+        if items is None:
+            outputs = self._graph._get_node(node_id).outputs
+            keep = {
+                i: o.map for i, o in enumerate(outputs) if o.map not in self._returned
+            }
+        return worker, (node_id, values, items), keep
+
+    def _fetch(self, resident):
+        """ return a value kept in a process, waiting for the process if busy
+
+        The value is then kept by the parent process too.
+        """
+        value = self._dill.loads(
+            self._workers[resident.worker].apply(fetch, (resident.key,))
+        )
+        outputs = self._data.outputs
+        for name in self._residents.get(resident.key, (None, ()))[1]:
+            if outputs.get(name) is resident:
+                outputs[name] = value
+        return value
+
+    def _load(self, values):
+        """ return input values, the values kept in processes being fetched """
+        if not self._locality:
+            return values
+        return {
+            name: self._fetch(v) if isinstance(v, Resident) else v
+            for name, v in values.items()
+        }
+
+    def _returned_values(self, node, res):
+        """ return the results of a node, the outputs sent back being fetched
+
+        Needed for duplicates of a node whose outputs are kept in a process.
+        """
+        count = len(node.outputs)
+        values = [res] if count == 1 else list(res)
+        fetched = False
+        for i, out in enumerate(node.outputs):
+            if out.map in self._returned and isinstance(values[i], Resident):
+                values[i] = self._fetch(values[i])
+                fetched = True
+        if not fetched:
+            return res
+        return values[0] if count == 1 else tuple(values)
+
+    def _unread(self, name):
+        """ drop a value kept in a process once no node reads it anymore """
+        key = self._resident_names.get(name)
+        if key is None or self._consumers.get(name):
+            return
+        del self._resident_names[name]
+        resident, names = self._residents[key]
+        names.discard(name)
+        if not names:
+            del self._residents[key]
+            self._workers[resident.worker].apply_async(drop, ([key],))
+
+    def _scatter(self, node, values, required):
+        """ submit a map node to the pool, in chunks of its mapped input
+
+        Each chunk needs the node resources: the chunks which do not fit are
+        kept in a backlog, and submitted as soon as other chunks complete.
+
+        Returns:
+            submitted (bool): False if there is no element to map over
+        """
+        items = list(values[node.map_over])
+        if not items:
+            return False
+        size = node.chunk_size or math.ceil(
+            len(items) / (self._slots * CHUNKS_PER_PROCESS)
+        )
+        common = {k: v for k, v in values.items() if k != node.map_over}
+        chunks = range(0, len(items), size)
+        self._gathering[node.id] = [len(chunks), [None] * len(chunks)]
+        for i, start in enumerate(chunks):
+            task = (node.id, common, items[start : start + size])
+            self._backlog.append((node.id, i, task, required))
+        self._submit_backlog()
+        return True
+
+    def _submit_backlog(self):
+        """ submit the chunks waiting for resources, in order """
+        while self._backlog and self._fits(self._backlog[0][3]):
+            node_id, chunk, task, required = self._backlog.popleft()
+            self._acquire((node_id, chunk), required)
+            self._submit(node_id, chunk, task)
+
+    def _receive(self):
+        """ wait for a task run in the pool, or a batched call, to finish
+
+        Returns:
+            failure (tuple): node id and error if the node failed
+        """
+        graph = self._graph
+        key, item, received = self._finished.get()
+        submitted = self._submitted.pop(key)
+        node_id, chunk = key
+        self._free(key)
+        placed = self._placed.pop(key, None)
+        if placed is not None:
+            self._running_on[placed] -= 1
+        if isinstance(item, BaseException):
+            return node_id, item
+        self._submit_backlog()
+        if key in self._batched:
+            self._batched.discard(key)
+            res, worker = item
+            self._done(node_id, res, worker)
+            return None
+        payload, worker = item
+        t1 = time.perf_counter()
+        res = self._dill.loads(payload)
+        t2 = time.perf_counter()
+        if placed is not None and chunk is None:
+            count = len(graph._get_node(node_id).outputs)
+            for resident in references(res, count):
+                resident.worker = placed
+        if self._trace is not None:
+            steps = self._serialization.setdefault(key, [])
+            steps.append(
+                ("serialize outputs", worker["pid"], worker["thread"])
+                + worker["serialization"]
+            )
+            steps.append(("deserialize outputs", self._pid, self._thread, t1, t2))
+        if chunk is not None:
+            return self._gather(node_id, chunk, res, worker)
+        graph._payload_sizes[node_id] += len(payload)
+        graph._update_overhead(
+            node_id, received - submitted - worker["runtime"] + t2 - t1
+        )
+        self._done(node_id, res, worker)
+
+    def _gather(self, node_id, chunk, res, worker):
+        """ save the results of a chunk, and complete the map node once all are
+
+        Returns:
+            failure (tuple): node id and error if the results cannot be gathered
+        """
+        node = self._graph._get_node(node_id)
+        gathering = self._gathering[node_id]
+        gathering[0] -= 1
+        gathering[1][chunk] = (res, worker)
+        if self._trace is not None:
+            start = worker["start"]
+            self._trace.add_node(
+                node_id,
+                "{}[{}]".format(node.fct_name, chunk),
+                self._ready_at[node_id],
+                start,
+                start + worker["runtime"],
+                worker["pid"],
+                worker["thread"],
+                self._serialization.pop((node_id, chunk), None),
+                chunk=chunk,
+                elements=len(res),
+                peak_memory=worker["peak_memory"],
+            )
+        if gathering[0]:
+            return None
+        del self._gathering[node_id]
+        parts = gathering[1]
+        try:
+            res = node.gather([r for results, _ in parts for r in results])
+        except Exception as err:
+            return node_id, err
+        peaks = [w["peak_memory"] for _, w in parts if w["peak_memory"] is not None]
+        worker = {
+            "pid": self._pid,
+            "thread": self._thread,
+            "start": min(w["start"] for _, w in parts),
+            "runtime": sum(w["runtime"] for _, w in parts),
+            "peak_memory": max(peaks) if peaks else None,
+            "chunks": len(parts),
+        }
+        self._done(node_id, res, worker)
+
+    def _done(self, node_id, res, worker):
+        """ save the results of a node and release its dependents
+
+        `worker` is None when the results are loaded from a checkpoint.
+        """
+        graph = self._graph
+        node = graph._get_node(node_id)
+        if self._locality:
+            res = self._returned_values(node, res)
+        graph._save_outputs(node, res, self._data)
+        self.completed.append(node_id)
+        if self._locality:
+            for out in node.outputs:
+                value = self._data.outputs.get(out.map)
+                if isinstance(value, Resident):
+                    names = self._residents.setdefault(value.key, (value, set()))[1]
+                    names.add(out.map)
+                    self._resident_names[out.map] = value.key
+        if node_id == self._last or (
+            self._needs is not None
+            and graph._alternatives(node, graph._get_node(self._last))
+        ):
+            self.result = res
+        now = time.perf_counter()
+        self._release(node_id, now)
+        if self._needs is not None:
+            for out in node.outputs:
+                if out.map in self._selector_names:
+                    self._resolve(out.map, now)
+        for duplicate in graph._duplicates.get(node_id, []):
+            self._done(duplicate, res, None)
+        if self._memory is not None:
+            outputs = {o.map: self._data[o.map] for o in node.outputs}
+            peak = worker["peak_memory"] if worker else None
+            live = self._memory.add_node(node_id, node.fct_name, peak, outputs)
+        if self._consumers is not None:
+            for inp in node.inputs_without_constants:
+                self._consumers[inp.map].discard(node_id)
+                self._unread(inp.map)
+        if self._spiller is not None:
+            for out in node.outputs:
+                self._spiller.add(out.map, retained_size(self._data.outputs[out.map]))
+            released = self._spiller.spill(self._data, self._next_use)
+            if released and self._memory is not None:
+                self._memory.release(released)
+                live = self._memory.live
+        if self._memory is not None and self._trace is not None:
+            self._trace.add_counter("live intermediate data", now, bytes=live)
+        if worker is None:
+            return
+        graph._update_runtime(node_id, worker["runtime"])
+        if self._checkpoint is not None and node_id in self._keys:
+            self._checkpoint.save(node, self._keys[node_id], res)
+        if self._trace is not None and "chunks" not in worker:
+            start = worker["start"]
+            self._trace.add_node(
+                node_id,
+                node.fct_name,
+                self._ready_at[node_id],
+                start,
+                start + worker["runtime"],
+                worker["pid"],
+                worker["thread"],
+                self._serialization.pop((node_id, None), None),
+                waiting_for_inputs=self._ready_at[node_id] - self._started,
+                peak_memory=worker["peak_memory"],
+            )
@@ -2,6 +2,7 @@
 
 Inputs / Outputs objects used to represent functions inputs / outputs
 """
+import sys
 
 
 class _IO(object):
@@ -13,14 +14,19 @@ class _IO(object):
             in the data inputs / outputs
         meta (dict): Not used yet
         contract (str): Optional contract rule used by pycontracts
+
+    Names are interned: graphs with many nodes reading the same data share
+    the name strings.
     """
 
+    __slots__ = ("_name", "_map", "_meta", "_value", "_contract")
+
     def __init__(self, name, map=None, meta=None, contract=None):
-        self._name = name
-        self._meta = meta if meta is not None else {}
+        self._name = sys.intern(name)
+        self._meta = meta
         self._value = None
         self._contract = None
-        self._map = map if map else self._name
+        self._map = sys.intern(map) if map else self._name
         if contract:
             try:
                 from contracts.main import parse_contract_string
@@ -47,9 +53,13 @@ class _IO(object):
     @value.setter
     def value(self, x):
         """ When setting a value, we check the contract when applicable """
+        self.check(x)
+        self._value = x
+
+    def check(self, x):
+        """ check the contract against a value without storing it """
         if self._contract:
             self._contract.check(x)
-        self._value = x
 
 
 class Input(_IO):
@@ -63,6 +73,8 @@ class Input(_IO):
         contract (str): Optional contract rule used by pycontracts
     """
 
+    __slots__ = ("is_arg", "is_kwarg", "is_constant")
+
     def __init__(self, name, map=None, meta=None, contract=None):
         super(Input, self).__init__(name, map, meta, contract)
         self.is_arg = False
@@ -83,7 +95,7 @@ class Input(_IO):
             value: The defined constant value, can be anything
             meta (dict): Not used yet
         """
-        me = cls(name, meta)
+        me = cls(name, meta=meta)
         me.value = value
         me.is_constant = True
         return me
@@ -96,7 +108,7 @@ class Input(_IO):
             name (str): The variable name of the input / output
             meta (dict): Not used yet
         """
-        me = cls(name, meta)
+        me = cls(name, meta=meta)
         me.is_arg = True
         return me
 
@@ -108,7 +120,7 @@ class Input(_IO):
             name (str): The variable name of the input / output
             meta (dict): Not used yet
         """
-        me = cls(name, meta)
+        me = cls(name, meta=meta)
         me.is_kwarg = True
         return me
 
@@ -124,6 +136,8 @@ class Output(_IO):
         contract (str): Optional contract rule used by pycontracts
     """
 
+    __slots__ = ()
+
     def __repr__(self):
         return "<{} value={}>".format(self._name, self.value)
 
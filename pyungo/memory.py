@@ -0,0 +1,181 @@
+""" Memory profiling of graph calculations
+
+Peak memory allocated by each node (using `tracemalloc`), retained size of
+the outputs and total of the intermediate data kept during a calculation.
+"""
+
+import sys
+import threading
+import time
+import tracemalloc
+
+
+def retained_size(obj):
+    """ return an estimate of the memory (in bytes) retained by an object
+
+    NumPy arrays and pandas objects report their buffers size; containers
+    are walked recursively, and objects referenced several times are
+    counted once.
+    """
+    seen = set()
+
+    def size(o):
+        if id(o) in seen:
+            return 0
+        seen.add(id(o))
+        memory_usage = getattr(o, "memory_usage", None)
+        if memory_usage is not None and hasattr(o, "index"):
+            # pandas Series / DataFrame
+            usage = memory_usage(index=True, deep=True)
+            return int(getattr(usage, "sum", lambda: usage)())
+        nbytes = getattr(o, "nbytes", None)
+        if isinstance(nbytes, int):
+            # NumPy array: count the array owning the buffer, unless the
+            # buffer is not owned by NumPy (e.g. memory-mapped file)
+            owner = o
+            while hasattr(getattr(owner, "base", None), "dtype"):
+                owner = owner.base
+            if getattr(owner, "base", None) is not None or id(owner) in seen - {id(o)}:
+                return sys.getsizeof(o)
+            seen.add(id(owner))
+            return max(owner.nbytes, sys.getsizeof(o))
+        res = sys.getsizeof(o)
+        if isinstance(o, dict):
+            res += sum(size(k) + size(v) for k, v in o.items())
+        elif isinstance(o, (list, tuple, set, frozenset)):
+            res += sum(size(i) for i in o)
+        return res
+
+    return size(obj)
+
+
+# tracemalloc state is process-wide: measurements are serialized and tracing,
+# when started here, is stopped by the last one
+_LOCK = threading.RLock()
+_TRACING = {"depth": 0, "started": False}
+
+
+class PeakMemory:
+    """ context manager measuring the peak memory allocated within a block
+
+    Measurements of the threads of a process run one at a time: a block
+    waits for the ones measured in other threads to end. A measurement
+    nested in another one (same thread) includes the peak of the enclosing
+    block before it.
+
+    Example:
+        with PeakMemory() as peak:
+            run()
+        peak.value  # bytes
+    """
+
+    def __init__(self):
+        self.value = None
+        self._baseline = 0
+
+    def __enter__(self):
+        _LOCK.acquire()
+        if _TRACING["depth"] == 0:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                _TRACING["started"] = True
+            elif hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+            else:
+                tracemalloc.stop()
+                tracemalloc.start()
+        _TRACING["depth"] += 1
+        self._baseline = tracemalloc.get_traced_memory()[0]
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            self.value = max(0, tracemalloc.get_traced_memory()[1] - self._baseline)
+            _TRACING["depth"] -= 1
+            if _TRACING["depth"] == 0 and _TRACING["started"]:
+                tracemalloc.stop()
+                _TRACING["started"] = False
+        finally:
+            _LOCK.release()
+
+
+class MemoryProfile:
+    """ memory used by the nodes of a graph calculation
+
+    Peak memory is measured with `tracemalloc`, in the process running the
+    node. Profiled nodes running in threads of the same process (e.g.
+    concurrent calculations) run one at a time (see `PeakMemory`).
+    """
+
+    def __init__(self):
+        self._nodes = {}
+        self._timeline = []
+        self._live = 0
+        self._lock = threading.Lock()
+
+    @property
+    def nodes(self):
+        """ return node id -> dict with function name, peak and output sizes """
+        with self._lock:
+            return dict(self._nodes)
+
+    @property
+    def timeline(self):
+        """ return a list of (time, bytes) of live intermediate data """
+        with self._lock:
+            return list(self._timeline)
+
+    @property
+    def live(self):
+        """ return the size (in bytes) of the intermediate data kept """
+        return self._live
+
+    @property
+    def peak_live(self):
+        """ return the maximum size (in bytes) of intermediate data kept """
+        with self._lock:
+            return max([b for _, b in self._timeline], default=0)
+
+    def add_node(self, node_id, fct_name, peak, outputs):
+        """ record the memory used by a node
+
+        Args:
+            node_id (int): Id of the node
+            fct_name (str): Name of the function attached to the node
+            peak (int): Peak memory allocated while running the function
+            outputs (dict): output name -> value saved to the data
+
+        Returns:
+            live (int): size of the intermediate data kept after the node
+        """
+        sizes = {name: retained_size(value) for name, value in outputs.items()}
+        with self._lock:
+            self._nodes[node_id] = {
+                "function": fct_name,
+                "peak": peak,
+                "outputs": sizes,
+            }
+            self._live += sum(sizes.values())
+            self._timeline.append((time.perf_counter(), self._live))
+            return self._live
+
+    def release(self, nbytes):
+        """ record intermediate data no longer kept in memory (e.g. spilled)
+
+        Args:
+            nbytes (int): size (in bytes) of the data released
+        """
+        with self._lock:
+            self._live -= nbytes
+            self._timeline.append((time.perf_counter(), self._live))
+
+    def top(self, n=10):
+        """ return the `n` nodes with the highest peak memory
+
+        Returns:
+            nodes (list): list of (node id, node memory information)
+        """
+        nodes = sorted(
+            self.nodes.items(), key=lambda x: x[1]["peak"] or 0, reverse=True
+        )
+        return nodes[:n]
@@ -0,0 +1,157 @@
+""" Messages exchanged by the graph server and its clients
+
+A message is a JSON header followed by a binary body holding the buffers of
+NumPy arrays (and of the values / index of pandas objects), without any
+copy or text conversion. Each frame starts with the sizes of the header and
+of the body. Other values should be JSON serializable (integer dict keys
+are sent as strings, tuples as lists). Nothing is pickled, so a server
+never runs code sent by a client.
+"""
+
+import json
+import struct
+
+_PREFIX = struct.Struct("!IQ")
+
+
+def _array(value, buffers, offset):
+    """ return the header of an array, its buffer being added to `buffers` """
+    import numpy as np
+
+    if value.dtype == object:
+        return _encode(value.tolist(), buffers, offset)
+    value = np.ascontiguousarray(value)
+    # viewed as bytes, as memoryview does not support all dtypes (datetime64)
+    buffers.append(memoryview(value.reshape(-1).view(np.uint8)))
+    offset[0] += value.nbytes
+    return {
+        "__ndarray__": [offset[0] - value.nbytes, value.nbytes],
+        "dtype": value.dtype.str,
+        "shape": list(value.shape),
+    }
+
+
+def _index(index, buffers, offset):
+    tz = getattr(index, "tz", None)
+    if tz is not None:
+        index = index.tz_convert("UTC").tz_localize(None)
+    return {
+        "__index__": _array(index.to_numpy(), buffers, offset),
+        "tz": None if tz is None else str(tz),
+        "name": _encode(index.name, buffers, offset),
+    }
+
+
+def _encode(value, buffers, offset):
+    """ return the JSON header of a value, adding its buffers to `buffers` """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_encode(v, buffers, offset) for v in value]
+    if isinstance(value, dict):
+        for key in value:
+            if not isinstance(key, (str, int)):
+                raise TypeError(
+                    "dict keys should be strings or integers, not {!r}".format(key)
+                )
+        return {str(k): _encode(v, buffers, offset) for k, v in value.items()}
+    module = type(value).__module__.split(".")[0]
+    kind = type(value).__name__
+    if module == "numpy" and hasattr(value, "dtype"):
+        if getattr(value, "ndim", 0) == 0:
+            return value.item()
+        return _array(value, buffers, offset)
+    if module == "pandas" and kind == "Series":
+        return {
+            "__series__": _array(value.to_numpy(), buffers, offset),
+            "index": _index(value.index, buffers, offset),
+            "name": _encode(value.name, buffers, offset),
+        }
+    if module == "pandas" and kind == "DataFrame":
+        return {
+            "__frame__": [
+                _array(value.iloc[:, i].to_numpy(), buffers, offset)
+                for i in range(value.shape[1])
+            ],
+            "columns": [_encode(c, buffers, offset) for c in value.columns],
+            "index": _index(value.index, buffers, offset),
+        }
+    raise TypeError("cannot encode value of type {}".format(type(value).__name__))
+
+
+def encode(message):
+    """ return the frames of a message (prefix and header, then buffers) """
+    buffers, offset = [], [0]
+    header = json.dumps(_encode(message, buffers, offset)).encode()
+    return [_PREFIX.pack(len(header), offset[0]) + header] + buffers
+
+
+def _decode_index(value, body):
+    import pandas as pd
+
+    index = pd.Index(_decode(value["__index__"], body), name=value["name"])
+    if value["tz"] is not None:
+        index = index.tz_localize("UTC").tz_convert(value["tz"])
+    return index
+
+
+def _decode(value, body):
+    if isinstance(value, list):
+        return [_decode(v, body) for v in value]
+    if not isinstance(value, dict):
+        return value
+    if "__ndarray__" in value:
+        import numpy as np
+
+        offset, nbytes = value["__ndarray__"]
+        dtype = np.dtype(value["dtype"])
+        count = nbytes // dtype.itemsize if dtype.itemsize else 0
+        array = np.frombuffer(body, dtype=dtype, count=count, offset=offset)
+        return array.reshape(value["shape"])
+    if "__series__" in value:
+        import pandas as pd
+
+        index = _decode_index(value["index"], body)
+        values = _decode(value["__series__"], body)
+        return pd.Series(values, index=index, name=value["name"], copy=False)
+    if "__frame__" in value:
+        import pandas as pd
+
+        columns = [_decode(c, body) for c in value["__frame__"]]
+        return pd.DataFrame(
+            dict(enumerate(columns)), index=_decode_index(value["index"], body)
+        ).set_axis(value["columns"], axis=1)
+    return {k: _decode(v, body) for k, v in value.items()}
+
+
+def _receive_exactly(sock, size):
+    """ return `size` bytes read from a socket, in a writable buffer """
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:])
+        if not n:
+            raise EOFError("connection closed")
+        received += n
+    return buffer
+
+
+def send(sock, message):
+    """ send a message on a socket """
+    for frame in encode(message):
+        sock.sendall(frame)
+
+
+def receive(sock):
+    """ return the next message received on a socket
+
+    Arrays are backed by the received buffer (writable, never copied).
+
+    Raises:
+        EOFError: In case the connection is closed
+    """
+    header_size, body_size = _PREFIX.unpack(_receive_exactly(sock, _PREFIX.size))
+    header = json.loads(bytes(_receive_exactly(sock, header_size)))
+    body = _receive_exactly(sock, body_size)
+    return _decode(header, body)
@@ -0,0 +1,201 @@
+""" Long-lived objects injected into node functions
+
+Objects such as database connections, connection pools or lookup tables are
+registered on a graph with a factory and a scope (see `Graph.provide`).
+Nodes read them as inputs, by name. They are created on first use, once per
+scope, and closed when the scope ends:
+
+- `process`: one object per process (the main one, and each worker of the
+  pool), closed when the process exits or with `Graph.close`. The workers of
+  the pool a graph opens for each calculation exit at its end: the objects
+  of workers are only kept between calculations with a `Scheduler`
+- `thread`: one object per thread, closed when the process exits or with
+  `Graph.close`
+- `calculate`: one object per calculation, created in the main process and
+  sent to the workers running the nodes reading it, closed at the end of
+  the calculation
+"""
+
+import logging
+import os
+import threading
+import uuid
+
+from .errors import PyungoError
+
+LOGGER = logging.getLogger()
+
+SCOPES = ("process", "thread", "calculate")
+
+_LOCK = threading.RLock()
+# provider key -> (pid, object), for the process scope
+_INSTANCES = {}
+# provider key -> generation, increased when the objects are closed
+_GENERATIONS = {}
+# (provider key, pid, generation, object, close) of the objects to close
+_CREATED = []
+_LOCAL = threading.local()
+_EXIT_PID = None
+
+
+def _close(obj, close):
+    """ close an object, logging errors """
+    try:
+        if close is not None:
+            close(obj)
+        elif callable(getattr(obj, "close", None)):
+            obj.close()
+    except Exception as err:
+        LOGGER.warning("Cannot close {}: {}".format(obj, err))
+
+
+def close_all():
+    """ close the objects created in the process (process and thread scopes) """
+    with _LOCK:
+        created = [c for c in _CREATED if c[1] == os.getpid()]
+        _CREATED[:] = []
+        _INSTANCES.clear()
+        for key in {c[0] for c in created}:
+            _GENERATIONS[key] = _GENERATIONS.get(key, 0) + 1
+    for _, _, _, obj, close in reversed(created):
+        _close(obj, close)
+
+
+def _register_exit():
+    """ close the objects of the process when it exits (workers included) """
+    global _EXIT_PID
+    if _EXIT_PID == os.getpid():
+        return
+    _EXIT_PID = os.getpid()
+    try:
+        # run by the workers of the pool too, unlike atexit
+        from multiprocess.util import Finalize
+    except ImportError:
+        import atexit
+
+        atexit.register(close_all)
+    else:
+        Finalize(None, close_all, exitpriority=10)
+
+
+class Provider:
+    """ factory of an object injected into the nodes reading its name
+
+    Args:
+        name (str): Name of the input the object is injected as
+        factory (function): Called without argument to create the object
+        scope (str): `process`, `thread` or `calculate`
+        close (function): Optional function called with the object to
+            close it, its `close` method (if any) by default
+
+    Raises:
+        PyungoError: In case the scope is unknown
+    """
+
+    def __init__(self, name, factory, scope="process", close=None):
+        if scope not in SCOPES:
+            msg = "scope should be one of {}, not {}".format(SCOPES, scope)
+            raise PyungoError(msg)
+        self.name = name
+        self.factory = factory
+        self.scope = scope
+        self._close = close
+        self.key = str(uuid.uuid4())
+
+    def _create(self):
+        obj = self.factory()
+        if self.scope != "calculate":
+            with _LOCK:
+                generation = _GENERATIONS.get(self.key, 0)
+                _CREATED.append((self.key, os.getpid(), generation, obj, self._close))
+                _register_exit()
+        return obj
+
+    def get(self):
+        """ return the object of the current process / thread, created if needed """
+        pid = os.getpid()
+        if self.scope == "thread":
+            instances = _LOCAL.__dict__.setdefault("instances", {})
+            generation = _GENERATIONS.get(self.key, 0)
+            found = instances.get(self.key)
+            if found is None or found[:2] != (pid, generation):
+                found = (pid, generation, self._create())
+                instances[self.key] = found
+            return found[2]
+        with _LOCK:
+            found = _INSTANCES.get(self.key)
+            if found is None or found[0] != pid:
+                found = (pid, self._create())
+                _INSTANCES[self.key] = found
+            return found[1]
+
+    def close(self):
+        """ close the objects created in the current process """
+        pid = os.getpid()
+        with _LOCK:
+            created = [c for c in _CREATED if c[0] == self.key and c[1] == pid]
+            _CREATED[:] = [c for c in _CREATED if c not in created]
+            _INSTANCES.pop(self.key, None)
+            _GENERATIONS[self.key] = _GENERATIONS.get(self.key, 0) + 1
+        for _, _, _, obj, close in reversed(created):
+            _close(obj, close)
+
+    def provided(self):
+        """ return the placeholder put in the data of a calculation """
+        if self.scope == "calculate":
+            return CalculationObject(self)
+        return Provided(self)
+
+
+class Provided:
+    """ placeholder of an object, resolved in the process running the node """
+
+    def __init__(self, provider):
+        self.provider = provider
+
+    def get(self):
+        return self.provider.get()
+
+    def close(self):
+        pass
+
+
+def _identity(obj):
+    return obj
+
+
+class CalculationObject(Provided):
+    """ object of one calculation, created on first use
+
+    When sent to a worker, the object itself is sent (created beforehand).
+    """
+
+    def __init__(self, provider):
+        super().__init__(provider)
+        self._lock = threading.Lock()
+        self._created = False
+        self._obj = None
+
+    def get(self):
+        with self._lock:
+            if not self._created:
+                self._obj = self.provider.factory()
+                self._created = True
+            return self._obj
+
+    def close(self):
+        with self._lock:
+            created, self._created = self._created, False
+        if created:
+            _close(self._obj, self.provider._close)
+
+    def __reduce__(self):
+        return (_identity, (self.get(),))
+
+
+def inject(values):
+    """ return input values, the placeholders being replaced by the objects """
+    return {
+        name: value.get() if isinstance(value, Provided) else value
+        for name, value in values.items()
+    }
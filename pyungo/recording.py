@@ -0,0 +1,242 @@
+""" Record and replay of calculations, for offline profiling
+
+A `Recorder` attached to a graph samples its calculations and saves
+snapshots of their inputs (NumPy arrays in `.npy` files, other values
+pickled) along with the timings observed: the whole calculation and each
+node. `replay` runs the snapshots again against the current graph (and
+code), with tracing and memory profiling, and compares the timings.
+"""
+
+import datetime as dt
+import json
+import logging
+import os
+import random
+import shutil
+import tempfile
+import time
+import uuid
+
+from .checkpoint import load_value, save_value
+from .errors import PyungoError
+from .tracing import Trace
+
+LOGGER = logging.getLogger()
+
+INDEX = "snapshot.json"
+# format of the creation time in the index
+CREATED_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+
+
+def node_times(trace, start=None):
+    """ return function name -> time (in seconds) spent running the nodes
+
+    Args:
+        trace (Trace): The trace of the calculation
+        start (float): Optional start time of the calculation, events of
+            previous calculations in the trace being ignored
+    """
+    origin = None if start is None else trace._us(start)
+    times = {}
+    for event in trace.events:
+        if event["cat"] != "node":
+            continue
+        if origin is not None and event["ts"] < origin:
+            continue
+        name = event["name"]
+        times[name] = times.get(name, 0) + event["dur"] / 1e6
+    return times
+
+
+class Recorder:
+    """ sample calculations of a graph and save snapshots of their inputs
+
+    Pass an instance to `Graph(recorder=...)`. Each call to `calculate` is
+    recorded with a probability of `sample`, if it lasted at least
+    `min_duration`. Recording errors (e.g. inputs that cannot be pickled)
+    are logged, never raised.
+
+    Args:
+        directory (str): Directory where snapshots are saved
+        sample (float): Probability for a calculation to be recorded
+        min_duration (float): Minimum duration (in seconds) of the recorded
+            calculations
+        max_snapshots (int): Optional maximum number of snapshots kept, the
+            oldest ones being deleted
+        seed (int): Optional seed of the sampling
+
+    Raises:
+        PyungoError: In case `max_snapshots` is not strictly positive
+    """
+
+    def __init__(
+        self, directory, sample=1.0, min_duration=0.0, max_snapshots=None, seed=None
+    ):
+        if max_snapshots is not None and (
+            not isinstance(max_snapshots, int) or max_snapshots < 1
+        ):
+            raise PyungoError("max_snapshots should be a strictly positive integer")
+        self._directory = directory
+        self._sample = sample
+        self._min_duration = min_duration
+        self._max_snapshots = max_snapshots
+        self._random = random.Random(seed)
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def directory(self):
+        return self._directory
+
+    def sampled(self):
+        """ return whether the next calculation should be traced and recorded """
+        return self._sample >= 1 or self._random.random() < self._sample
+
+    def record(self, inputs, start, end, trace):
+        """ save a snapshot of a calculation
+
+        Args:
+            inputs (dict): Inputs data of the calculation
+            start (float): Start time (`time.perf_counter`) of the calculation
+            end (float): End time of the calculation
+            trace (Trace): The trace of the calculation
+
+        Returns:
+            path (str): Path of the snapshot, None if not recorded
+        """
+        duration = end - start
+        if duration < self._min_duration:
+            return None
+        created = dt.datetime.utcnow()
+        name = "{:%Y%m%dT%H%M%S%f}-{}".format(created, uuid.uuid4().hex[:8])
+        tmp = tempfile.mkdtemp(dir=self._directory, prefix=".tmp-")
+        try:
+            files = {
+                k: save_value(tmp, i, v) for i, (k, v) in enumerate(inputs.items())
+            }
+            index = {
+                "created": created.strftime(CREATED_FORMAT),
+                "duration": duration,
+                "nodes": node_times(trace, start),
+                "inputs": files,
+            }
+            with open(os.path.join(tmp, INDEX), "w") as f:
+                json.dump(index, f)
+        except Exception as err:
+            shutil.rmtree(tmp, ignore_errors=True)
+            LOGGER.warning("Cannot record calculation: {}".format(err))
+            return None
+        path = os.path.join(self._directory, name)
+        os.rename(tmp, path)
+        if self._max_snapshots is not None:
+            for snapshot in snapshots(self._directory)[: -self._max_snapshots]:
+                shutil.rmtree(snapshot.path, ignore_errors=True)
+        return path
+
+
+class Snapshot:
+    """ inputs and timings of a recorded calculation
+
+    Args:
+        path (str): Directory of the snapshot
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, INDEX)) as f:
+            index = json.load(f)
+        self.created = dt.datetime.strptime(index["created"], CREATED_FORMAT)
+        self.duration = index["duration"]
+        self.nodes = index["nodes"]
+        self._files = index["inputs"]
+
+    def __repr__(self):
+        return "Snapshot({}, duration={:.3f}s)".format(self.path, self.duration)
+
+    def inputs(self):
+        """ return the inputs data of the calculation """
+        return {k: load_value(self.path, f, mmap=False) for k, f in self._files.items()}
+
+
+def snapshots(directory):
+    """ return the snapshots saved in a directory, the oldest first """
+    found = []
+    for name in sorted(os.listdir(directory)):
+        if os.path.isfile(os.path.join(directory, name, INDEX)):
+            found.append(Snapshot(os.path.join(directory, name)))
+    return found
+
+
+class Replay:
+    """ timings of a snapshot replayed, compared to the recorded ones
+
+    Attributes:
+        snapshot (Snapshot): The snapshot replayed
+        duration (float): Duration of the replayed calculation
+        nodes (dict): function name -> (recorded, replayed) time in seconds,
+            None for a function not run in one of the calculations
+        trace (Trace): Trace of the replayed calculation
+        memory_profile (MemoryProfile): Memory profile of the replayed
+            calculation, if asked for
+    """
+
+    def __init__(self, snapshot, duration, trace, memory_profile=None):
+        self.snapshot = snapshot
+        self.duration = duration
+        self.trace = trace
+        self.memory_profile = memory_profile
+        replayed = node_times(trace)
+        self.nodes = {
+            name: (snapshot.nodes.get(name), replayed.get(name))
+            for name in sorted(set(snapshot.nodes).union(replayed))
+        }
+
+    @property
+    def ratio(self):
+        """ return the replayed duration divided by the recorded one """
+        if not self.snapshot.duration:
+            return None
+        return self.duration / self.snapshot.duration
+
+    def differences(self, factor=1.5, min_time=1e-3):
+        """ return the nodes whose time changed between the two calculations
+
+        Args:
+            factor (float): Minimum ratio between the longest and the shortest
+                of the recorded and replayed times
+            min_time (float): Minimum time (in seconds) of the longest one
+
+        Returns:
+            list of (function name, recorded, replayed), the largest
+            differences first
+        """
+        found = []
+        for name, (recorded, replayed) in self.nodes.items():
+            if recorded is None or replayed is None:
+                continue
+            longest, shortest = max(recorded, replayed), min(recorded, replayed)
+            if longest >= min_time and longest >= factor * shortest:
+                found.append((name, recorded, replayed))
+        return sorted(found, key=lambda n: abs(n[2] - n[1]), reverse=True)
+
+
+def replay(graph, directory, profile_memory=True):
+    """ run the snapshots of a directory again, with full profiling
+
+    The calculations replayed are not recorded again.
+
+    Args:
+        graph (Graph): The graph to run the snapshots with
+        directory (str): Directory of the snapshots
+        profile_memory (bool): Record the memory used by each node
+
+    Returns:
+        replays (list): The `Replay` of each snapshot, the oldest first
+    """
+    replays = []
+    for snapshot in snapshots(directory):
+        trace = Trace()
+        started = time.perf_counter()
+        graph._calculate(snapshot.inputs(), trace, profile_memory, None, None)
+        duration = time.perf_counter() - started
+        replays.append(Replay(snapshot, duration, trace, graph.memory_profile))
+    return replays
@@ -0,0 +1,190 @@
+""" Streaming readers and writers of records, used by the batch runner
+
+Records are dicts (input name -> value). They are read by chunks from JSON
+lines, CSV, NumPy (`.npy` structured array, `.npz` one array per name) or
+Parquet files, and the results are written by chunks as JSON lines, CSV or
+Parquet (columnar, one row group per chunk). A path of `-` is the standard
+input / output, as JSON lines.
+"""
+
+import csv
+import json
+import os
+import sys
+
+from .errors import PyungoError
+
+READ_FORMATS = ("jsonl", "csv", "npy", "npz", "parquet")
+WRITE_FORMATS = ("jsonl", "csv", "parquet")
+
+
+def file_format(path, formats):
+    """ return the format of a file, from its extension
+
+    Raises:
+        PyungoError: In case the format is not supported
+    """
+    if path == "-":
+        return "jsonl"
+    ext = os.path.splitext(path)[1].lstrip(".").lower()
+    ext = {"ndjson": "jsonl", "json": "jsonl", "pq": "parquet"}.get(ext, ext)
+    if ext not in formats:
+        msg = "Unsupported format {!r}, should be one of {}"
+        raise PyungoError(msg.format(ext, formats))
+    return ext
+
+
+def _number(text):
+    """ return a CSV field as an int / float when possible """
+    for kind in (int, float):
+        try:
+            return kind(text)
+        except ValueError:
+            pass
+    return text
+
+
+def _scalar(value):
+    """ return a NumPy scalar as a Python one, arrays being left untouched """
+    return value.item() if getattr(value, "ndim", None) == 0 else value
+
+
+def _chunks(records, size):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def read_records(path, chunk_size=1000):
+    """ yield the records of a file, by chunks (lists of dicts)
+
+    Only a chunk is kept in memory at a time, except for `.npz` files whose
+    arrays are loaded (`.npy` files are memory-mapped).
+
+    Args:
+        path (str): Path of the file, `-` for JSON lines on the standard input
+        chunk_size (int): Number of records per chunk
+    """
+    kind = file_format(path, READ_FORMATS)
+    if kind == "jsonl":
+        f = sys.stdin if path == "-" else open(path)
+        try:
+            lines = (line for line in f if line.strip())
+            yield from _chunks((json.loads(line) for line in lines), chunk_size)
+        finally:
+            if f is not sys.stdin:
+                f.close()
+    elif kind == "csv":
+        with open(path, newline="") as f:
+            rows = csv.DictReader(f)
+            records = ({k: _number(v) for k, v in row.items()} for row in rows)
+            yield from _chunks(records, chunk_size)
+    elif kind in ("npy", "npz"):
+        import numpy as np
+
+        if kind == "npy":
+            array = np.load(path, mmap_mode="r")
+            columns = {name: array[name] for name in array.dtype.names}
+        else:
+            columns = dict(np.load(path))
+        count = len(next(iter(columns.values()))) if columns else 0
+        for start in range(0, count, chunk_size):
+            stop = min(start + chunk_size, count)
+            yield [
+                {name: _scalar(column[i]) for name, column in columns.items()}
+                for i in range(start, stop)
+            ]
+    else:
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("pyarrow package is needed for Parquet files")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pylist()
+
+
+class _JSONLWriter:
+    def __init__(self, path):
+        self._f = sys.stdout if path == "-" else open(path, "w")
+
+    def write(self, rows):
+        for row in rows:
+            self._f.write(json.dumps(row, default=_json_default) + "\n")
+        self._f.flush()
+
+    def close(self):
+        if self._f is not sys.stdout:
+            self._f.close()
+
+
+def _json_default(value):
+    tolist = getattr(value, "tolist", None)
+    if tolist is None:
+        raise TypeError("cannot write value of type {}".format(type(value).__name__))
+    return tolist()
+
+
+class _CSVWriter:
+    def __init__(self, path):
+        self._f = open(path, "w", newline="")
+        self._writer = None
+
+    def write(self, rows):
+        if not rows:
+            return
+        if self._writer is None:
+            self._writer = csv.DictWriter(self._f, fieldnames=list(rows[0]))
+            self._writer.writeheader()
+        self._writer.writerows({k: _scalar(v) for k, v in r.items()} for r in rows)
+        self._f.flush()
+
+    def close(self):
+        self._f.close()
+
+
+class _ParquetWriter:
+    def __init__(self, path):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("pyarrow package is needed for Parquet files")
+        self._pa, self._pq = pa, pq
+        self._path = path
+        self._writer = None
+
+    def write(self, rows):
+        if not rows:
+            return
+        columns = {k: [_scalar(r[k]) for r in rows] for k in rows[0]}
+        if self._writer is None:
+            table = self._pa.table(columns)
+            self._writer = self._pq.ParquetWriter(self._path, table.schema)
+        else:
+            table = self._pa.table(columns, schema=self._writer.schema)
+        self._writer.write_table(table)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def open_writer(path):
+    """ return a writer of rows (lists of dicts with the same keys) to a file
+
+    The writer has `write(rows)` and `close()` methods.
+
+    Args:
+        path (str): Path of the file, `-` for JSON lines on the standard output
+    """
+    kind = file_format(path, WRITE_FORMATS)
+    if kind == "jsonl":
+        return _JSONLWriter(path)
+    if kind == "csv":
+        return _CSVWriter(path)
+    return _ParquetWriter(path)
@@ -0,0 +1,98 @@
+""" Intermediate data kept in the worker processes that calculated them
+
+With `Graph(locality=True)`, the outputs of the nodes run in the pool stay
+in the worker process which calculated them, the parent process only
+holding references to them. The nodes reading them are preferably run in
+that worker, so large intermediate data do not travel between processes.
+"""
+
+from .memory import retained_size
+
+# values kept in the worker, by key
+_STORE = {}
+
+
+class Local:
+    """ reference, sent to a worker, to a value kept in that worker
+
+    Args:
+        key (str): Key of the value in the worker
+    """
+
+    def __init__(self, key):
+        self.key = key
+
+
+class Resident:
+    """ reference, held by the parent process, to a value kept in a worker
+
+    Args:
+        key (str): Key of the value in the worker
+        size (int): Estimated size (in bytes) of the value
+        worker (int): Index of the worker holding the value, set by the
+            parent process
+    """
+
+    def __init__(self, key, size, worker=None):
+        self.key = key
+        self.size = size
+        self.worker = worker
+
+    def __repr__(self):
+        return "Resident({}, worker={})".format(self.key, self.worker)
+
+
+def references(res, count):
+    """ return the references found in the results of a node
+
+    Args:
+        res: The node results
+        count (int): Number of outputs of the node
+    """
+    values = [res] if count == 1 else res
+    return [v for v in values if isinstance(v, Resident)]
+
+
+def resolve(values):
+    """ return input values, references to values of the worker replaced """
+    return {
+        name: _STORE[value.key] if isinstance(value, Local) else value
+        for name, value in values.items()
+    }
+
+
+def store(res, count, keys):
+    """ keep node outputs in the worker, replaced by references in the results
+
+    Args:
+        res: The node results
+        count (int): Number of outputs of the node
+        keys (dict): output position -> key of the outputs to keep
+
+    Returns:
+        The results, kept outputs being `Resident` references
+    """
+
+    def reference(key, value):
+        _STORE[key] = value
+        return Resident(key, retained_size(value))
+
+    if count == 1:
+        return reference(keys[0], res) if 0 in keys else res
+    res = list(res)
+    for i, key in keys.items():
+        res[i] = reference(key, res[i])
+    return tuple(res)
+
+
+def fetch(key):
+    """ return a value kept in the worker, serialized with dill """
+    import dill
+
+    return dill.dumps(_STORE[key])
+
+
+def drop(keys):
+    """ forget values kept in the worker """
+    for key in keys:
+        _STORE.pop(key, None)
@@ -0,0 +1,329 @@
+""" Process-wide scheduler shared by several graphs
+
+Graphs created with a `Scheduler` submit their node tasks to its pool
+instead of opening their own, so many graphs can run in one process without
+oversubscribing the machine.
+"""
+
+import collections
+import os
+import threading
+import time
+
+from .execution import MAX_SHIPPED_NODES, UnknownNode, run_serialized_node
+
+_SHARED = None
+_SHARED_LOCK = threading.Lock()
+
+
+def shared_scheduler():
+    """ return the process-wide scheduler, created on first use """
+    global _SHARED
+    with _SHARED_LOCK:
+        if _SHARED is None:
+            _SHARED = Scheduler()
+        return _SHARED
+
+
+class _Task:
+    """ node task waiting for, or being run by, the scheduler """
+
+    def __init__(self, node, payload, callback, error_callback, **options):
+        self.node = node
+        self.payload = payload
+        self.callback = callback
+        self.error_callback = error_callback
+        self.profile_memory = options.get("profile_memory", False)
+        self.resources = options.get("resources") or {}
+        self.priority = options.get("priority", 0)
+        self.tenant = options.get("tenant")
+        self.owner = options.get("owner")
+        self.key = options.get("key")
+        self.graph = options.get("graph")
+        self.submitted = time.perf_counter()
+
+    @property
+    def node_key(self):
+        """ return the key of the node in the workers
+
+        Node ids are only unique in the process which created them, the token
+        of the graph tells apart the nodes of graphs unpickled in this one.
+        """
+        return (self.graph, self.node.id)
+
+
+class _WaitStats:
+    """ count, mean and max of the waiting times of tasks """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, wait):
+        self.count += 1
+        self.total += wait
+        self.max = max(self.max, wait)
+
+    def to_dict(self):
+        mean = self.total / self.count if self.count else 0.0
+        return {"count": self.count, "mean": mean, "max": self.max}
+
+
+class Scheduler:
+    """ pool of processes running the nodes of several graphs
+
+    Tasks are admitted by decreasing priority. Among the tenants having tasks
+    of the highest priority, the one which used the workers the least (in
+    seconds of node runtime) goes first, so a tenant submitting many tasks
+    does not starve the others. The tasks of a tenant are started in the
+    order they were submitted.
+
+    A task only starts when the resources it needs are available (across
+    all graphs). When the next task does not fit, no other task is started
+    before it, so large tasks are not starved by small ones.
+
+    Nodes are sent with their tasks until each worker process has run them
+    (workers are known from the results), then only node ids and input
+    values are sent. Workers keep the most recently used nodes only.
+
+    Args:
+        processes (int): Number of processes of the pool (number of CPUs by
+            default)
+        max_concurrency (int): Maximum number of tasks running at the same
+            time, across all graphs (`processes` by default)
+        resources (dict): Optional resources shared by all the tasks: `cpus`
+            (`max_concurrency` by default), `memory` (bytes) and named
+            resources. Resources not listed are not limited
+
+    Example:
+        scheduler = Scheduler(processes=8)
+        interactive = Graph(scheduler=scheduler, priority=10, tenant='ui')
+        backfill = Graph(scheduler=scheduler, tenant='batch')
+
+    Raises:
+        ImportError will raise in case `multiprocess` is not installed
+    """
+
+    def __init__(self, processes=None, max_concurrency=None, resources=None):
+        self._processes = processes or os.cpu_count() or 1
+        self._max_concurrency = max_concurrency or self._processes
+        self._capacity = dict(resources or {})
+        self._capacity.setdefault("cpus", self._max_concurrency)
+        self._in_use = collections.Counter()
+        self._pool = None
+        self._dill = None
+        self._lock = threading.Lock()
+        self._queues = {}
+        self._usage = collections.Counter()
+        self._running = 0
+        # node key -> pids of the workers having the node, least recent first
+        self._shipped = collections.OrderedDict()
+        self._submitted = 0
+        self._completed = 0
+        self._waits = collections.defaultdict(_WaitStats)
+
+    @property
+    def max_concurrency(self):
+        return self._max_concurrency
+
+    def _open_pool(self):
+        try:
+            from multiprocess import Pool
+            import dill
+        except ImportError:
+            msg = "multiprocess package is needed for parralelism"
+            raise ImportError(msg)
+        self._dill = dill
+        self._pool = Pool(self._processes)
+
+    def start(self):
+        """ open the pool now, instead of when the first task is submitted """
+        with self._lock:
+            if self._pool is None:
+                self._open_pool()
+
+    def submit(self, node, payload, callback, error_callback, **options):
+        """ submit a node task
+
+        Args:
+            node (Node): The node to run
+            payload (bytes): The node id, input values and mapped elements
+                serialized with dill (see `run_serialized_node`)
+            callback (function): Called with the task result
+            error_callback (function): Called with the error if the task failed
+            profile_memory (bool): Measure the peak memory allocated by the node
+            resources (dict): Resources needed to run the task
+            priority (int): Tasks of higher priority are started first
+            tenant: Tenant the task is accounted to, for fair sharing
+            owner: Optional owner of the task, used to cancel it
+            key: Optional key of the task, returned when cancelled
+            graph: Optional token of the graph of the node
+        """
+        task = _Task(node, payload, callback, error_callback, **options)
+        # a task needing more than the capacity runs alone
+        task.resources = {
+            name: min(amount, self._capacity.get(name, amount))
+            for name, amount in task.resources.items()
+        }
+        with self._lock:
+            if self._pool is None:
+                self._open_pool()
+            self._queues.setdefault(
+                (task.priority, task.tenant), collections.deque()
+            ).append(task)
+            self._submitted += 1
+            self._dispatch()
+
+    def cancel(self, owner):
+        """ cancel the tasks of an owner not started yet
+
+        Returns:
+            keys (list): keys of the tasks cancelled
+        """
+        keys = []
+        with self._lock:
+            for queue_key, tasks in list(self._queues.items()):
+                kept = collections.deque(t for t in tasks if t.owner is not owner)
+                keys.extend(t.key for t in tasks if t.owner is owner)
+                if kept:
+                    self._queues[queue_key] = kept
+                else:
+                    del self._queues[queue_key]
+        return keys
+
+    def _next_task(self):
+        """ pop the next task to start, None if there is none or it does not fit """
+        if not self._queues:
+            return None
+        priority = max(p for p, _ in self._queues)
+        tenants = [t for p, t in self._queues if p == priority]
+        tenant = min(tenants, key=lambda t: self._usage[t])
+        tasks = self._queues[(priority, tenant)]
+        if not self._fits(tasks[0].resources):
+            return None
+        task = tasks.popleft()
+        if not tasks:
+            del self._queues[(priority, tenant)]
+        return task
+
+    def _fits(self, required):
+        return all(
+            self._in_use[name] + amount <= self._capacity[name]
+            for name, amount in required.items()
+            if name in self._capacity
+        )
+
+    def _dispatch(self):
+        """ start tasks while below the concurrency cap (lock held) """
+        while self._running < self._max_concurrency:
+            task = self._next_task()
+            if task is None:
+                return
+            self._running += 1
+            self._in_use.update(task.resources)
+            wait = time.perf_counter() - task.submitted
+            self._waits[("priority", task.priority)].add(wait)
+            self._waits[("tenant", task.tenant)].add(wait)
+            node = None
+            if len(self._shipped.get(task.node_key, ())) < self._processes:
+                # some workers may not have the node yet
+                node = self._dill.dumps(task.node)
+            self._apply(task, node)
+
+    def _apply(self, task, node):
+        self._pool.apply_async(
+            run_serialized_node,
+            (task.payload, task.profile_memory, node, None, task.node_key),
+            callback=lambda r: self._finish(task, r),
+            error_callback=lambda e: self._fail(task, e),
+        )
+
+    def _has_node(self, node_key, pid):
+        """ record that a worker has a node (lock held) """
+        self._shipped.setdefault(node_key, set()).add(pid)
+        self._shipped.move_to_end(node_key)
+        while len(self._shipped) > MAX_SHIPPED_NODES:
+            self._shipped.popitem(last=False)
+
+    def _finish(self, task, result):
+        with self._lock:
+            self._has_node(task.node_key, result[1]["pid"])
+            self._running -= 1
+            self._in_use.subtract(task.resources)
+            self._completed += 1
+            self._usage[task.tenant] += result[1]["runtime"]
+            self._dispatch()
+        task.callback(result)
+
+    def _fail(self, task, error):
+        if isinstance(error, UnknownNode):
+            # the worker does not have this node (anymore), send it again
+            with self._lock:
+                pids = self._shipped.get(error.key)
+                if pids is not None:
+                    pids.discard(error.pid)
+            self._apply(task, self._dill.dumps(task.node))
+            return
+        with self._lock:
+            self._running -= 1
+            self._in_use.subtract(task.resources)
+            self._completed += 1
+            self._dispatch()
+        task.error_callback(error)
+
+    @property
+    def metrics(self):
+        """ return the queue depth, running tasks and waiting time statistics
+
+        Returns:
+            metrics (dict): with `queued` (total, by priority, by tenant),
+                `running`, `resources` (capacity and use), `submitted`,
+                `completed`, `usage` (seconds of node runtime by tenant) and
+                `wait` (count, mean and max waiting time in seconds, by
+                priority and by tenant)
+        """
+        with self._lock:
+            by_priority = collections.Counter()
+            by_tenant = collections.Counter()
+            for (priority, tenant), tasks in self._queues.items():
+                by_priority[priority] += len(tasks)
+                by_tenant[tenant] += len(tasks)
+            return {
+                "processes": self._processes,
+                "max_concurrency": self._max_concurrency,
+                "queued": {
+                    "total": sum(by_priority.values()),
+                    "by_priority": dict(by_priority),
+                    "by_tenant": dict(by_tenant),
+                },
+                "running": self._running,
+                "resources": {
+                    name: {"capacity": capacity, "in_use": self._in_use[name]}
+                    for name, capacity in self._capacity.items()
+                },
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "usage": dict(self._usage),
+                "wait": {
+                    "by_priority": {
+                        k: v.to_dict()
+                        for (kind, k), v in self._waits.items()
+                        if kind == "priority"
+                    },
+                    "by_tenant": {
+                        k: v.to_dict()
+                        for (kind, k), v in self._waits.items()
+                        if kind == "tenant"
+                    },
+                },
+            }
+
+    def close(self):
+        """ stop the pool, once the running tasks are done """
+        with self._lock:
+            pool, self._pool = self._pool, None
+            self._shipped.clear()
+        if pool is not None:
+            pool.close()
+            pool.join()
@@ -0,0 +1,312 @@
+""" Long-running server calculating registered graphs
+
+Starting Python, importing heavy libraries, building graphs and starting
+worker processes takes seconds. A `GraphServer` pays it once: it keeps its
+graphs compiled and the pools of their scheduler open, and calculates the
+requests of local clients (see `pyungo.client.Client`) sent on a TCP or
+UNIX socket, with the binary encoding of `pyungo.protocol`.
+
+Each connection is served by a thread, and a graph calculates the requests
+of several clients at the same time (see concurrent calculations).
+"""
+
+import logging
+import os
+import socket
+import stat
+import socketserver
+import threading
+import time
+
+from .errors import PyungoError
+from .protocol import encode, receive
+from .scheduler import Scheduler
+
+LOGGER = logging.getLogger()
+
+
+class _Stats:
+    """ requests, errors and latency of a graph """
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def to_dict(self):
+        done = self.requests - self.in_flight
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "in_flight": self.in_flight,
+            "latency": {"mean": self.total / done if done else 0.0, "max": self.max,},
+        }
+
+
+def _error(err):
+    return {"error": {"type": type(err).__name__, "message": str(err)}}
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    """ serve the requests of a connection, one after the other """
+
+    def handle(self):
+        server = self.server.graph_server
+        server._connected(1)
+        try:
+            while True:
+                try:
+                    request = receive(self.request)
+                except (EOFError, ConnectionError):
+                    return
+                try:
+                    frames = encode(server.handle(request))
+                except TypeError as err:
+                    server._encoding_failed(request)
+                    frames = encode(_error(err))
+                for frame in frames:
+                    self.request.sendall(frame)
+        finally:
+            server._connected(-1)
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+if hasattr(socket, "AF_UNIX"):
+
+    class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+
+class GraphServer:
+    """ server calculating graphs for local clients
+
+    Parallel graphs without a scheduler (and without `locality`) are run on
+    a scheduler of the server, whose pool is opened when the server starts
+    and stays open between requests. The graphs are given back their
+    previous scheduler on `shutdown`.
+
+    Requests are dicts with an `op`:
+
+    - `calculate`: with `graph` (name), `data` and optional `outputs` (names
+      of the outputs sent back with the result)
+    - `health`: status, graphs and uptime
+    - `metrics`: requests, errors and latency of each graph, and metrics of
+      the schedulers
+
+    Responses have an `error` (type and message) when the request failed.
+
+    Args:
+        graphs (dict): name -> `Graph` served
+        address: `(host, port)` to listen on TCP, or the path of a UNIX
+            socket. By default, a free port of localhost
+        processes (int): Number of processes of the server scheduler (number
+            of CPUs by default)
+        warmup (dict): Optional name -> data of a calculation run when the
+            server starts, so the workers load the nodes and their modules
+
+    Raises:
+        PyungoError: In case a graph to warm up is unknown, or the UNIX socket
+            path is a file that is not a socket
+
+    Example:
+        server = GraphServer({'pv': graph}, address='/tmp/pyungo.sock')
+        server.serve_forever()
+    """
+
+    def __init__(self, graphs, address=("127.0.0.1", 0), processes=None, warmup=None):
+        self._graphs = dict(graphs)
+        self._warmup = dict(warmup or {})
+        diff = set(self._warmup) - set(self._graphs)
+        if diff:
+            raise PyungoError("Unknown graphs to warm up: {}".format(sorted(diff)))
+        self._scheduler = None
+        # graphs run on the server scheduler
+        self._scheduled = []
+        for name, graph in self._graphs.items():
+            if not graph._parallel or graph._scheduler is not None:
+                continue
+            if graph._locality:
+                LOGGER.warning("{} opens a pool for each calculation".format(name))
+                continue
+            if self._scheduler is None:
+                self._scheduler = Scheduler(processes=processes)
+            graph._scheduler = self._scheduler
+            self._scheduled.append(graph)
+        self._stats = {name: _Stats() for name in self._graphs}
+        self._lock = threading.Lock()
+        self._connections = 0
+        self._started = None
+        if isinstance(address, str):
+            if os.path.exists(address):
+                if not stat.S_ISSOCK(os.stat(address).st_mode):
+                    msg = "{} exists and is not a socket".format(address)
+                    raise PyungoError(msg)
+                os.remove(address)
+            self._server = _UnixServer(address, _Handler, bind_and_activate=False)
+        else:
+            self._server = _TCPServer(address, _Handler, bind_and_activate=False)
+        self._server.graph_server = self
+        self._serving = False
+        self._thread = None
+
+    @property
+    def address(self):
+        """ return the address the server listens on (once started) """
+        return self._server.server_address
+
+    def _schedulers(self):
+        schedulers = {g._scheduler for g in self._graphs.values()}
+        return [s for s in schedulers if s is not None]
+
+    def start(self):
+        """ compile the graphs, open the pools and warm up the graphs, then
+        listen on the address (the requests being served by `serve_forever`)
+
+        Returns:
+            address: the address the server listens on
+        """
+        for graph in self._graphs.values():
+            graph._compile()
+        for scheduler in self._schedulers():
+            scheduler.start()
+        for name, data in self._warmup.items():
+            t1 = time.perf_counter()
+            self._graphs[name].calculate(data)
+            LOGGER.info(
+                "Warmed up {} in {:.3f}s".format(name, time.perf_counter() - t1)
+            )
+        self._server.server_bind()
+        self._server.server_activate()
+        self._started = time.time()
+        return self.address
+
+    def serve_forever(self):
+        """ start the server if needed and serve requests until `shutdown` """
+        if self._started is None:
+            self.start()
+        self._serving = True
+        self._server.serve_forever()
+
+    def serve_in_thread(self):
+        """ start the server and serve requests in a background thread
+
+        Returns:
+            address: the address the server listens on
+        """
+        address = self.start()
+        self._serving = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return address
+
+    def shutdown(self):
+        """ stop serving, and close the socket, the server scheduler and the
+        objects provided to the graphs
+        """
+        if self._serving:
+            self._server.shutdown()
+            self._serving = False
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.remove(self.address)
+        if self._scheduler is not None:
+            self._scheduler.close()
+        for graph in self._scheduled:
+            graph._scheduler = None
+        for graph in self._graphs.values():
+            graph.close()
+
+    def __enter__(self):
+        self.serve_in_thread()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+    def _connected(self, n):
+        with self._lock:
+            self._connections += n
+
+    def _encoding_failed(self, request):
+        """ count a response that cannot be encoded as an error of its graph """
+        if not isinstance(request, dict) or request.get("op") != "calculate":
+            return
+        stats = self._stats.get(request.get("graph"))
+        if stats is not None:
+            with self._lock:
+                stats.errors += 1
+
+    def handle(self, request):
+        """ return the response to a request (see the class documentation) """
+        try:
+            op = request.get("op") if isinstance(request, dict) else None
+            if op == "calculate":
+                return self._calculate(request)
+            if op == "health":
+                return self.health()
+            if op == "metrics":
+                return self.metrics()
+            raise PyungoError("Unknown operation {!r}".format(op))
+        except Exception as err:
+            return _error(err)
+
+    def _calculate(self, request):
+        name = request.get("graph")
+        graph = self._graphs.get(name)
+        if graph is None:
+            raise PyungoError("Unknown graph {!r}".format(name))
+        stats = self._stats[name]
+        with self._lock:
+            stats.requests += 1
+            stats.in_flight += 1
+        t1 = time.perf_counter()
+        failed = True
+        try:
+            outputs = request.get("outputs")
+            result = graph.calculate(request.get("data") or {}, outputs=outputs)
+            data = graph.data
+            response = {
+                "result": result,
+                "outputs": {o: data[o] for o in outputs or []},
+            }
+            failed = False
+            return response
+        finally:
+            elapsed = time.perf_counter() - t1
+            with self._lock:
+                stats.in_flight -= 1
+                stats.errors += failed
+                stats.total += elapsed
+                stats.max = max(stats.max, elapsed)
+
+    def health(self):
+        """ return the status, the graphs served and the uptime (in seconds) """
+        return {
+            "status": "ok",
+            "graphs": sorted(self._graphs),
+            "uptime": time.time() - self._started if self._started else 0.0,
+            "pid": os.getpid(),
+        }
+
+    def metrics(self):
+        """ return the connections, the statistics of each graph and the
+        metrics of the schedulers
+        """
+        with self._lock:
+            graphs = {name: stats.to_dict() for name, stats in self._stats.items()}
+            connections = self._connections
+        for name, graph in self._graphs.items():
+            graphs[name]["batches"] = graph.batch_report
+        return {
+            "connections": connections,
+            "graphs": graphs,
+            "schedulers": [s.metrics for s in self._schedulers()],
+        }
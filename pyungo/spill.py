@@ -0,0 +1,159 @@
+""" Spill of intermediate data to memory-mapped files
+
+When the intermediate data of a calculation exceeds a memory budget, large
+NumPy arrays and pandas objects are saved to files in a scratch directory,
+and loaded back memory-mapped (without copy) when read.
+"""
+
+import os
+import shutil
+import tempfile
+
+
+def _kind(value):
+    """ return the kind of a spillable value, None if it cannot be spilled """
+    dtype = getattr(value, "dtype", None)
+    module = type(value).__module__.split(".")[0]
+    if module == "numpy" and dtype is not None:
+        if dtype != object and getattr(value, "ndim", 0) > 0:
+            return "ndarray"
+    elif module == "pandas":
+        # the values saved are the ones of `to_numpy()`, of object dtype for
+        # extension dtypes (tz-aware datetimes, nullable integers...)
+        if type(value).__name__ == "Series" and _saved(dtype):
+            return "Series"
+        dtypes = getattr(value, "dtypes", None)
+        if type(value).__name__ == "DataFrame" and len(set(dtypes)) == 1:
+            if _saved(dtypes.iloc[0]):
+                return "DataFrame"
+    return None
+
+
+def _saved(dtype):
+    """ return whether the values of a pandas dtype can be saved without pickle """
+    import numpy as np
+
+    return isinstance(dtype, np.dtype) and dtype != object
+
+
+class Spilled:
+    """ placeholder of a value saved to a file
+
+    Args:
+        path (str): Path of the `.npy` file holding the values
+        kind (str): Kind of the original value (ndarray, Series, DataFrame)
+        meta (dict): Index / columns / name of pandas objects
+    """
+
+    def __init__(self, path, kind, meta=None):
+        self.path = path
+        self.kind = kind
+        self.meta = meta or {}
+
+    def load(self):
+        """ return the value, backed by a read only memory-mapped file """
+        import numpy as np
+
+        values = np.load(self.path, mmap_mode="r")
+        if self.kind == "ndarray":
+            return values
+        import pandas as pd
+
+        if self.kind == "Series":
+            return pd.Series(values, copy=False, **self.meta)
+        return pd.DataFrame(values, copy=False, **self.meta)
+
+
+def dump(value, path):
+    """ save a value to a file
+
+    Returns:
+        spilled (Spilled): the placeholder of the value, None if the value
+            cannot be spilled
+    """
+    kind = _kind(value)
+    if kind is None:
+        return None
+    import numpy as np
+
+    meta = {}
+    if kind == "Series":
+        meta = {"index": value.index, "name": value.name}
+    elif kind == "DataFrame":
+        meta = {"index": value.index, "columns": value.columns}
+    values = value if kind == "ndarray" else value.to_numpy()
+    np.save(path, values, allow_pickle=False)
+    return Spilled(path, kind, meta)
+
+
+class Spiller:
+    """ keep the intermediate data of a calculation under a memory budget
+
+    Args:
+        budget (int): Memory budget (in bytes) of the intermediate data
+        directory (str): Optional parent directory of the scratch directory
+    """
+
+    def __init__(self, budget, directory=None):
+        self._budget = budget
+        self._directory = tempfile.mkdtemp(prefix="pyungo-spill-", dir=directory)
+        self._sizes = {}
+        self.spilled = []
+
+    @property
+    def directory(self):
+        return self._directory
+
+    @property
+    def resident(self):
+        """ return the size (in bytes) of the intermediate data in memory """
+        return sum(self._sizes.values())
+
+    def add(self, name, size):
+        """ record a new intermediate data kept in memory """
+        self._sizes[name] = size
+
+    def spill(self, data, next_use):
+        """ spill data until the intermediate data fits in the budget
+
+        The data needed the latest (then the largest ones) are spilled first.
+
+        Args:
+            data (Data): The data of the calculation
+            next_use (function): name -> position in the schedule of the next
+                node reading the data (inf if not read anymore)
+
+        Returns:
+            released (int): size (in bytes) of the data spilled
+        """
+        resident = self.resident
+        released = 0
+        if resident <= self._budget:
+            return released
+        candidates = sorted(
+            ((next_use(name), size, name) for name, size in self._sizes.items()),
+            reverse=True,
+        )
+        for _, size, name in candidates:
+            path = os.path.join(self._directory, "{}.npy".format(len(self.spilled)))
+            spilled = dump(data.outputs[name], path)
+            if spilled is None:
+                continue
+            data.outputs[name] = spilled
+            del self._sizes[name]
+            self.spilled.append(name)
+            released += size
+            if resident - released <= self._budget:
+                break
+        return released
+
+    def close(self, data):
+        """ delete the scratch directory
+
+        Spilled outputs are replaced by memory-mapped values: on POSIX systems
+        they stay valid after the files are deleted.
+        """
+        for name, value in data.outputs.items():
+            if isinstance(value, Spilled):
+                data.outputs[name] = value.load()
+        shutil.rmtree(self._directory, ignore_errors=True)
@@ -0,0 +1,36 @@
+""" Parameter sweep helpers
+
+Functions used to run the part of a graph affected by swept inputs, for
+each point of a grid, possibly in a pool of processes.
+"""
+
+_SWEEP = {}
+
+
+def init_sweep(graph, shared, names, outputs):
+    """ pool initializer: keep what is common to every grid point """
+    _SWEEP.update(graph=graph, shared=shared, names=names, outputs=outputs)
+
+
+def run_point(point, graph=None, shared=None, names=None, outputs=None):
+    """ run a graph for one grid point
+
+    Args:
+        point (tuple): Values of the swept inputs
+        graph (Graph): Graph to run, defaults to the one of `init_sweep`
+        shared (dict): Inputs common to every point
+        names (list): Names of the swept inputs
+        outputs (list): Names of the outputs to return
+
+    Returns:
+        values (list): Values of the outputs, in the `outputs` order
+    """
+    if graph is None:
+        graph = _SWEEP["graph"]
+        shared = _SWEEP["shared"]
+        names = _SWEEP["names"]
+        outputs = _SWEEP["outputs"]
+    data = dict(shared)
+    data.update(zip(names, point))
+    graph.calculate(data)
+    return [graph.data[o] for o in outputs]
@@ -0,0 +1,172 @@
+""" Timeline of graph calculations
+
+Record when and where each node is run, and export it in the Chrome trace
+event format (https://ui.perfetto.dev or chrome://tracing).
+"""
+
+import json
+import os
+import threading
+import time
+
+
+class Trace:
+    """ Timeline of one or several graph calculations
+
+    Pass an instance to `Graph.calculate` to record the nodes being run.
+    All times are in seconds from `time.perf_counter`, which is shared by the
+    processes of a same machine.
+
+    Example:
+        trace = Trace()
+        graph.calculate(data, trace=trace)
+        trace.save('calculation.json')
+    """
+
+    def __init__(self):
+        self._origin = time.perf_counter()
+        self._events = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._workers = set()
+
+    @property
+    def events(self):
+        """ return the recorded events, in Chrome trace event format """
+        with self._lock:
+            return list(self._events)
+
+    def _us(self, seconds):
+        """ convert a perf_counter time to microseconds since the trace origin """
+        return (seconds - self._origin) * 1e6
+
+    def _add(self, event):
+        with self._lock:
+            self._events.append(event)
+
+    def add_calculation(self, start, end, **args):
+        """ record a whole graph calculation
+
+        Args:
+            start (float): Start time of the calculation
+            end (float): End time of the calculation
+            args: Optional extra information attached to the event
+        """
+        self._add(
+            {
+                "name": "calculate",
+                "cat": "graph",
+                "ph": "X",
+                "ts": self._us(start),
+                "dur": (end - start) * 1e6,
+                "pid": self._pid,
+                "tid": threading.get_ident(),
+                "args": args,
+            }
+        )
+
+    def add_counter(self, name, time_, **values):
+        """ record the values of a counter (e.g. memory) at a given time
+
+        Args:
+            name (str): Name of the counter
+            time_ (float): Time of the measure
+            values: counter series name -> value
+        """
+        self._add(
+            {
+                "name": name,
+                "cat": "counter",
+                "ph": "C",
+                "ts": self._us(time_),
+                "pid": self._pid,
+                "args": values,
+            }
+        )
+
+    def add_node(
+        self, node_id, name, ready, start, end, pid, thread, serialization=None, **args
+    ):
+        """ record a node being run
+
+        Args:
+            node_id (int): Id of the node
+            name (str): Name of the function attached to the node
+            ready (float): Time at which all node inputs were available
+            start (float): Time at which the function started
+            end (float): Time at which the function ended
+            pid (int): Id of the process running the node
+            thread (int): Id of the thread running the node
+            serialization (list): Optional list of (name, pid, thread, start, end)
+                of serialization steps related to the node
+            args: Optional extra information attached to the event
+        """
+        serialization = serialization or []
+        args.update(
+            {
+                "node_id": node_id,
+                "waiting_for_worker": start - ready,
+                "execution": end - start,
+                "serialization": sum(s[4] - s[3] for s in serialization),
+            }
+        )
+        self._add(
+            {
+                "name": name,
+                "cat": "node",
+                "ph": "X",
+                "ts": self._us(start),
+                "dur": (end - start) * 1e6,
+                "pid": pid,
+                "tid": thread,
+                "args": args,
+            }
+        )
+        for step, step_pid, step_thread, step_start, step_end in serialization:
+            self._add(
+                {
+                    "name": "{} ({})".format(step, name),
+                    "cat": "serialization",
+                    "ph": "X",
+                    "ts": self._us(step_start),
+                    "dur": (step_end - step_start) * 1e6,
+                    "pid": step_pid,
+                    "tid": step_thread,
+                    "args": {"node_id": node_id},
+                }
+            )
+        with self._lock:
+            self._workers.add(pid)
+
+    def to_dict(self):
+        """ return the trace as a Chrome trace event document """
+        with self._lock:
+            events = list(self._events)
+            workers = sorted(self._workers - {self._pid})
+        metadata = [
+            {
+                "name": "process_name",
+                "ph": "M",
+                "pid": self._pid,
+                "args": {"name": "pyungo (main)"},
+            }
+        ]
+        for pid in workers:
+            metadata.append(
+                {
+                    "name": "process_name",
+                    "ph": "M",
+                    "pid": pid,
+                    "args": {"name": "pyungo worker {}".format(pid)},
+                }
+            )
+        return {"traceEvents": metadata + events, "displayTimeUnit": "ms"}
+
+    def save(self, path):
+        """ save the trace to a JSON file, to be opened with Perfetto
+
+        Args:
+            path (str): Path of the JSON file
+        """
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f)
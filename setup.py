@@ -32,4 +32,5 @@ setup(
     ],
     keywords="dag workflow function dependency",
     packages=["pyungo"],
+    entry_points={"console_scripts": ["pyungo = pyungo.cli:main"]},
 )
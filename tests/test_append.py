@@ -0,0 +1,113 @@
+import pytest
+
+from pyungo.core import Graph, PyungoError
+from pyungo.append import concat, take
+
+
+def test_take_concat():
+    assert take([1, 2, 3], 1) == [2, 3]
+    assert concat([1, 2], (3,)) == [1, 2, 3]
+    np = pytest.importorskip("numpy")
+    assert take(np.arange(3), 3).size == 0
+    assert concat(np.arange(2), np.arange(2, 4)).tolist() == [0, 1, 2, 3]
+
+
+def test_append():
+    power = [4, 8, 12, 4, 0, 16, 20, 8]
+
+    def make(calls):
+        graph = Graph()
+
+        @graph.register(inputs=["power"], outputs=["energy"], lookback=0)
+        def f_energy(power):
+            calls.append(("energy", len(power)))
+            return [p / 4 for p in power]
+
+        @graph.register(inputs=["energy"], outputs=["smooth"], lookback=2)
+        def f_smooth(energy):
+            calls.append(("smooth", len(energy)))
+            return [sum(energy[max(0, i - 2) : i + 1]) for i in range(len(energy))]
+
+        @graph.register(inputs=["smooth"], outputs=["peak"])
+        def f_peak(smooth):
+            calls.append(("peak", len(smooth)))
+            return max(smooth)
+
+        return graph
+
+    calls = []
+    graph = make(calls)
+    assert graph.append({"power": power[:5]}) == 6
+    assert graph.append({"power": power[5:7]}) == 9
+    assert calls[3:] == [("energy", 2), ("smooth", 4), ("peak", 7)]
+    assert graph.append({"power": power[7:]}) == 11
+    data = graph.data
+
+    expected = make([])
+    assert expected.calculate({"power": power}) == 11
+    for name in ["power", "energy", "smooth"]:
+        assert data[name] == expected.data[name]
+
+
+def test_append_pandas():
+    pd = pytest.importorskip("pandas")
+    index = pd.date_range("2020-01-01", periods=10, freq="15min")
+    power = pd.Series(range(10), index=index, dtype=float)
+
+    def make(fixed):
+        graph = Graph()
+
+        @graph.register(inputs=["power", "factor"], outputs=["ac"], lookback=0)
+        def f_ac(power, factor):
+            return power * factor
+
+        @graph.register(inputs=["ac"], outputs=["mean"], lookback=3)
+        def f_mean(ac):
+            return ac.rolling(4).mean()
+
+        return graph.specialize(fixed)
+
+    graph = make({"factor": 0.5})
+    for start, end in [(0, 2), (2, 7), (7, 10)]:
+        res = graph.append({"power": power.iloc[start:end]})
+    expected = make({"factor": 0.5}).calculate({"power": power})
+    pd.testing.assert_series_equal(res, expected)
+
+
+def test_append_replace_node():
+    graph = Graph()
+    calls = []
+
+    @graph.register(inputs=["power"], outputs=["energy"], lookback=0)
+    def f_energy(power):
+        calls.append(("energy", len(power)))
+        return [p / 4 for p in power]
+
+    @graph.register(inputs=["energy"], outputs=["smooth"], lookback=2)
+    def f_smooth(energy):
+        calls.append(("smooth", len(energy)))
+        return [sum(energy[max(0, i - 2) : i + 1]) for i in range(len(energy))]
+
+    @graph.register(inputs=["smooth"], outputs=["peak"])
+    def f_peak(smooth):
+        calls.append(("peak", len(smooth)))
+        return max(smooth)
+
+    graph.append({"power": [4, 8]})
+    nodes = [n for level in graph.dag for n in level if n.fct_name == "f_energy"]
+
+    def f_energy_half(power):
+        calls.append(("energy", len(power)))
+        return [p / 2 for p in power]
+
+    graph.replace_node(nodes[0].id, f_energy_half, inputs=["power"], outputs=["energy"])
+    del calls[:]
+    assert graph.append({"power": [12]}) == 12
+    # the replaced node and the nodes reading it are run on all the rows
+    assert calls == [("energy", 3), ("smooth", 3), ("peak", 3)]
+
+
+def test_lookback_error():
+    with pytest.raises(PyungoError) as err:
+        Graph().add_node(len, inputs=["a"], outputs=["b"], lookback=-1)
+    assert "lookback should be a positive integer" in str(err.value)
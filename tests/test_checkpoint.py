@@ -0,0 +1,204 @@
+import pytest
+
+from pyungo.core import Graph
+from pyungo.checkpoint import code_hash, fingerprint
+from pyungo.errors import NodeError
+
+
+def test_checkpoint_resume(tmp_path):
+    directory = str(tmp_path)
+    graph = Graph()
+    calls = []
+    fail = [True]
+
+    @graph.register(inputs=["a", "b"], outputs=["c", "d"])
+    def f_my_function(a, b):
+        calls.append("f1")
+        return a + b, [a] * b
+
+    @graph.register(inputs=["c", "d"], outputs=["e"])
+    def f_my_function2(c, d):
+        calls.append("f2")
+        if fail[0]:
+            raise ValueError("crash")
+        return c * len(d)
+
+    with pytest.raises(NodeError):
+        graph.calculate({"a": 1, "b": 2}, checkpoint_dir=directory)
+    assert calls == ["f1", "f2"]
+
+    # the failing node is fixed, its closure changed
+    fail[0] = False
+    calls.clear()
+    res = graph.calculate({"a": 1, "b": 2}, checkpoint_dir=directory)
+    assert res == 6
+    assert calls == ["f2"]
+
+    calls.clear()
+    res = graph.calculate({"a": 1, "b": 2}, checkpoint_dir=directory)
+    assert res == 6
+    assert calls == []
+    assert graph.data["d"] == [1, 1]
+
+
+def test_checkpoint_stale_inputs(tmp_path):
+    directory = str(tmp_path)
+    graph = Graph()
+    calls = []
+
+    @graph.register(inputs=["a", "b"], outputs=["c", "d"])
+    def f_my_function(a, b):
+        calls.append("f1")
+        return a + b, [a] * b
+
+    @graph.register(inputs=["c", "d"], outputs=["e"])
+    def f_my_function2(c, d):
+        calls.append("f2")
+        return c * len(d)
+
+    graph.calculate({"a": 1, "b": 2}, checkpoint_dir=directory)
+    calls.clear()
+    res = graph.calculate({"a": 2, "b": 2}, checkpoint_dir=directory)
+    assert res == 8
+    assert calls == ["f1", "f2"]
+    # stale checkpoints are replaced
+    assert len([p for p in tmp_path.iterdir() if p.is_dir()]) == 2
+
+
+def test_checkpoint_stale_code(tmp_path):
+    directory = str(tmp_path)
+    graph = Graph()
+    calls = []
+
+    @graph.register(inputs=["a", "b"], outputs=["c", "d"])
+    def f_my_function(a, b):
+        calls.append("f1")
+        return a + b, [a] * b
+
+    @graph.register(inputs=["c", "d"], outputs=["e"])
+    def f_my_function2(c, d):
+        calls.append("f2")
+        return c * len(d)
+
+    graph.calculate({"a": 1, "b": 2}, checkpoint_dir=directory)
+
+    # the first node is edited
+    graph = Graph()
+    calls.clear()
+
+    @graph.register(inputs=["a", "b"], outputs=["c", "d"])
+    def f_edited(a, b):
+        calls.append("f1")
+        return a - b, [a] * b
+
+    graph.add_node(f_my_function2, inputs=["c", "d"], outputs=["e"])
+
+    res = graph.calculate({"a": 1, "b": 2}, checkpoint_dir=directory)
+    assert res == -2
+    assert calls == ["f1", "f2"]
+
+
+def test_checkpoint_numpy_memmap(tmp_path):
+    np = pytest.importorskip("numpy")
+    directory = str(tmp_path)
+    graph = Graph()
+
+    @graph.register(inputs=["a"], outputs=["b"])
+    def f_my_function(a):
+        return a * 2
+
+    @graph.register(inputs=["b"], outputs=["c"])
+    def f_my_function2(b):
+        return b.sum()
+
+    graph.calculate({"a": np.arange(10)}, checkpoint_dir=directory)
+    graph.calculate({"a": np.arange(10)}, checkpoint_dir=directory)
+    assert isinstance(graph.data["b"], np.memmap)
+    assert graph.data["c"] == 90
+
+
+def test_checkpoint_switch(tmp_path):
+    directory = str(tmp_path)
+    calls = []
+    graph = Graph()
+
+    @graph.register(inputs=["a"], outputs=["b"], when={"mode": 1})
+    def f_one(a):
+        calls.append("one")
+        return a + 1
+
+    @graph.register(inputs=["a"], outputs=["b"], when={"mode": 2})
+    def f_two(a):
+        calls.append("two")
+        return a + 2
+
+    @graph.register(inputs=["b"], outputs=["c"])
+    def f_my_function(b):
+        calls.append("f")
+        return b * 10
+
+    for mode, res, expected in [
+        (1, 20, ["one", "f"]),
+        (2, 30, ["two", "f"]),
+        # each branch keeps its own checkpoint
+        (1, 20, ["f"]),
+        (2, 30, ["f"]),
+    ]:
+        calls.clear()
+        data = {"mode": mode, "a": 1}
+        assert graph.calculate(data, checkpoint_dir=directory) == res
+        assert calls == expected
+
+
+def test_code_hash():
+    def make(x):
+        def wrap(a):
+            return a + x
+
+        return wrap
+
+    assert code_hash(make(1)) == code_hash(make(1))
+    assert code_hash(make(1)) != code_hash(make(2))
+    assert fingerprint({"a": 1}) == fingerprint({"a": 1})
+
+
+def test_code_hash_globals():
+    source = "def helper(a):\n    return a + {}\n\n\ndef f(a):\n    return helper(a)\n"
+    namespace = {}
+    exec(source.format(1), namespace)
+    first = code_hash(namespace["f"])
+    # the helper called by the node function is edited
+    exec(source.format(2), namespace)
+    assert code_hash(namespace["f"]) != first
+
+
+def test_checkpoint_unpicklable(tmp_path, caplog):
+    import threading
+
+    directory = str(tmp_path)
+    lock = threading.Lock()
+    graph = Graph()
+    calls = []
+
+    @graph.register(inputs=["a"], outputs=["b"])
+    def f_my_function(a):
+        calls.append("f1")
+        return a + 1
+
+    @graph.register(inputs=["b"], outputs=["c"])
+    def f_locked(b):
+        calls.append("f2")
+        with lock:
+            return b * 2
+
+    @graph.register(inputs=["c"], outputs=["d"])
+    def f_my_function3(c):
+        calls.append("f3")
+        return c + 1
+
+    assert graph.calculate({"a": 1}, checkpoint_dir=directory) == 5
+    assert "Cannot checkpoint" in caplog.text
+    calls.clear()
+    assert graph.calculate({"a": 1}, checkpoint_dir=directory) == 5
+    # the nodes after the unpicklable one are not checkpointed either
+    assert calls == ["f2", "f3"]
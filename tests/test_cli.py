@@ -0,0 +1,103 @@
+import csv
+import json
+import os
+
+import pytest
+
+from pyungo.cli import main, run
+from pyungo.core import Graph, PyungoError
+
+
+def make_graph():
+    graph = Graph()
+
+    @graph.register(inputs=["a", "b"], outputs=["c"])
+    def f_sum(a, b):
+        if a < 0:
+            raise ValueError("negative")
+        return a + b
+
+    @graph.register(inputs=["c"], outputs=["d"])
+    def f_double(c):
+        return c * 2
+
+    return graph
+
+
+def make_parallel_graph():
+    graph = Graph(parallel=True)
+    graph.add_node(lambda a: os.getpid(), inputs=["a"], outputs=["pid"])
+    return graph
+
+
+def _write_jsonl(path, records):
+    with open(path, "w") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+
+
+def _read_jsonl(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_run(tmp_path):
+    source = str(tmp_path / "in.jsonl")
+    records = [{"id": i, "a": i, "b": 1} for i in range(25)]
+    _write_jsonl(source, records)
+    for processes in [1, 2]:
+        target = str(tmp_path / "out{}.jsonl".format(processes))
+        progress = run(
+            "tests.test_cli:make_graph",
+            source,
+            target,
+            keep=["id"],
+            processes=processes,
+            chunk_size=4,
+        )
+        assert progress.records == 25
+        assert _read_jsonl(target) == [{"id": i, "d": (i + 1) * 2} for i in range(25)]
+
+
+def test_run_formats(tmp_path, capsys):
+    np = pytest.importorskip("numpy")
+    source = str(tmp_path / "in.npy")
+    array = np.zeros(5, dtype=[("a", "f8"), ("b", "i8")])
+    array["a"] = [1, 2, -3, 4, 5]
+    np.save(source, array)
+    target = str(tmp_path / "out.csv")
+    code = main(
+        ["run", "tests.test_cli:make_graph", source, "-o", target]
+        + ["--outputs", "c,d", "-j", "1", "--skip-errors", "--progress", "0"]
+    )
+    assert code == 0
+    with open(target) as f:
+        rows = list(csv.DictReader(f))
+    assert [float(r["d"]) for r in rows] == [2, 4, 8, 10]
+    assert "4 records, 1 errors" in capsys.readouterr().err
+
+
+def test_run_errors(tmp_path, capsys):
+    source = str(tmp_path / "in.jsonl")
+    _write_jsonl(source, [{"a": 1, "b": 1}, {"a": -1, "b": 1}])
+    target = str(tmp_path / "out.jsonl")
+    assert main(["run", "tests.test_cli:make_graph", source, "-o", target, "-q"]) == 1
+    assert "record 1 failed: Node" in capsys.readouterr().err
+    with pytest.raises(SystemExit):
+        main([])
+    assert "required" in capsys.readouterr().err
+    with pytest.raises(PyungoError) as err:
+        run("tests.test_cli", source, target)
+    assert "graph should be given as module:attribute" in str(err.value)
+    with pytest.raises(PyungoError) as err:
+        run("tests.test_cli:make_graph", source, str(tmp_path / "out.xlsx"))
+    assert "Unsupported format 'xlsx'" in str(err.value)
+
+
+def test_run_sequential(tmp_path):
+    source = str(tmp_path / "in.jsonl")
+    _write_jsonl(source, [{"a": 1}, {"a": 2}])
+    target = str(tmp_path / "out.jsonl")
+    run("tests.test_cli:make_parallel_graph", source, target, processes=1)
+    # no pool is opened for each record
+    assert _read_jsonl(target) == [{"pid": os.getpid()}] * 2
@@ -1,7 +1,9 @@
 import pytest
 
 from pyungo.core import Graph, PyungoError
+from pyungo.errors import NodeError
 from pyungo.io import Input, Output
+from pyungo.tracing import Trace
 
 
 def test_simple():
@@ -51,6 +53,17 @@ def test_simple_without_decorator():
     assert graph.data["e"] == -1.5
 
 
+def test_run_node():
+    graph = Graph()
+
+    @graph.register(inputs=["a", "b"], outputs=["c"])
+    def f_my_function(a, b):
+        return a + b
+
+    (node,) = graph._nodes.values()
+    assert Graph.run_node(node, {"a": 2, "b": 3}) == (node.id, 5)
+
+
 def test_simple_parallel():
     """ TODO: We could mock and make sure things are called correctly """
 
@@ -496,3 +509,929 @@ def test_no_side_effects_if_deepcopy_is_left_at_default():
     assert res == 4
     res = graph.calculate(data={"c": d, "e": 2})
     assert res == 4
+
+
+def test_critical_path_first():
+    graph = Graph()
+    calls = []
+
+    @graph.register(inputs=["a"], outputs=["b"], cost=0.1)
+    def f_short(a):
+        calls.append("short")
+        return a + 1
+
+    @graph.register(inputs=["a"], outputs=["c"], cost=1.0)
+    def f_long_1(a):
+        calls.append("long_1")
+        return a + 2
+
+    @graph.register(inputs=["c"], outputs=["d"], cost=1.0)
+    def f_long_2(c):
+        calls.append("long_2")
+        return c + 3
+
+    @graph.register(inputs=["b", "d"], outputs=["e"])
+    def f_sink(b, d):
+        calls.append("sink")
+        return b + d
+
+    res = graph.calculate(data={"a": 1})
+
+    assert res == 8
+    assert calls == ["long_1", "long_2", "short", "sink"]
+
+
+def test_runtimes_ewma():
+    from pyungo.core import RUNTIME_EWMA_ALPHA
+
+    graph = Graph()
+
+    @graph.register(inputs=["a"], outputs=["b"], cost=5.0)
+    def f_my_function(a):
+        return a + 1
+
+    node_id = list(graph._nodes)[0]
+    assert graph.runtimes == {}
+    graph.calculate(data={"a": 1})
+    first = graph.runtimes[node_id]
+    assert 0 < first < 5.0
+    graph._update_runtime(node_id, first + 1)
+    assert graph.runtimes[node_id] == pytest.approx(first + RUNTIME_EWMA_ALPHA)
+
+
+def test_adaptive_offload():
+    import time
+
+    graph = Graph(parallel=True, adaptive=True)
+
+    @graph.register(inputs=["a"], outputs=["b"])
+    def f_fast(a):
+        return a + 1
+
+    @graph.register(inputs=["b"], outputs=["c"], cost=10.0)
+    def f_slow(b):
+        time.sleep(0.05)
+        return b * 2
+
+    res = graph.calculate(data={"a": 1})
+
+    assert res == 4
+    report = {r["function"]: r for r in graph.offload_report.values()}
+    assert report["f_fast"]["offloaded"] is False
+    assert report["f_slow"]["offloaded"] is True
+    assert report["f_slow"]["payload_bytes"] > 0
+    assert report["f_slow"]["switches"] == 0
+
+
+def test_adaptive_offload_hysteresis():
+    graph = Graph(parallel=True, adaptive=True)
+
+    @graph.register(inputs=["a"], outputs=["b"])
+    def f_my_function(a):
+        return a + 1
+
+    node_id = list(graph._nodes)[0]
+    graph._offload_overheads[node_id] = 1.0
+    graph._runtimes[node_id] = 1.5
+    assert graph._should_offload(node_id) is False
+    graph._runtimes[node_id] = 2.5
+    assert graph._should_offload(node_id) is True
+    graph._runtimes[node_id] = 1.0
+    assert graph._should_offload(node_id) is True
+    graph._runtimes[node_id] = 0.4
+    assert graph._should_offload(node_id) is False
+    assert graph.offload_report[node_id]["switches"] == 2
+
+
+def test_concurrent_calculate():
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    graph = Graph()
+
+    @graph.register(inputs=["a", "b"], outputs=["c"])
+    def f_my_function(a, b):
+        time.sleep(0.01)
+        return a + b
+
+    @graph.register(inputs=["c"], outputs=["d"])
+    def f_my_function2(c):
+        time.sleep(0.01)
+        return c * 10
+
+    def run(i):
+        res = graph.calculate(data={"a": i, "b": 1})
+        return res, graph.data["c"]
+
+    with ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(run, range(32)))
+
+    assert results == [((i + 1) * 10, i + 1) for i in range(32)]
+    for node in graph._nodes.values():
+        assert all(i.value is None for i in node._inputs)
+
+
+def test_node_error():
+    graph = Graph()
+
+    @graph.register(inputs=["a"], outputs=["b"], cost=2)
+    def f_fail(a):
+        raise ValueError("boom")
+
+    @graph.register(inputs=["a"], outputs=["c"], cost=1)
+    def f_ok(a):
+        return a
+
+    @graph.register(inputs=["b", "c"], outputs=["d"])
+    def f_after(b, c):
+        return b + c
+
+    with pytest.raises(NodeError) as err:
+        graph.calculate(data={"a": 1})
+
+    ids = {n.fct_name: i for i, n in graph._nodes.items()}
+    assert err.value.node_id == ids["f_fail"]
+    assert isinstance(err.value.error, ValueError)
+    assert isinstance(err.value.__cause__, ValueError)
+    # the original type can still be caught
+    assert isinstance(err.value, ValueError)
+    assert err.value.completed == []
+    assert err.value.cancelled == [ids["f_ok"]]
+    assert err.value.not_started == [ids["f_after"]]
+    assert "f_fail" in str(err.value)
+
+
+def test_node_error_parallel_interrupt():
+    import time
+
+    graph = Graph(parallel=True, pool_size=2)
+
+    @graph.register(inputs=["a"], outputs=["b"])
+    def f_fail(a):
+        time.sleep(0.1)
+        raise ValueError("boom")
+
+    @graph.register(inputs=["a"], outputs=["c"])
+    def f_slow(a):
+        time.sleep(10)
+        return a
+
+    t1 = time.time()
+    with pytest.raises(NodeError) as err:
+        graph.calculate(data={"a": 1})
+    assert time.time() - t1 < 5
+
+    ids = {n.fct_name: i for i, n in graph._nodes.items()}
+    assert err.value.node_id == ids["f_fail"]
+    assert err.value.cancelled == [ids["f_slow"]]
+    assert err.value.completed == []
+    assert isinstance(err.value, ValueError)
+    assert "ValueError: boom" in str(err.value)
+
+
+def test_sweep():
+    pytest.importorskip("pandas")
+    graph = Graph()
+    calls = []
+
+    @graph.register(inputs=["a", "b"], outputs=["c"])
+    def f_fixed(a, b):
+        calls.append("fixed")
+        return a + b
+
+    @graph.register(inputs=["c", "x"], outputs=["d"])
+    def f_swept(c, x):
+        calls.append("swept")
+        return c * x
+
+    @graph.register(inputs=["d", "y"], outputs=["e"])
+    def f_swept2(d, y):
+        return d - y
+
+    res = graph.sweep({"a": 1, "b": 2}, {"x": [1, 2, 3], "y": [0, 10]})
+
+    assert calls.count("fixed") == 1
+    assert calls.count("swept") == 6
+    assert list(res.columns) == ["e"]
+    assert list(res.index.names) == ["x", "y"]
+    assert res.loc[(2, 10), "e"] == -4
+    assert res.loc[(3, 0), "e"] == 9
+
+    res = graph.sweep({"a": 1, "b": 2, "y": 1}, {"x": [1, 2]}, outputs=["c", "d"])
+    assert list(res.index) == [1, 2]
+    assert list(res["c"]) == [3, 3]
+    assert list(res["d"]) == [3, 6]
+
+
+def test_sweep_parallel():
+    pytest.importorskip("pandas")
+    graph = Graph(parallel=True)
+
+    @graph.register(inputs=["a", "b"], outputs=["c"])
+    def f_fixed(a, b):
+        return a + b
+
+    @graph.register(inputs=["c", "x"], outputs=["d"])
+    def f_swept(c, x):
+        return c * x
+
+    @graph.register(inputs=["d", "y"], outputs=["e"])
+    def f_swept2(d, y):
+        return d - y
+
+    res = graph.sweep({"a": 1, "b": 2}, {"x": [1, 2, 3], "y": [0, 10]})
+
+    assert list(res["e"]) == [3, -7, 6, -4, 9, -1]
+
+
+def test_sweep_unknown_input():
+    graph = Graph()
+
+    @graph.register(inputs=["a", "x"], outputs=["b"])
+    def f_my_function(a, x):
+        return a * x
+
+    with pytest.raises(PyungoError) as err:
+        graph.sweep({"a": 1, "x": 1}, {"z": [1, 2]})
+
+    assert "swept inputs are not used by the model: ['z']" in str(err.value)
+
+
+def test_sweep_selector():
+    pytest.importorskip("pandas")
+    graph = Graph()
+    calls = []
+
+    @graph.register(inputs=["a"], outputs=["b"], when={"mode": 1})
+    def f_one(a):
+        calls.append("one")
+        return a + 1
+
+    @graph.register(inputs=["a"], outputs=["b"], when={"mode": 2})
+    def f_two(a):
+        calls.append("two")
+        return a + 2
+
+    @graph.register(inputs=["b"], outputs=["c"])
+    def f_my_function(b):
+        return b * 10
+
+    @graph.register(inputs=["a"], outputs=["d"])
+    def f_fixed(a):
+        calls.append("fixed")
+        return a
+
+    res = graph.sweep({"a": 1}, {"mode": [1, 2]}, outputs=["c"])
+
+    assert list(res["c"]) == [20, 30]
+    assert sorted(calls) == ["fixed", "one", "two"]
+
+
+def test_parallel_tasks_carry_node_ids():
+    big = b"x" * 10 ** 6
+
+    graph = Graph(parallel=True, adaptive=True)
+
+    @graph.register(inputs=["a"], outputs=["b"], cost=10.0)
+    def f_my_function(a):
+        return a + len(big)
+
+    res = graph.calculate(data={"a": 1})
+
+    assert res == 10 ** 6 + 1
+    (report,) = graph.offload_report.values()
+    assert report["offloaded"] is True
+    assert report["payload_bytes"] < 1000
+
+
+def test_switch():
+    graph = Graph()
+    calls = []
+
+    @graph.register(inputs=["model"], outputs=["selected"])
+    def f_select(model):
+        calls.append("select")
+        return model.lower()
+
+    @graph.register(inputs=["a"], outputs=["x"])
+    def f_prepare(a):
+        calls.append("prepare")
+        return a * 10
+
+    @graph.register(inputs=["x"], outputs=["t"], when={"selected": "sapm"})
+    def f_sapm(x):
+        calls.append("sapm")
+        return x + 1
+
+    @graph.register(inputs=["a"], outputs=["t"], when={"selected": "pvsyst"})
+    def f_pvsyst(a):
+        calls.append("pvsyst")
+        return a + 2
+
+    @graph.register(inputs=["t", "a"], outputs=["power"])
+    def f_power(t, a):
+        calls.append("power")
+        return t * a
+
+    res = graph.calculate(data={"model": "SAPM", "a": 2})
+    assert res == 42
+    assert sorted(calls) == ["power", "prepare", "sapm", "select"]
+
+    # prepare only feeds the sapm branch, it is skipped too
+    calls.clear()
+    res = graph.calculate(data={"model": "PVsyst", "a": 2})
+    assert res == 8
+    assert sorted(calls) == ["power", "pvsyst", "select"]
+    assert "x" not in graph.data.outputs
+
+    with pytest.raises(NodeError) as err:
+        graph.calculate(data={"model": "unknown", "a": 2})
+    assert isinstance(err.value.error, PyungoError)
+    assert "No branch selected for ['t']" in str(err.value)
+
+
+def test_switch_branch_inputs():
+    graph = Graph()
+
+    @graph.register(inputs=["model"], outputs=["selected"])
+    def f_select(model):
+        return model.lower()
+
+    @graph.register(inputs=["sapm_params"], outputs=["x"])
+    def f_prepare(sapm_params):
+        return sapm_params * 10
+
+    @graph.register(inputs=["x"], outputs=["t"], when={"selected": "sapm"})
+    def f_sapm(x):
+        return x + 1
+
+    @graph.register(
+        inputs=["a", "pvsyst_params"], outputs=["t"], when={"selected": "pvsyst"}
+    )
+    def f_pvsyst(a, pvsyst_params):
+        return a + pvsyst_params
+
+    @graph.register(inputs=["t", "a"], outputs=["power"])
+    def f_power(t, a):
+        return t * a
+
+    # the inputs of the branch not selected are not needed
+    assert graph.calculate(data={"model": "sapm", "a": 2, "sapm_params": 2}) == 42
+    assert graph.calculate(data={"model": "pvsyst", "a": 2, "pvsyst_params": 2}) == 8
+    data = {"model": "sapm", "a": 2, "sapm_params": 2, "pvsyst_params": 2}
+    assert graph.calculate(data=data) == 42
+
+    with pytest.raises(PyungoError) as err:
+        graph.calculate(data={"model": "pvsyst", "a": 2, "sapm_params": 2})
+    assert "The following inputs are needed: ['pvsyst_params']" in str(err.value)
+    with pytest.raises(PyungoError) as err:
+        graph.calculate(data={"model": "sapm", "sapm_params": 2})
+    assert "The following inputs are needed: ['a']" in str(err.value)
+
+
+def test_switch_parallel():
+    graph = Graph(parallel=True)
+
+    @graph.register(inputs=["model"], outputs=["selected"])
+    def f_select(model):
+        return model.lower()
+
+    @graph.register(inputs=["a"], outputs=["x"])
+    def f_prepare(a):
+        return a * 10
+
+    @graph.register(inputs=["x"], outputs=["t"], when={"selected": "sapm"})
+    def f_sapm(x):
+        return x + 1
+
+    @graph.register(inputs=["a"], outputs=["t"], when={"selected": "pvsyst"})
+    def f_pvsyst(a):
+        return a + 2
+
+    @graph.register(inputs=["t", "a"], outputs=["power"])
+    def f_power(t, a):
+        return t * a
+
+    assert graph.calculate(data={"model": "pvsyst", "a": 2}) == 8
+    assert graph.calculate(data={"model": "sapm", "a": 2}) == 42
+
+
+def test_switch_input_selector_last_node():
+    graph = Graph()
+
+    @graph.register(inputs=["a"], outputs=["b"], when={"mode": 1})
+    def f_one(a):
+        return a + 1
+
+    @graph.register(inputs=["a"], outputs=["b"], when={"mode": 2})
+    def f_two(a):
+        return a + 2
+
+    assert graph.calculate(data={"mode": 1, "a": 1}) == 2
+    assert graph.calculate(data={"mode": 2, "a": 1}) == 3
+
+
+def test_switch_same_output_needs_alternatives():
+    graph = Graph()
+
+    @graph.register(inputs=["a"], outputs=["b"], when={"mode": 1})
+    def f_one(a):
+        return a + 1
+
+    with pytest.raises(PyungoError) as err:
+
+        @graph.register(inputs=["a"], outputs=["b"], when={"mode": 1})
+        def f_two(a):
+            return a + 2
+
+    assert "b output already exist" in str(err.value)
+
+    with pytest.raises(PyungoError) as err:
+        graph.add_node(lambda a: a, inputs=["a"], outputs=["c"], when="mode")
+    assert "when should be a dict" in str(err.value)
+
+
+def test_map_node():
+    graph = Graph()
+
+    @graph.register(inputs=["n"], outputs=["inverters"])
+    def f_inverters(n):
+        return list(range(n))
+
+    @graph.register(
+        inputs=["inverters", "scale"], outputs=["power"], map_over="inverters"
+    )
+    def f_power(inverter, scale):
+        return inverter * scale
+
+    assert graph.calculate(data={"n": 4, "scale": 2}) == [0, 2, 4, 6]
+    assert graph.calculate(data={"n": 0, "scale": 2}) == []
+
+
+def test_map_reduce_parallel_chunks():
+    graph = Graph(parallel=True, pool_size=3)
+    trace = Trace()
+
+    @graph.register(inputs=["n"], outputs=["inverters"])
+    def f_inverters(n):
+        return list(range(n))
+
+    @graph.register(
+        inputs=["inverters", "scale"],
+        outputs=["power"],
+        map_over="inverters",
+        chunk_size=1000,
+        reduce=sum,
+    )
+    def f_power(inverter, scale):
+        return inverter * scale
+
+    res = graph.calculate(data={"n": 20000, "scale": 2}, trace=trace)
+
+    assert res == 2 * sum(range(20000))
+    chunks = [e for e in trace.events if e["name"].startswith("f_power[")]
+    assert len(chunks) == 20
+    assert sum(e["args"]["elements"] for e in chunks) == 20000
+
+
+def test_map_multiple_outputs_parallel():
+    graph = Graph(parallel=True)
+
+    @graph.register(inputs=["a", "b"], outputs=["c", "d"], map_over="a")
+    def f_my_function(a, b):
+        return a + b, a * b
+
+    c, d = graph.calculate(data={"a": [1, 2, 3], "b": 10})
+    assert c == [11, 12, 13]
+    assert d == [10, 20, 30]
+
+
+def test_map_error():
+    with pytest.raises(PyungoError) as err:
+        Graph().add_node(lambda a: a, inputs=["a"], outputs=["b"], map_over="x")
+    assert "mapped input x is not an input of the node" in str(err.value)
+
+    graph = Graph(parallel=True)
+
+    @graph.register(inputs=["a"], outputs=["b"], map_over="a", chunk_size=2)
+    def f_my_function(a):
+        return 1 / a
+
+    with pytest.raises(NodeError) as err:
+        graph.calculate(data={"a": [1, 2, 0, 4]})
+    assert isinstance(err.value.error, ZeroDivisionError)
+
+
+def test_map_error_stops_chunks(tmp_path):
+    graph = Graph(parallel=True, pool_size=2, interrupt_on_error=False)
+    directory = str(tmp_path)
+
+    @graph.register(inputs=["a"], outputs=["b"], map_over="a", chunk_size=1)
+    def f_my_function(a):
+        import os
+        import time
+
+        open(os.path.join(directory, str(a)), "w").close()
+        time.sleep(0.05)
+        return 1 / a
+
+    with pytest.raises(NodeError) as err:
+        graph.calculate(data={"a": list(range(20))})
+    assert isinstance(err.value.error, ZeroDivisionError)
+    # the chunks running when the first one failed finish, no other starts
+    assert len(list(tmp_path.iterdir())) <= 3
+
+
+def test_add_node_after_calculate():
+    graph = Graph()
+    graph.add_node(lambda a: a + 1, inputs=["a"], outputs=["b"])
+    assert graph.calculate(data={"a": 1}) == 2
+
+    graph.add_node(lambda b: b * 10, inputs=["b"], outputs=["c"])
+    assert graph.calculate(data={"a": 1}) == 20
+
+
+def test_remove_replace_node():
+    graph = Graph()
+    graph.add_node(lambda a: a + 1, inputs=["a"], outputs=["b"])
+    node_id = graph.add_node(lambda b: b * 10, inputs=["b"], outputs=["c"])
+    tail_id = graph.add_node(lambda c: c - 1, inputs=["c"], outputs=["d"])
+    assert graph.calculate(data={"a": 1}) == 19
+
+    new_id = graph.replace_node(node_id, lambda b: b * 100, inputs=["b"], outputs=["c"])
+    assert graph.calculate(data={"a": 1}) == 199
+    assert node_id not in graph.runtimes
+
+    # the graph is left unchanged when the new node is invalid
+    with pytest.raises(PyungoError):
+        graph.replace_node(new_id, lambda a: a, inputs=["a"], outputs=["b"])
+    assert graph.calculate(data={"a": 1}) == 199
+
+    graph.remove_node(tail_id)
+    assert graph.calculate(data={"a": 1}) == 200
+    assert [len(nodes) for nodes in graph.dag] == [1, 1]
+
+    with pytest.raises(PyungoError) as err:
+        graph.remove_node(tail_id)
+    assert "does not exist" in str(err.value)
+
+
+def test_remove_node_breaks_cycle():
+    graph = Graph()
+    graph.add_node(lambda a, c: a + c, inputs=["a", "c"], outputs=["b"])
+    node_id = graph.add_node(lambda b: b, inputs=["b"], outputs=["c"])
+
+    with pytest.raises(PyungoError) as err:
+        graph.calculate(data={"a": 1})
+    assert "A cyclic dependency exists amongst" in str(err.value)
+
+    graph.replace_node(node_id, lambda a: a, inputs=["a"], outputs=["c"])
+    assert graph.calculate(data={"a": 1}) == 2
+
+
+def test_incremental_levels():
+    import random
+
+    from pyungo.core import topological_sort
+
+    rng = random.Random(0)
+    graph = Graph()
+    ids = {}
+    # nodes added in random order: consumers may exist before producers
+    names = list(range(60))
+    rng.shuffle(names)
+    for i in names:
+        inputs = ["x{}".format(j) for j in rng.sample(range(i), min(i, 3))] or ["a"]
+        ids[i] = graph.add_node(
+            lambda *args: sum(args), inputs=inputs, outputs=["x{}".format(i)]
+        )
+    for i in rng.sample(names, 20):
+        graph.remove_node(ids[i])
+    graph._compile()
+    expected = list(topological_sort(graph._dependencies()))
+    assert graph._sorted_dep == expected
+
+
+def _timed(name):
+    def f(a):
+        import time
+
+        start = time.time()
+        time.sleep(0.05)
+        return start, time.time()
+
+    f.__name__ = name
+    return f
+
+
+def test_resources_named():
+    graph = Graph(parallel=True, pool_size=3, resources={"database": 1})
+    for i in range(3):
+        graph.add_node(
+            _timed("f_{}".format(i)),
+            inputs=["a"],
+            outputs=["b{}".format(i)],
+            resources={"database": 1},
+        )
+    graph.add_node(lambda *b: sorted(b), inputs=["b0", "b1", "b2"], outputs=["c"])
+
+    intervals = graph.calculate(data={"a": 1})
+
+    for (_, end), (start, _) in zip(intervals, intervals[1:]):
+        assert start >= end - 1e-3
+
+
+def test_resources_cpus_thread_limits():
+    graph = Graph(parallel=True, pool_size=2)
+
+    @graph.register(inputs=["a"], outputs=["b"], resources={"cpus": 2})
+    def f_blas(a):
+        import os
+
+        return os.environ["OMP_NUM_THREADS"]
+
+    assert graph.calculate(data={"a": 1}) == "2"
+
+
+def test_resources_errors():
+    with pytest.raises(PyungoError) as err:
+        Graph().add_node(
+            lambda a: a, inputs=["a"], outputs=["b"], resources={"cpus": -1}
+        )
+    assert "resource cpus should be a positive number" in str(err.value)
+
+    graph = Graph(parallel=True, pool_size=2, resources={"memory": 100})
+    node_id = graph.add_node(
+        lambda a: a, inputs=["a"], outputs=["b"], resources={"database": 1}
+    )
+    with pytest.raises(PyungoError) as err:
+        graph.calculate(data={"a": 1})
+    assert "needs resource database not provided by the graph" in str(err.value)
+
+    graph.replace_node(
+        node_id, lambda a: a, inputs=["a"], outputs=["b"], resources={"memory": 200}
+    )
+    with pytest.raises(PyungoError) as err:
+        graph.calculate(data={"a": 1})
+    assert "needs 200 memory, the graph only has 100" in str(err.value)
+
+
+def test_deduplicate():
+    graph = Graph(deduplicate=True)
+    calls = []
+
+    def f_irradiance(a, scale):
+        calls.append(scale)
+        return a * scale
+
+    graph.add_node(f_irradiance, inputs=["a", {"scale": 2}], outputs=["poa"])
+    graph.add_node(f_irradiance, inputs=["a", {"scale": 2}], outputs=["poa_copy"])
+    graph.add_node(f_irradiance, inputs=["a", {"scale": 3}], outputs=["poa_3"])
+    graph.add_node(
+        lambda poa, poa_copy, poa_3: poa + poa_copy + poa_3,
+        inputs=["poa", "poa_copy", "poa_3"],
+        outputs=["total"],
+    )
+
+    assert graph.calculate(data={"a": 1}) == 7
+    # the duplicate of the first node is not run
+    assert sorted(calls) == [2, 3]
+    assert graph.data["poa"] == graph.data["poa_copy"] == 2
+    assert graph.aliases == {"poa_copy": "poa"}
+
+
+def test_deduplicate_parallel():
+    graph = Graph(deduplicate=True, parallel=True)
+
+    def f_irradiance(a, scale):
+        return a * scale
+
+    graph.add_node(f_irradiance, inputs=["a", {"scale": 2}], outputs=["poa"])
+    graph.add_node(f_irradiance, inputs=["a", {"scale": 2}], outputs=["poa_copy"])
+    graph.add_node(
+        lambda poa, poa_copy: poa + poa_copy,
+        inputs=["poa", "poa_copy"],
+        outputs=["total"],
+    )
+
+    assert graph.calculate(data={"a": 1}) == 4
+    assert graph.data["poa_copy"] == 2
+    assert graph.aliases == {"poa_copy": "poa"}
+
+
+def test_deduplicate_disabled():
+    graph = Graph()
+    graph.add_node(abs, inputs=["a"], outputs=["b"])
+    graph.add_node(abs, inputs=["a"], outputs=["c"])
+    graph.calculate(data={"a": -1})
+    assert graph.aliases == {}
+
+
+def test_deduplicate_switch():
+    calls = []
+    graph = Graph(deduplicate=True)
+
+    def f_prepare(a):
+        calls.append("prepare")
+        return a * 10
+
+    graph.add_node(f_prepare, inputs=["a"], outputs=["x"])
+    graph.add_node(f_prepare, inputs=["a"], outputs=["y"])
+    graph.add_node(lambda x: x + 1, inputs=["x"], outputs=["t"], when={"mode": 1})
+    graph.add_node(lambda y: y + 2, inputs=["y"], outputs=["t"], when={"mode": 2})
+
+    assert graph.calculate(data={"mode": 1, "a": 1}) == 11
+    assert graph.calculate(data={"mode": 2, "a": 1}) == 12
+    assert calls == ["prepare", "prepare"]
+
+
+def test_specialize():
+    graph = Graph()
+    calls = []
+
+    @graph.register(inputs=["module", {"factor": 2}], outputs=["params"])
+    def f_params(module, factor):
+        calls.append("params")
+        return module * factor
+
+    @graph.register(inputs=["params", "weather"], outputs=["dc"])
+    def f_dc(params, weather):
+        calls.append("dc")
+        return params + weather
+
+    @graph.register(inputs=["dc", "inverter"], outputs=["ac"])
+    def f_ac(dc, inverter):
+        calls.append("ac")
+        return dc * inverter
+
+    specialized = graph.specialize({"module": 5, "inverter": 3})
+    assert calls == ["params"]
+    assert len(specialized.dag) == 2
+
+    assert specialized.calculate(data={"weather": 1}) == 33
+    assert specialized.calculate(data={"weather": 2}) == 36
+    assert calls == ["params", "dc", "ac", "dc", "ac"]
+    assert specialized.data["params"] == 10
+    assert graph.calculate(data={"module": 5, "inverter": 3, "weather": 1}) == 33
+
+    # specialize in two steps
+    again = graph.specialize({"module": 5}).specialize({"weather": 1})
+    assert len(again.dag) == 1
+    assert again.calculate(data={"inverter": 3}) == 33
+
+    with pytest.raises(PyungoError) as err:
+        specialized.calculate(data={"weather": 1, "inverter": 3})
+    assert "The following inputs are fixed in the model: ['inverter']" in str(err.value)
+    with pytest.raises(PyungoError) as err:
+        graph.specialize({"unknown": 1})
+    assert "fixed inputs are not used by the model: ['unknown']" in str(err.value)
+
+
+def test_specialize_sweep():
+    pytest.importorskip("pandas")
+    graph = Graph()
+
+    @graph.register(inputs=["module", {"factor": 2}], outputs=["params"])
+    def f_params(module, factor):
+        return module * factor
+
+    @graph.register(inputs=["inverter", "losses"], outputs=["efficiency"])
+    def f_efficiency(inverter, losses):
+        return inverter - losses
+
+    @graph.register(inputs=["params", "weather", "efficiency"], outputs=["ac"])
+    def f_ac(params, weather, efficiency):
+        return (params + weather) * efficiency
+
+    specialized = graph.specialize({"module": 5, "inverter": 4})
+    # the bound inputs are needed by the swept nodes and the other ones
+    res = specialized.sweep({"losses": 1}, {"weather": [1, 2]})
+    assert res["ac"].tolist() == [33, 36]
+
+
+def test_locality():
+    import os
+
+    graph = Graph(parallel=True, pool_size=2, locality=True)
+
+    @graph.register(inputs=["n"], outputs=["values", "pid_values"])
+    def f_values(n):
+        return list(range(n)), os.getpid()
+
+    @graph.register(inputs=["values"], outputs=["squares", "pid_squares"])
+    def f_squares(values):
+        return [v * v for v in values], os.getpid()
+
+    @graph.register(inputs=["squares", "pid_values", "pid_squares"], outputs=["res"])
+    def f_sum(squares, pid_values, pid_squares):
+        return sum(squares), pid_values, pid_squares, os.getpid()
+
+    total, pid_values, pid_squares, pid_sum = graph.calculate(data={"n": 1000})
+    assert total == sum(v * v for v in range(1000))
+    # the chain stays in the process holding its inputs
+    assert pid_values == pid_squares == pid_sum
+    assert "values" not in graph.data.outputs
+    assert "squares" not in graph.data.outputs
+
+    graph.calculate(data={"n": 10}, outputs=["squares"])
+    assert graph.data["squares"] == [v * v for v in range(10)]
+    assert "values" not in graph.data.outputs
+
+    with pytest.raises(PyungoError) as err:
+        graph.calculate(data={"n": 10}, outputs=["unknown"])
+    assert "not calculated by the model: ['unknown']" in str(err.value)
+    with pytest.raises(PyungoError) as err:
+        Graph(scheduler=object(), locality=True)
+    assert "locality is not supported with a shared scheduler" in str(err.value)
+
+
+def test_locality_switch():
+    graph = Graph(parallel=True, locality=True)
+
+    @graph.register(inputs=["model"], outputs=["selected"])
+    def f_select(model):
+        return model.lower()
+
+    @graph.register(inputs=["a"], outputs=["x"])
+    def f_prepare(a):
+        return a * 10
+
+    @graph.register(inputs=["x"], outputs=["t"], when={"selected": "sapm"})
+    def f_sapm(x):
+        return x + 1
+
+    @graph.register(inputs=["a"], outputs=["t"], when={"selected": "pvsyst"})
+    def f_pvsyst(a):
+        return a + 2
+
+    @graph.register(inputs=["t", "a"], outputs=["power"])
+    def f_power(t, a):
+        return t * a
+
+    assert graph.calculate(data={"model": "pvsyst", "a": 2}) == 8
+    assert graph.calculate(data={"model": "sapm", "a": 2}) == 42
+
+
+def test_node_ids():
+    import pickle
+
+    graph = Graph()
+    first = graph.add_node(len, inputs=["a"], outputs=["b"])
+    second = graph.add_node(len, inputs=["b"], outputs=["c"])
+    assert isinstance(first, int)
+    assert second > first
+
+    node = pickle.loads(pickle.dumps(graph._get_node(second)))
+    assert node.id == second
+    assert node.input_names == ["b"]
+    assert graph.add_node(len, inputs=["c"], outputs=["d"]) > second
+
+    with pytest.raises(AttributeError):
+        Input("a").other = 1
+
+
+def test_batch():
+    from concurrent.futures import ThreadPoolExecutor
+
+    graph = Graph()
+    calls = []
+
+    @graph.register(
+        inputs=["a", {"k": 10}], outputs=["b"], batch_size=4, batch_wait=0.2
+    )
+    def f_infer(a, k):
+        calls.append(list(a))
+        return [x * k for x in a]
+
+    @graph.register(inputs=["b", "a"], outputs=["c"])
+    def f_add(b, a):
+        return b + a
+
+    with ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(lambda a: graph.calculate({"a": a}), range(8)))
+    assert results == [a * 11 for a in range(8)]
+    assert sorted(x for batch in calls for x in batch) == list(range(8))
+    assert max(len(batch) for batch in calls) == 4
+    report = graph.batch_report
+    assert list(report.values())[0]["calls"] == 8
+    assert graph.calculate({"a": 3}) == 33
+
+
+def test_batch_error():
+    graph = Graph()
+
+    @graph.register(inputs=["a"], outputs=["b"], batch_size=4)
+    def f_infer(a):
+        if -1 in a:
+            raise ValueError("bad input")
+        return list(a)
+
+    with pytest.raises(NodeError) as err:
+        graph.calculate({"a": -1})
+    assert "bad input" in str(err.value)
+    with pytest.raises(PyungoError) as err:
+        graph.add_node(len, inputs=["a"], outputs=["d"], batch_size=0)
+    assert "batch_size should be a strictly positive integer" in str(err.value)
+    with pytest.raises(PyungoError) as err:
+        graph.add_node(len, inputs=["a"], outputs=["d"], batch_size=2, map_over="a")
+    assert "map nodes cannot be batched" in str(err.value)
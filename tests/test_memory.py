@@ -0,0 +1,106 @@
+import pytest
+
+from pyungo.core import Graph
+from pyungo.memory import MemoryProfile, PeakMemory, retained_size
+from pyungo.tracing import Trace
+
+np = pytest.importorskip("numpy")
+
+
+def test_retained_size(tmp_path):
+    array = np.zeros(1000)
+    assert retained_size(array) >= 8000
+    # a view retains the whole buffer
+    assert retained_size(array[:10]) >= 8000
+    assert retained_size([array, array[:10]]) < 2 * 8000
+    assert retained_size({"a": array}) >= 8000
+    path = str(tmp_path / "a.npy")
+    np.save(path, array)
+    assert retained_size(np.load(path, mmap_mode="r")) < 8000
+
+
+def test_peak_memory():
+    with PeakMemory() as peak:
+        x = bytearray(10 ** 6)
+        del x
+    assert peak.value >= 10 ** 6
+
+
+def test_memory_profile():
+    graph = Graph()
+
+    @graph.register(inputs=["a"], outputs=["b"])
+    def f_big(a):
+        tmp = np.ones(a * 2)
+        return tmp[:a].copy()
+
+    @graph.register(inputs=["b"], outputs=["c"])
+    def f_small(b):
+        return float(b.sum())
+
+    assert graph.memory_profile is None
+    res = graph.calculate(data={"a": 10 ** 5}, profile_memory=True)
+
+    assert res == 10 ** 5
+    profile = graph.memory_profile
+    assert isinstance(profile, MemoryProfile)
+    (node_id, top), _ = profile.top(2)
+    assert top["function"] == "f_big"
+    assert top["peak"] >= 8 * 2 * 10 ** 5
+    assert top["outputs"]["b"] >= 8 * 10 ** 5
+    assert profile.peak_live == profile.live >= 8 * 10 ** 5
+    assert len(profile.timeline) == 2
+
+    graph.calculate(data={"a": 10})
+    assert graph.memory_profile is None
+
+
+def test_memory_profile_threads():
+    import threading
+    import time
+
+    graph = Graph()
+
+    @graph.register(inputs=["a"], outputs=["b"])
+    def f_big(a):
+        tmp = np.ones(a * 2)
+        time.sleep(0.05)
+        return tmp[:a].copy()
+
+    peaks = []
+
+    def run():
+        graph.calculate(data={"a": 10 ** 5}, profile_memory=True)
+        nodes = graph.memory_profile.nodes.values()
+        peaks.append({n["function"]: n["peak"] for n in nodes}["f_big"])
+
+    threads = [threading.Thread(target=run) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(peaks) == 4
+    assert all(8 * 2 * 10 ** 5 <= p < 2 * 8 * 2 * 10 ** 5 for p in peaks)
+
+
+def test_memory_profile_parallel_with_trace():
+    graph = Graph(parallel=True)
+    trace = Trace()
+
+    @graph.register(inputs=["a"], outputs=["b"])
+    def f_big(a):
+        tmp = np.ones(a * 2)
+        return tmp[:a].copy()
+
+    @graph.register(inputs=["b"], outputs=["c"])
+    def f_small(b):
+        return float(b.sum())
+
+    graph.calculate(data={"a": 10 ** 5}, trace=trace, profile_memory=True)
+
+    peaks = {n["function"]: n["peak"] for n in graph.memory_profile.nodes.values()}
+    assert peaks["f_big"] >= 8 * 2 * 10 ** 5
+    counters = [e for e in trace.events if e["ph"] == "C"]
+    assert len(counters) == 2
+    nodes = [e for e in trace.events if e["cat"] == "node"]
+    assert all(e["args"]["peak_memory"] is not None for e in nodes)
@@ -0,0 +1,158 @@
+import os
+import threading
+
+import pytest
+
+from pyungo.core import Graph, PyungoError
+
+
+class Connection:
+    def __init__(self, created):
+        self.closed = False
+        created.append(self)
+
+    def close(self):
+        self.closed = True
+
+
+def test_provide_process():
+    created = []
+    graph = Graph()
+    graph.provide("db", lambda: Connection(created), scope="process")
+
+    @graph.register(inputs=["db", "a"], outputs=["b"])
+    def f_b(db, a):
+        return (id(db), os.getpid(), a + 1)
+
+    @graph.register(inputs=["db", "b"], outputs=["c"])
+    def f_c(db, b):
+        return (id(db), os.getpid(), b[2] * 2)
+
+    assert created == []
+    res = graph.calculate({"a": 1})
+    assert res[2] == 4
+    assert graph.data["b"][0] == res[0]
+    graph.calculate({"a": 2})
+    assert len(created) == 1
+    assert not created[0].closed
+    graph.close()
+    assert created[0].closed
+    graph.calculate({"a": 3})
+    assert len(created) == 2
+
+
+def test_provide_calculate():
+    created = []
+    graph = Graph()
+    graph.provide("db", lambda: Connection(created), scope="calculate")
+
+    @graph.register(inputs=["db", "a"], outputs=["b"])
+    def f_b(db, a):
+        return (id(db), os.getpid(), a + 1)
+
+    @graph.register(inputs=["db", "b"], outputs=["c"])
+    def f_c(db, b):
+        return (id(db), os.getpid(), b[2] * 2)
+
+    graph.calculate({"a": 1})
+    graph.calculate({"a": 2})
+    assert len(created) == 2
+    assert all(c.closed for c in created)
+
+
+def test_provide_thread():
+    created = []
+    graph = Graph()
+    graph.provide("db", lambda: Connection(created), scope="thread")
+
+    @graph.register(inputs=["db", "a"], outputs=["b"])
+    def f_b(db, a):
+        return (id(db), os.getpid(), a + 1)
+
+    @graph.register(inputs=["db", "b"], outputs=["c"])
+    def f_c(db, b):
+        return (id(db), os.getpid(), b[2] * 2)
+
+    results = []
+
+    def run(a):
+        results.append(graph.calculate({"a": a})[0])
+
+    threads = [threading.Thread(target=run, args=(a,)) for a in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(created) == 2
+    graph.close()
+    assert all(c.closed for c in created)
+
+
+def test_provide_parallel():
+    graph = Graph(parallel=True)
+    graph.provide("db", lambda: Connection([]), scope="process")
+
+    @graph.register(inputs=["db", "a"], outputs=["b"])
+    def f_b(db, a):
+        return (id(db), os.getpid(), a + 1)
+
+    @graph.register(inputs=["db", "b"], outputs=["c"])
+    def f_c(db, b):
+        return (id(db), os.getpid(), b[2] * 2)
+
+    for a in range(3):
+        res = graph.calculate({"a": a})
+        assert res[2] == (a + 1) * 2
+    assert graph.data["b"][1] != os.getpid()
+    graph.close()
+
+
+def test_provide_process_lifetime(tmp_path):
+    from pyungo.scheduler import Scheduler
+
+    def connect():
+        import os
+        import uuid
+
+        open(os.path.join(str(tmp_path), uuid.uuid4().hex), "w").close()
+        return object()
+
+    def created():
+        return len([p for p in tmp_path.iterdir() if p.is_file()])
+
+    def calculate_twice(graph):
+        graph.provide("db", connect)
+
+        @graph.register(inputs=["db", "a"], outputs=["b"])
+        def f_b(db, a):
+            return a + 1
+
+        graph.calculate({"a": 1})
+        graph.calculate({"a": 2})
+        graph.close()
+
+    calculate_twice(Graph())
+    assert created() == 1
+    # the workers of the pool opened for each calculation exit at its end
+    calculate_twice(Graph(parallel=True, pool_size=1))
+    assert created() == 3
+    # the pool of a scheduler stays open
+    scheduler = Scheduler(processes=1)
+    calculate_twice(Graph(scheduler=scheduler))
+    scheduler.close()
+    assert created() == 4
+
+
+def test_provide_errors():
+    graph = Graph()
+    graph.provide("db", dict)
+    graph.add_node(lambda db, a: a, inputs=["db", "a"], outputs=["c"])
+    with pytest.raises(PyungoError) as err:
+        graph.provide("x", dict, scope="request")
+    assert "scope should be one of" in str(err.value)
+    with pytest.raises(PyungoError) as err:
+        graph.provide("c", dict)
+    assert "c is already fixed or calculated in the model" in str(err.value)
+    with pytest.raises(PyungoError) as err:
+        graph.calculate({"a": 1, "db": None})
+    assert "The following inputs are fixed in the model" in str(err.value)
@@ -0,0 +1,75 @@
+import time
+
+import pytest
+
+from pyungo.core import Graph, PyungoError
+from pyungo.recording import Recorder, replay, snapshots
+
+
+def test_record_replay(tmp_path):
+    np = pytest.importorskip("numpy")
+    delay = [0.05]
+    graph = Graph(recorder=Recorder(str(tmp_path), max_snapshots=2))
+
+    @graph.register(inputs=["a", "b"], outputs=["c"])
+    def f_sum(a, b):
+        time.sleep(delay[0])
+        return a + b
+
+    @graph.register(inputs=["c"], outputs=["d"])
+    def f_double(c):
+        return c * 2
+
+    for i in range(3):
+        graph.calculate({"a": np.arange(3) + i, "b": 1})
+    found = snapshots(str(tmp_path))
+    assert len(found) == 2
+    assert found[0].duration >= 0.05
+    assert found[0].created <= found[1].created
+    assert set(found[0].nodes) == {"f_sum", "f_double"}
+    inputs = found[1].inputs()
+    assert inputs["a"].tolist() == [2, 3, 4]
+    assert inputs["b"] == 1
+
+    delay[0] = 0
+    replays = replay(graph, str(tmp_path))
+    assert len(snapshots(str(tmp_path))) == 2
+    assert replays[0].ratio < 0.5
+    assert replays[0].memory_profile is not None
+    assert [n[0] for n in replays[0].differences()] == ["f_sum"]
+    assert replays[1].trace.events
+
+
+def test_record_sample(tmp_path):
+    graph = Graph(recorder=Recorder(str(tmp_path), sample=0.5, seed=1))
+    graph.add_node(lambda a, b: a + b, inputs=["a", "b"], outputs=["c"])
+    for i in range(20):
+        graph.calculate({"a": i, "b": 1})
+    assert 0 < len(snapshots(str(tmp_path))) < 20
+
+    graph = Graph(recorder=Recorder(str(tmp_path / "slow"), min_duration=1))
+    graph.add_node(lambda a, b: a + b, inputs=["a", "b"], outputs=["c"])
+    graph.calculate({"a": 1, "b": 1})
+    assert snapshots(str(tmp_path / "slow")) == []
+
+
+def test_record_error(tmp_path):
+    graph = Graph(recorder=Recorder(str(tmp_path)))
+
+    @graph.register(inputs=["a", "b"], outputs=["c"])
+    def f_sum(a, b):
+        return a + b
+
+    @graph.register(inputs=["c"], outputs=["d"])
+    def f_double(c):
+        return c * 2
+
+    assert graph.calculate({"a": [lambda: 1], "b": []}) == [graph.data["a"][0]] * 2
+    assert snapshots(str(tmp_path)) == []
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_recorder_max_snapshots(tmp_path):
+    with pytest.raises(PyungoError) as err:
+        Recorder(str(tmp_path), max_snapshots=0)
+    assert "max_snapshots should be a strictly positive integer" in str(err.value)
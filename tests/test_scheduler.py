@@ -0,0 +1,227 @@
+import collections
+import threading
+
+import pytest
+
+from pyungo.core import Graph
+from pyungo.errors import NodeError
+from pyungo.scheduler import Scheduler, _Task
+
+
+def test_scheduler_shared_by_graphs():
+    scheduler = Scheduler(processes=2, max_concurrency=1)
+    graphs = []
+    for name in ["ui", "batch"]:
+        graph = Graph(scheduler=scheduler, tenant=name)
+
+        @graph.register(inputs=["a"], outputs=["b"])
+        def f_slow(a):
+            import time
+
+            start = time.time()
+            time.sleep(0.05)
+            return start, time.time()
+
+        @graph.register(inputs=["a"], outputs=["c"])
+        def f_slow2(a):
+            import time
+
+            start = time.time()
+            time.sleep(0.05)
+            return start, time.time()
+
+        @graph.register(inputs=["b", "c"], outputs=["d"])
+        def f_sink(b, c):
+            return [b, c]
+
+        graphs.append(graph)
+    results = []
+
+    def calculate(graph):
+        results.append(graph.calculate(data={"a": 1}))
+
+    threads = [threading.Thread(target=calculate, args=(g,)) for g in graphs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    scheduler.close()
+
+    # never more than one node running at a time
+    intervals = sorted(i for res in results for i in res)
+    assert len(intervals) == 4
+    for (_, end), (start, _) in zip(intervals, intervals[1:]):
+        assert start >= end - 1e-3
+    metrics = scheduler.metrics
+    assert metrics["completed"] == 6
+    assert metrics["queued"]["total"] == 0
+    assert metrics["running"] == 0
+    assert set(metrics["usage"]) == {"ui", "batch"}
+    assert metrics["wait"]["by_tenant"]["ui"]["count"] == 3
+
+
+def _task(priority, tenant):
+    return _Task(None, None, None, None, priority=priority, tenant=tenant)
+
+
+def test_scheduler_admission_order():
+    scheduler = Scheduler(processes=1)
+    urgent = _task(10, "ui")
+    for task in [_task(0, "batch"), _task(0, "batch"), _task(0, "other"), urgent]:
+        queue = scheduler._queues.setdefault(
+            (task.priority, task.tenant), collections.deque()
+        )
+        queue.append(task)
+    scheduler._usage["batch"] = 1.0
+
+    assert scheduler._next_task() is urgent
+    # the least served tenant goes first
+    assert scheduler._next_task().tenant == "other"
+    assert scheduler._next_task().tenant == "batch"
+    assert scheduler.metrics["queued"] == {
+        "total": 1,
+        "by_priority": {0: 1},
+        "by_tenant": {"batch": 1},
+    }
+
+
+def test_scheduler_node_error():
+    scheduler = Scheduler(processes=2)
+    graph = Graph(scheduler=scheduler)
+
+    @graph.register(inputs=["a"], outputs=["b"])
+    def f_fail(a):
+        raise ValueError("crash")
+
+    with pytest.raises(NodeError) as err:
+        graph.calculate(data={"a": 1})
+    assert isinstance(err.value.error, ValueError)
+
+    # the scheduler is still usable
+    graph2 = Graph(scheduler=scheduler)
+    graph2.add_node(lambda a: a + 1, inputs=["a"], outputs=["b"])
+    assert graph2.calculate(data={"a": 1}, priority=5) == 2
+    assert scheduler.metrics["wait"]["by_priority"][5]["count"] == 1
+    scheduler.close()
+
+
+def test_scheduler_resources():
+    scheduler = Scheduler(processes=2, resources={"memory": 100})
+    big, small = _task(0, "a"), _task(0, "a")
+    big.resources, small.resources = {"memory": 80}, {"memory": 10}
+    scheduler._queues[(0, "a")] = collections.deque([big, small])
+    scheduler._in_use["memory"] = 30
+
+    # the next task does not fit: nothing starts before it
+    assert scheduler._next_task() is None
+    scheduler._in_use["memory"] = 0
+    assert scheduler._next_task() is big
+    assert scheduler.metrics["resources"]["memory"] == {"capacity": 100, "in_use": 0}
+
+
+def test_scheduler_node_error_cancelled():
+    scheduler = Scheduler(processes=1)
+    # the graph submits all its nodes, the scheduler runs one at a time
+    graph = Graph(scheduler=scheduler, resources={"cpus": 5})
+
+    @graph.register(inputs=["a"], outputs=["b"], cost=10)
+    def f_fail(a):
+        import time
+
+        time.sleep(0.1)
+        raise ValueError("crash")
+
+    for name in ["c", "d", "e"]:
+        graph.add_node(lambda a: a, inputs=["a"], outputs=[name])
+
+    with pytest.raises(NodeError) as err:
+        graph.calculate(data={"a": 1})
+    scheduler.close()
+
+    ids = {n.fct_name: i for i, n in graph._nodes.items()}
+    assert err.value.node_id == ids["f_fail"]
+    # the nodes waiting in the scheduler queue are cancelled
+    others = sorted(set(graph._nodes) - {ids["f_fail"]})
+    assert err.value.cancelled
+    assert sorted(err.value.completed + err.value.cancelled) == others
+    assert err.value.not_started == []
+
+
+def test_scheduler_ships_nodes_to_each_worker():
+    scheduler = Scheduler(processes=2)
+    unknown = []
+    fail = scheduler._fail
+
+    def record(task, error):
+        unknown.append(error)
+        fail(task, error)
+
+    scheduler._fail = record
+    graph = Graph(scheduler=scheduler)
+    for name in ["b", "c", "d", "e"]:
+        graph.add_node(lambda a: a, inputs=["a"], outputs=[name])
+    for _ in range(5):
+        graph.calculate(data={"a": 1})
+    pids = set.union(*scheduler._shipped.values())
+    scheduler.close()
+
+    # no task needed a second round trip to send its node
+    assert unknown == []
+    assert 1 <= len(pids) <= 2
+
+
+def test_scheduler_node_ids_collide():
+    import dill
+
+    scheduler = Scheduler(processes=1)
+    graph = Graph(scheduler=scheduler)
+    graph.add_node(lambda a: a + 100, inputs=["a"], outputs=["b"])
+    # the nodes of an unpickled graph keep the ids of the process they come from
+    other = dill.loads(dill.dumps(graph))
+    other._scheduler = scheduler
+    (node,) = other._nodes.values()
+    node._fct = lambda a: -a
+    assert node.id == next(iter(graph._nodes))
+    assert graph.calculate({"a": 1}) == 101
+    assert other.calculate({"a": 1}) == -1
+    assert graph.calculate({"a": 2}) == 102
+    scheduler.close()
+
+
+def test_worker_nodes_evicted(monkeypatch):
+    from pyungo import execution
+
+    monkeypatch.setattr(execution, "MAX_SHIPPED_NODES", 2)
+    monkeypatch.setattr(execution, "_SHIPPED", collections.OrderedDict())
+    for node_id in [1, 2, 3]:
+        execution._register_shipped(("g", node_id), "node {}".format(node_id))
+    assert execution._registered(("g", 1)) is None
+    assert execution._registered(("g", 2)) == "node 2"
+    execution._register_shipped(("g", 4), "node 4")
+    # the least recently used node is evicted
+    assert list(execution._SHIPPED) == [("g", 2), ("g", 4)]
+
+
+def test_scheduler_error_dispatch():
+    scheduler = Scheduler(processes=1)
+    graph = Graph(scheduler=scheduler, resources={"cpus": 5})
+
+    @graph.register(inputs=["a"], outputs=["b"], cost=10)
+    def f_fail(a):
+        raise ValueError("crash")
+
+    for name in ["c", "d", "e"]:
+        graph.add_node(lambda a: a, inputs=["a"], outputs=[name])
+
+    with pytest.raises(NodeError) as err:
+        graph.calculate(data={"a": 1})
+    metrics = scheduler.metrics
+    scheduler.close()
+
+    # the failure is only handled by the graph once received, tasks started
+    # meanwhile are waited for, the other ones are cancelled
+    assert metrics["queued"]["total"] == 0
+    assert metrics["running"] == 0
+    cancelled = len(err.value.cancelled)
+    assert metrics["completed"] == 1 + len(err.value.completed)
+    assert metrics["submitted"] == metrics["completed"] + cancelled
@@ -0,0 +1,136 @@
+import socket
+import threading
+
+import pytest
+
+from pyungo.client import Client
+from pyungo.core import Graph, PyungoError
+from pyungo.protocol import receive, send
+from pyungo.server import GraphServer
+
+
+def test_protocol():
+    np = pytest.importorskip("numpy")
+    pd = pytest.importorskip("pandas")
+    index = pd.date_range("2020-01-01", periods=3, freq="h", tz="Europe/Paris")
+    message = {
+        "array": np.arange(6, dtype="float32").reshape(2, 3),
+        "empty": np.zeros(0),
+        "series": pd.Series([1.0, 2.0, 3.0], index=index, name="ghi"),
+        "frame": pd.DataFrame({"a": [1, 2], "b": [0.5, 1.5]}),
+        "scalar": np.float64(1.5),
+        "list": (1, "x", None),
+        "keys": {1: "one"},
+    }
+    left, right = socket.socketpair()
+    send(left, message)
+    received = receive(right)
+    left.close()
+    right.close()
+    assert received["array"].dtype == np.float32
+    assert received["array"].tolist() == [[0, 1, 2], [3, 4, 5]]
+    received["array"][0, 0] = 10
+    assert received["empty"].shape == (0,)
+    pd.testing.assert_series_equal(
+        received["series"], message["series"], check_freq=False
+    )
+    pd.testing.assert_frame_equal(received["frame"], message["frame"])
+    assert received["scalar"] == 1.5
+    assert received["list"] == [1, "x", None]
+    assert received["keys"] == {"1": "one"}
+
+
+def test_server():
+    np = pytest.importorskip("numpy")
+    graph = Graph()
+
+    @graph.register(inputs=["a", "b"], outputs=["c"])
+    def f_sum(a, b):
+        return a + b
+
+    @graph.register(inputs=["c"], outputs=["d"])
+    def f_double(c):
+        return c * 2
+
+    server = GraphServer({"sum": graph}, warmup={"sum": {"a": 1, "b": 2}})
+    with server, Client(server.address) as client:
+        res = client.calculate("sum", {"a": np.arange(3), "b": 1})
+        assert res.tolist() == [2, 4, 6]
+        outputs = client.calculate("sum", {"a": 1, "b": 2}, outputs=["c", "d"])
+        assert outputs == {"c": 3, "d": 6}
+        with pytest.raises(PyungoError) as err:
+            client.calculate("sum", {"a": 1})
+        assert "The following inputs are needed" in str(err.value)
+        with pytest.raises(PyungoError) as err:
+            client.calculate("unknown", {})
+        assert "Unknown graph 'unknown'" in str(err.value)
+        assert client.health()["graphs"] == ["sum"]
+
+        results = []
+
+        def run(a):
+            with Client(server.address) as other:
+                results.append(other.calculate("sum", {"a": a, "b": 0}))
+
+        threads = [threading.Thread(target=run, args=(a,)) for a in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sorted(results) == [0, 2, 4, 6]
+        metrics = client.metrics()["graphs"]["sum"]
+        assert metrics["requests"] == 7
+        assert metrics["errors"] == 1
+
+
+def test_server_unix(tmp_path):
+    graph = Graph()
+    graph.add_node(lambda a, b: (a + b) * 2, inputs=["a", "b"], outputs=["d"])
+    path = str(tmp_path / "pyungo.sock")
+    with GraphServer({"sum": graph}, address=path), Client(path) as client:
+        assert client.calculate("sum", {"a": 1, "b": 2}) == 6
+
+    path = str(tmp_path / "data.txt")
+    with open(path, "w") as f:
+        f.write("keep me")
+    with pytest.raises(PyungoError) as err:
+        GraphServer({"sum": graph}, address=path)
+    assert "exists and is not a socket" in str(err.value)
+    with open(path) as f:
+        assert f.read() == "keep me"
+
+
+def test_server_encoding_error():
+    graph = Graph()
+
+    @graph.register(inputs=["a"], outputs=["b"])
+    def f_object(a):
+        return object()
+
+    with GraphServer({"obj": graph}) as server, Client(server.address) as client:
+        with pytest.raises(PyungoError) as err:
+            client.calculate("obj", {"a": 1})
+        assert "TypeError" in str(err.value)
+        metrics = client.metrics()["graphs"]["obj"]
+        assert metrics["requests"] == 1
+        assert metrics["errors"] == 1
+
+
+def test_server_parallel():
+    graph = Graph(parallel=True)
+
+    @graph.register(inputs=["a", "b"], outputs=["c"])
+    def f_sum(a, b):
+        return a + b
+
+    @graph.register(inputs=["c"], outputs=["d"])
+    def f_double(c):
+        return c * 2
+
+    with GraphServer({"sum": graph}, processes=2) as server:
+        with Client(server.address) as client:
+            assert client.calculate("sum", {"a": 1, "b": 2}) == 6
+            assert client.metrics()["schedulers"][0]["completed"] == 2
+    # the graph does not keep the closed scheduler of the server
+    assert graph._scheduler is None
+    assert graph.calculate({"a": 1, "b": 2}) == 6
@@ -0,0 +1,90 @@
+import os
+
+import pytest
+
+from pyungo.core import Graph
+from pyungo.spill import Spilled, dump
+
+np = pytest.importorskip("numpy")
+
+
+def test_dump_and_load(tmp_path):
+    array = np.arange(10.0)
+    spilled = dump(array, str(tmp_path / "a.npy"))
+    assert isinstance(spilled, Spilled)
+    loaded = spilled.load()
+    assert isinstance(loaded, np.memmap)
+    assert (loaded == array).all()
+    assert dump([1, 2], str(tmp_path / "b.npy")) is None
+    assert dump(np.array(["a", None], dtype=object), str(tmp_path / "c.npy")) is None
+
+
+def test_dump_pandas(tmp_path):
+    pd = pytest.importorskip("pandas")
+    series = pd.Series([1.0, 2.0], index=["a", "b"], name="x")
+    loaded = dump(series, str(tmp_path / "a.npy")).load()
+    pd.testing.assert_series_equal(loaded, series)
+    df = pd.DataFrame({"a": [1.0, 2.0], "b": [3.0, 4.0]})
+    loaded = dump(df, str(tmp_path / "b.npy")).load()
+    pd.testing.assert_frame_equal(loaded, df)
+    mixed = pd.DataFrame({"a": [1.0], "b": ["x"]})
+    assert dump(mixed, str(tmp_path / "c.npy")) is None
+    dates = pd.Series(pd.date_range("2020-01-01", periods=3, tz="UTC"))
+    assert dump(dates, str(tmp_path / "d.npy")) is None
+    assert dump(dates.to_frame(), str(tmp_path / "e.npy")) is None
+    assert sorted(os.listdir(str(tmp_path))) == ["a.npy", "b.npy"]
+
+
+def test_memory_budget_not_spillable(tmp_path):
+    pd = pytest.importorskip("pandas")
+    graph = Graph(memory_budget=1, scratch_dir=str(tmp_path))
+
+    @graph.register(inputs=["n"], outputs=["a"])
+    def f_a(n):
+        return pd.Series(pd.date_range("2020-01-01", periods=n, tz="UTC"))
+
+    @graph.register(inputs=["a"], outputs=["b"])
+    def f_b(a):
+        return a.dt.day
+
+    @graph.register(inputs=["a", "b"], outputs=["c"])
+    def f_c(a, b):
+        return int(b.sum()) + len(a)
+
+    assert graph.calculate(data={"n": 3}) == 9
+    # kept in memory
+    assert graph.data["a"].dt.tz is not None
+
+
+def test_memory_budget(tmp_path):
+    graph = Graph(memory_budget=10 ** 5, scratch_dir=str(tmp_path))
+    spilled = []
+
+    @graph.register(inputs=["n"], outputs=["a"])
+    def f_a(n):
+        return np.ones(n)
+
+    @graph.register(inputs=["a"], outputs=["b"])
+    def f_b(a):
+        return a * 2
+
+    @graph.register(inputs=["b"], outputs=["c"])
+    def f_c(b):
+        (scratch,) = os.listdir(str(tmp_path))
+        spilled.extend(os.listdir(str(tmp_path / scratch)))
+        return b * 3
+
+    @graph.register(inputs=["a", "c"], outputs=["d"])
+    def f_d(a, c):
+        return float((a + c).sum())
+
+    res = graph.calculate(data={"n": 10 ** 5}, profile_memory=True)
+
+    assert res == 7 * 10 ** 5
+    assert sorted(spilled) == ["0.npy", "1.npy"]
+    # scratch directory removed, spilled values still readable
+    assert os.listdir(str(tmp_path)) == []
+    assert isinstance(graph.data["a"], np.memmap)
+    assert graph.data["c"][0] == 6
+    profile = graph.memory_profile
+    assert profile.live < profile.peak_live
@@ -0,0 +1,58 @@
+import json
+
+from pyungo.core import Graph
+from pyungo.tracing import Trace
+
+
+def test_trace_sequential(tmp_path):
+    graph = Graph()
+    trace = Trace()
+
+    @graph.register(inputs=["a", "b"], outputs=["c"])
+    def f_my_function(a, b):
+        return a + b
+
+    @graph.register(inputs=["c"], outputs=["d"])
+    def f_my_function2(c):
+        return c / 10.0
+
+    graph.calculate(data={"a": 2, "b": 3}, trace=trace)
+
+    events = [e for e in trace.events if e["cat"] == "node"]
+    assert [e["name"] for e in events] == ["f_my_function", "f_my_function2"]
+    assert events[0]["ts"] + events[0]["dur"] <= events[1]["ts"]
+    assert events[1]["args"]["waiting_for_inputs"] > 0
+    assert [e["name"] for e in trace.events if e["cat"] == "graph"] == ["calculate"]
+
+    path = str(tmp_path / "trace.json")
+    trace.save(path)
+    with open(path) as f:
+        doc = json.load(f)
+    assert doc["traceEvents"][0]["ph"] == "M"
+    assert len(doc["traceEvents"]) == 4
+
+
+def test_trace_parallel():
+    graph = Graph(parallel=True)
+    trace = Trace()
+
+    @graph.register(inputs=["a", "b"], outputs=["c"])
+    def f_my_function(a, b):
+        return a + b
+
+    @graph.register(inputs=["c"], outputs=["d"])
+    def f_my_function2(c):
+        return c / 10.0
+
+    graph.calculate(data={"a": 2, "b": 3}, trace=trace)
+
+    nodes = [e for e in trace.events if e["cat"] == "node"]
+    assert len(nodes) == 2
+    assert all(e["pid"] != trace._pid for e in nodes)
+    assert all(e["args"]["serialization"] > 0 for e in nodes)
+    steps = [e["name"] for e in trace.events if e["cat"] == "serialization"]
+    assert len(steps) == 6
+    doc = trace.to_dict()
+    names = [e["args"]["name"] for e in doc["traceEvents"] if e["ph"] == "M"]
+    assert names[0] == "pyungo (main)"
+    assert len(names) > 1